@@ -0,0 +1,51 @@
+-- Structure de base pour le moteur SQLite (équivalent de Tables_Mysql.sql)
+-- Créée automatiquement par `python migrate.py` sur une base vide, puis complétée par les migrations
+
+-- SQLite nomme les colonnes d'un résultat comme dans le schéma : casse des noms lus par l'application
+CREATE TABLE Utilisateurs (
+    ID_utilisateur INTEGER PRIMARY KEY AUTOINCREMENT,
+    nom VARCHAR(50),
+    prenom VARCHAR(50),
+    nom_utilisateur VARCHAR(50),
+    password VARCHAR(255),
+    role TEXT CHECK (role IN ('Etudiant', 'Admin')),
+    mail TEXT
+);
+
+
+CREATE TABLE Livres (
+    ID_livre INTEGER PRIMARY KEY AUTOINCREMENT,
+    Titre VARCHAR(100),
+    Auteur VARCHAR(100),
+    Annee_publication INT,
+    Genre VARCHAR(50),
+    Quantite_disponible INT,
+    Autres_informations TEXT
+);
+
+
+CREATE TABLE Etudiants (
+    ID_etudiant INTEGER PRIMARY KEY AUTOINCREMENT,
+    Nom VARCHAR(50),
+    Prenom VARCHAR(50),
+    Autres_informations TEXT
+);
+
+
+CREATE TABLE Administrateurs (
+    ID_admin INTEGER PRIMARY KEY AUTOINCREMENT,
+    Nom VARCHAR(50),
+    Prenom VARCHAR(50),
+    Autres_informations TEXT
+);
+
+CREATE TABLE Locations (
+    ID_location INTEGER PRIMARY KEY AUTOINCREMENT,
+    ID_livre INT,
+    ID_etudiant INT,
+    Date_location DATE,
+    Date_retour_prevue DATE,
+    Statut VARCHAR(50),
+    FOREIGN KEY (ID_livre) REFERENCES Livres(ID_livre),
+    FOREIGN KEY (ID_etudiant) REFERENCES Etudiants(ID_etudiant)
+);
@@ -0,0 +1,441 @@
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import database
+import export
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Désactivé (0) : les rapports interrogent directement la base transactionnelle
+ENABLED = os.environ.get('BIBLIO_ANALYTICS', '1') == '1'
+# Dossier des instantanés Parquet
+ANALYTICS_DIR = os.environ.get('BIBLIO_ANALYTICS_DIR',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analytics'))
+# Intervalle (secondes) de prise en compte des nouvelles locations et des retours
+SYNC_INTERVAL = float(os.environ.get('BIBLIO_ANALYTICS_SYNC_INTERVAL', 300))
+# Intervalle (secondes) de copie complète des tables
+REBUILD_INTERVAL = float(os.environ.get('BIBLIO_ANALYTICS_REBUILD_INTERVAL', 86400))
+# Intervalle (secondes) entre deux vérifications du thread de mise à jour
+CHECK_INTERVAL = 60
+
+# Au-delà, les fichiers incrémentaux des locations sont fusionnés en un seul
+MAX_PARTS = 50
+# Au-delà, relire les locations en cours une à une coûte plus qu'une copie complète
+MAX_OPEN_REFETCH = 20000
+
+# Colonnes copiées (ni mots de passe ni adresses mail dans les instantanés)
+SNAPSHOT_QUERIES = {
+    'livres': "SELECT ID_livre, Titre, Auteur, Annee_publication, Genre, Quantite_disponible FROM livres",
+    'utilisateurs': "SELECT ID_utilisateur, nom, prenom, role FROM utilisateurs"
+}
+LOCATIONS_QUERY = """
+    SELECT ID_location, ID_livre, ID_etudiant, Date_location, Date_retour_prevue, Date_retour_effective, Statut
+    FROM locations
+"""
+
+# Vues DuckDB sur les fichiers ; les types sont fixés car un instantané SQLite peut les déduire autrement
+_VIEWS = {
+    'livres': """
+        SELECT CAST(ID_livre AS BIGINT) AS ID_livre, CAST(Titre AS VARCHAR) AS Titre,
+               CAST(Auteur AS VARCHAR) AS Auteur, CAST(Annee_publication AS BIGINT) AS Annee_publication,
+               CAST(Genre AS VARCHAR) AS Genre, CAST(Quantite_disponible AS BIGINT) AS Quantite_disponible
+        FROM read_parquet('{directory}/livres.parquet')
+    """,
+    'utilisateurs': """
+        SELECT CAST(ID_utilisateur AS BIGINT) AS ID_utilisateur, CAST(nom AS VARCHAR) AS nom,
+               CAST(prenom AS VARCHAR) AS prenom, CAST(role AS VARCHAR) AS role
+        FROM read_parquet('{directory}/utilisateurs.parquet')
+    """,
+    # Dernière version de chaque location : les fichiers plus récents remplacent les précédents
+    'locations': """
+        SELECT CAST(ID_location AS BIGINT) AS ID_location, CAST(ID_livre AS BIGINT) AS ID_livre,
+               CAST(ID_etudiant AS BIGINT) AS ID_etudiant, CAST(Date_location AS DATE) AS Date_location,
+               CAST(Date_retour_prevue AS DATE) AS Date_retour_prevue,
+               CAST(Date_retour_effective AS DATE) AS Date_retour_effective, CAST(Statut AS VARCHAR) AS Statut
+        FROM read_parquet('{directory}/locations/part-*.parquet', filename = true, union_by_name = true)
+        QUALIFY row_number() OVER (PARTITION BY ID_location ORDER BY filename DESC) = 1
+    """
+}
+
+
+# ================================= RAPPORTS ==========================================
+# Équivalents DuckDB des requêtes de queries.py servies par les instantanés
+
+REPORTS = {
+    'kpis': """
+        SELECT
+            (SELECT COUNT(*) FROM livres) as total_books,
+            (SELECT CAST(COALESCE(SUM(Quantite_disponible), 0) AS BIGINT) FROM livres) as total_copies,
+            (SELECT COUNT(*) FROM utilisateurs) as total_users,
+            COUNT(*) as total_rentals,
+            COUNT(*) FILTER (WHERE Statut NOT IN ('Retourné', 'Annulé')) as active_rentals,
+            COUNT(*) FILTER (WHERE Statut NOT IN ('Retourné', 'Annulé') AND Date_retour_prevue < current_date)
+                as overdue_rentals
+        FROM locations
+    """,
+    'monthly_loans': """
+        SELECT strftime(Date_location, '%Y-%m') as mois, COUNT(*) as locations
+        FROM locations
+        WHERE Date_location IS NOT NULL
+        GROUP BY mois
+        ORDER BY mois
+    """,
+    'top_authors': """
+        SELECT l.Auteur, COUNT(*) as locations
+        FROM locations loc
+        JOIN livres l ON loc.ID_livre = l.ID_livre
+        WHERE COALESCE(l.Auteur, '') <> ''
+        GROUP BY l.Auteur
+        ORDER BY locations DESC
+        LIMIT 5
+    """,
+    'overdue_loans': """
+        SELECT u.nom, u.prenom, l.Titre, loc.Date_retour_prevue,
+               date_diff('day', loc.Date_retour_prevue, current_date) as jours_retard
+        FROM locations loc
+        JOIN livres l ON loc.ID_livre = l.ID_livre
+        JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+        WHERE loc.Date_retour_prevue < current_date
+        AND loc.Statut NOT IN ('Retourné', 'Annulé')
+        ORDER BY jours_retard DESC
+    """,
+    'users_by_role': "SELECT role, COUNT(*) as count FROM utilisateurs GROUP BY role",
+    'most_active_students': """
+        SELECT u.nom, u.prenom, u.role, COUNT(l.ID_location) as rental_count
+        FROM utilisateurs u
+        LEFT JOIN locations l ON u.ID_utilisateur = l.ID_etudiant
+        WHERE u.role = 'Etudiant'
+        GROUP BY u.ID_utilisateur, u.nom, u.prenom, u.role
+        ORDER BY rental_count DESC
+        LIMIT 10
+    """
+}
+
+
+class SnapshotUnavailableError(Exception):
+    """Aucun instantané encore disponible (première copie en cours)"""
+
+
+def available():
+    """Vrai si le moteur analytique est activé et DuckDB installé"""
+    return ENABLED and importlib.util.find_spec('duckdb') is not None
+
+
+@contextlib.contextmanager
+def _file_lock(path, blocking=True):
+    """Verrou exclusif entre processus sur le fichier `path` ; cède False si `blocking` est faux et le verrou pris"""
+    with open(path, 'a+b') as f:
+        try:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# ================================= INSTANTANÉS ==========================================
+
+class AnalyticsStore:
+    """Instantanés Parquet de livres, utilisateurs et locations, interrogés avec DuckDB
+
+    Les locations sont copiées par incréments : les nouvelles (identifiant supérieur au dernier copié)
+    et celles qui étaient en cours lors de l'instantané précédent (retours, annulations), relues par
+    clé primaire. Chaque incrément est un fichier ; la vue ne garde que la version la plus récente.
+    Les copies se font hors des pages (thread de `start`, ou `python analytics.py refresh`), sous un
+    verrou de fichier partagé par tous les processus qui écrivent dans le dossier.
+    """
+
+    def __init__(self, directory=ANALYTICS_DIR):
+        self.directory = directory
+        self._refresh_lock = threading.Lock()
+        self._connection_lock = threading.Lock()
+        self._connection = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._sync_requested = False
+        self.last_error = None  # échec de la dernière mise à jour en arrière-plan
+
+    @property
+    def _state_path(self):
+        return os.path.join(self.directory, 'state.json')
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.directory, '.lock')
+
+    @contextlib.contextmanager
+    def _locked(self, blocking=True):
+        os.makedirs(self.directory, exist_ok=True)
+        with _file_lock(self._lock_path, blocking) as acquired:
+            yield acquired
+
+    @property
+    def _parts_dir(self):
+        return os.path.join(self.directory, 'locations')
+
+    def state(self):
+        """État du dernier instantané ({} si aucun) ; relu à chaque appel car un autre processus peut l'écrire"""
+        try:
+            with open(self._state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        tmp = self._state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp, self._state_path)
+
+    def refreshed_at(self):
+        """Date des données servies (début du dernier instantané), None si aucun"""
+        synced_at = self.state().get('synced_at')
+        return datetime.fromtimestamp(synced_at) if synced_at else None
+
+    # --------------------------------- Écriture ---------------------------------
+
+    def _write(self, query, params, path):
+        """Écrit le résultat d'une requête dans `path` (remplacement atomique) ; retourne le nombre de lignes"""
+        tmp = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+        count = export.export_to_file(query, params, tmp, 'parquet')
+        os.replace(tmp, path)
+        return count
+
+    def _part_path(self, seq):
+        return os.path.join(self._parts_dir, f"part-{seq:06d}.parquet")
+
+    def _parts(self):
+        return sorted(name for name in os.listdir(self._parts_dir)
+                      if name.startswith('part-') and name.endswith('.parquet'))
+
+    def _remove_parts_before(self, seq):
+        for name in self._parts():
+            if name < os.path.basename(self._part_path(seq)):
+                os.remove(os.path.join(self._parts_dir, name))
+
+    def _copy_dimensions(self):
+        # Petites tables modifiées sur place (stock, fiches) : copiées en entier à chaque fois
+        for table, query in SNAPSHOT_QUERIES.items():
+            self._write(query, (), os.path.join(self.directory, f"{table}.parquet"))
+
+    def rebuild(self):
+        """Copie complète des trois tables (attend la fin d'une copie d'un autre processus)"""
+        with self._locked():
+            self._rebuild()
+
+    def sync(self):
+        """Copie incrémentale (attend la fin d'une copie d'un autre processus)"""
+        with self._locked():
+            self._sync()
+
+    def _rebuild(self):
+        os.makedirs(self._parts_dir, exist_ok=True)
+        state = self.state()
+        started = time.time()
+        seq = state.get('seq', 0) + 1
+        # Relevé avant la copie : une location créée pendant la copie sera relue au prochain incrément
+        max_id = _max_location_id()
+
+        self._copy_dimensions()
+        self._write(LOCATIONS_QUERY, (), self._part_path(seq))
+        # Le fichier complet a le plus grand numéro : les lecteurs en cours restent cohérents
+        self._remove_parts_before(seq)
+        self._save_state({'seq': seq, 'max_id': max_id, 'built_at': started, 'synced_at': started})
+
+    def _sync(self):
+        """Copie incrémentale : nouvelles locations et locations en cours lors du dernier instantané"""
+        state = self.state()
+        if not state:
+            return self._rebuild()
+        open_ids = self._fetch("SELECT ID_location FROM locations WHERE Statut NOT IN ('Retourné', 'Annulé')")
+        open_ids = open_ids.column('ID_location').to_pylist()
+        if len(open_ids) > MAX_OPEN_REFETCH:
+            return self._rebuild()
+
+        started = time.time()
+        seq = state['seq'] + 1
+        max_id = _max_location_id()
+
+        query = LOCATIONS_QUERY + " WHERE ID_location > %s"
+        if open_ids:
+            query += f" OR ID_location IN ({', '.join(['%s'] * len(open_ids))})"
+        self._copy_dimensions()
+        if self._write(query, [state['max_id']] + open_ids, self._part_path(seq)) == 0:
+            os.remove(self._part_path(seq))
+        elif len(self._parts()) > MAX_PARTS:
+            self._compact(seq + 1)
+            seq += 1
+        self._save_state(dict(state, seq=seq, max_id=max(max_id, state['max_id']), synced_at=started))
+
+    def _compact(self, seq):
+        """Fusionne les incréments en un fichier (sans relire la base transactionnelle)"""
+        tmp = os.path.join(self._parts_dir, f".part-{seq:06d}.parquet.tmp")
+        cursor = self._cursor()
+        try:
+            cursor.execute(f"COPY (SELECT * FROM locations) TO '{tmp}' (FORMAT parquet)")
+        finally:
+            cursor.close()
+        os.replace(tmp, self._part_path(seq))
+        self._remove_parts_before(seq)
+
+    def refresh(self, force=False, sync=False):
+        """Met à jour les instantanés trop anciens (complet chaque REBUILD_INTERVAL, sinon incrémental)
+
+        Sans attente : si un autre thread ou processus copie déjà, ne fait rien. `sync` force
+        une copie incrémentale, `force` une copie complète.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            with self._locked(blocking=False) as acquired:
+                if not acquired:
+                    return
+                # Relu sous le verrou : un autre processus vient peut-être de copier
+                state = self.state()
+                now = time.time()
+                if force or not state or now - state['built_at'] > REBUILD_INTERVAL:
+                    self._rebuild()
+                elif sync or now - state['synced_at'] > SYNC_INTERVAL:
+                    self._sync()
+        finally:
+            self._refresh_lock.release()
+
+    # --------------------------------- Arrière-plan ---------------------------------
+
+    def start(self):
+        """Lance le thread de mise à jour périodique des instantanés (une fois par processus)"""
+        with self._connection_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='biblio-analytics', daemon=True)
+        self._thread.start()
+
+    def request_sync(self):
+        """Demande une copie incrémentale immédiate au thread de mise à jour"""
+        self._sync_requested = True
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            sync, self._sync_requested = self._sync_requested, False
+            try:
+                self.refresh(sync=sync)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+            self._wake.wait(timeout=CHECK_INTERVAL)
+            self._wake.clear()
+
+    # --------------------------------- Lecture ---------------------------------
+
+    def _cursor(self):
+        """Curseur DuckDB propre au thread, sur une base en mémoire dont les vues lisent les fichiers"""
+        import duckdb
+
+        with self._connection_lock:
+            if self._connection is None:
+                connection = duckdb.connect()
+                directory = self.directory.replace('\\', '/').replace("'", "''")
+                for view, select in _VIEWS.items():
+                    connection.execute(f"CREATE VIEW {view} AS {select.format(directory=directory)}")
+                self._connection = connection
+            return self._connection.cursor()
+
+    def _fetch(self, query):
+        cursor = self._cursor()
+        try:
+            return cursor.execute(query).to_arrow_table()
+        finally:
+            cursor.close()
+
+    def query_df(self, query):
+        """Exécute une requête DuckDB sur les instantanés et retourne un DataFrame typé"""
+        return database.arrow_to_pandas(self._fetch(query))
+
+    def run_report(self, name):
+        """Exécute un rapport de REPORTS sur l'instantané courant (mis à jour en arrière-plan)"""
+        if not self.state():
+            raise SnapshotUnavailableError("Instantanés analytiques en cours de création")
+        return self.query_df(REPORTS[name])
+
+
+def _max_location_id():
+    row = database.run_query("SELECT COALESCE(MAX(ID_location), 0) as max_id FROM locations", cache=False)
+    return int(row[0]['max_id'])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Instantanés partagés par le processus"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalyticsStore()
+    return _store
+
+
+# ================================= LIGNE DE COMMANDE ==========================================
+
+def main(argv):
+    """Point d'entrée : `python analytics.py refresh|status`"""
+    parser = argparse.ArgumentParser(description="Instantanés Parquet des rapports (DuckDB)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = subparsers.add_parser('refresh', help="Met à jour les instantanés")
+    refresh_parser.add_argument('--full', action='store_true', help="Copie complète des tables")
+    subparsers.add_parser('status', help="Affiche la date et la taille des instantanés")
+    args = parser.parse_args(argv[1:])
+
+    store = get_store()
+    if args.command == 'refresh':
+        if args.full or not store.state():
+            store.rebuild()
+        else:
+            store.sync()
+
+    state = store.state()
+    if not state:
+        print("Aucun instantané")
+        return 1
+    counts = store.query_df("SELECT (SELECT COUNT(*) FROM livres) as livres, "
+                            "(SELECT COUNT(*) FROM utilisateurs) as utilisateurs, "
+                            "(SELECT COUNT(*) FROM locations) as locations").iloc[0]
+    print(f"Instantané du {store.refreshed_at():%Y-%m-%d %H:%M:%S} "
+          f"(copie complète du {datetime.fromtimestamp(state['built_at']):%Y-%m-%d %H:%M:%S}, "
+          f"{len(store._parts())} fichier(s) de locations)")
+    for table, count in counts.items():
+        print(f"  {table}: {count} ligne(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
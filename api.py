@@ -0,0 +1,398 @@
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import circulation
+import database
+import instrumentation
+import search
+import sessions
+
+
+# ================================= CONFIGURATION ==========================================
+
+API_HOST = os.environ.get('BIBLIO_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('BIBLIO_API_PORT', 8600))
+# Durée de vie (secondes) des lectures en cache dans le processus de l'API ; courte, car les écritures
+# faites par l'application Streamlit n'invalident pas ce cache
+API_CACHE_TTL = float(os.environ.get('BIBLIO_API_CACHE_TTL', 5))
+# Durée d'emprunt par défaut (jours) et durée maximale acceptée
+LOAN_DAYS = 14
+MAX_LOAN_DAYS = 90
+SEARCH_LIMIT = 20
+MAX_BODY_SIZE = 64 * 1024
+# Plus grand identifiant accepté (entier signé 64 bits) : au-delà, le pilote SQLite lève OverflowError
+MAX_ID = 2 ** 63 - 1
+
+BOOK_COLUMNS = "ID_livre, Titre, Auteur, Genre, Quantite_disponible"
+
+BOOK_AVAILABILITY = """
+    SELECT l.ID_livre, l.Titre, l.Auteur, l.Genre, l.Quantite_disponible,
+           COUNT(loc.ID_location) AS en_cours, MIN(loc.Date_retour_prevue) AS prochain_retour
+    FROM livres l
+    LEFT JOIN locations loc ON loc.ID_livre = l.ID_livre AND loc.Statut NOT IN ('Retourné', 'Annulé')
+    WHERE l.ID_livre = %s
+    GROUP BY l.ID_livre, l.Titre, l.Auteur, l.Genre, l.Quantite_disponible
+"""
+
+STUDENT_LOANS = """
+    SELECT loc.ID_location, loc.ID_livre, l.Titre, l.Auteur, loc.Date_location, loc.Date_retour_prevue, loc.Statut
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    WHERE loc.ID_etudiant = %s AND loc.Statut NOT IN ('Retourné', 'Annulé')
+    ORDER BY loc.Date_retour_prevue, loc.ID_location
+"""
+
+
+class ApiError(Exception):
+    """Erreur renvoyée au client avec son code HTTP"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return database.convert_decimal(value)
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def verify_password(stored, password):
+    """Vérifie un mot de passe (SHA-256 de l'application, ou bcrypt si la bibliothèque est installée)"""
+    if not stored:
+        return False
+    if stored.startswith('$2b$'):
+        try:
+            import bcrypt
+        except ImportError:
+            return False
+        return bcrypt.checkpw(password.encode('utf-8'), stored.encode('utf-8'))
+    return hmac.compare_digest(stored, hashlib.sha256(password.encode('utf-8')).hexdigest())
+
+
+def _int_list(value, field, many=True):
+    """Identifiant (ou liste d'identifiants si `many`) d'un corps JSON"""
+    values = value if many and isinstance(value, list) else [value]
+    if not values or not all(isinstance(item, int) and not isinstance(item, bool) and 0 <= item <= MAX_ID
+                             for item in values):
+        expected = "un entier ou une liste d'entiers" if many else "un entier"
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"« {field} » doit être {expected} (identifiant)")
+    return values
+
+
+# ================================= OPÉRATIONS ==========================================
+
+def login(request):
+    """POST /api/session {mail, password} : ouvre une session et retourne son jeton"""
+    mail, password = request.body.get('mail'), request.body.get('password')
+    if not isinstance(mail, str) or not isinstance(password, str):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "« mail » et « password » sont requis")
+    rows = database.run_query("SELECT ID_utilisateur, nom, prenom, role, password FROM utilisateurs WHERE mail = %s",
+                              (mail,), cache=False)
+    if not rows or not verify_password(rows[0]['password'], password):
+        raise ApiError(HTTPStatus.UNAUTHORIZED, "Identifiants invalides")
+    user = {key: rows[0][key] for key in ('ID_utilisateur', 'nom', 'prenom', 'role')}
+    store = sessions.get_store()
+    return HTTPStatus.CREATED, {'token': store.create(user['ID_utilisateur']), 'expires_in': int(store.ttl),
+                                'utilisateur': user}
+
+
+def logout(request):
+    """DELETE /api/session : ferme la session du jeton"""
+    sessions.get_store().revoke(request.token)
+    return HTTPStatus.OK, {'ok': True}
+
+
+def search_books(request):
+    """GET /api/livres?q=&genre=&disponible=1&limit= : recherche dans le catalogue (ou parcours par ID avec ?apres=)"""
+    params = request.params
+    limit = min(max(int(params.get('limit', SEARCH_LIMIT)), 1), 100)
+    available_only = params.get('disponible') == '1'
+    text = params.get('q', '').strip()
+
+    if not text:
+        query = f"SELECT {BOOK_COLUMNS} FROM livres WHERE ID_livre > %s"
+        if available_only:
+            query += " AND Quantite_disponible > 0"
+        after = min(int(params.get('apres', 0)), MAX_ID)
+        books = database.run_query(query + " ORDER BY ID_livre LIMIT %s", (after, limit))
+        return HTTPStatus.OK, {'livres': books}
+
+    # Index plein texte en mémoire (celui du catalogue de l'application), puis relecture par clé primaire
+    hits = search.get_catalog_index().search(text, limit * 3 if available_only else limit, params.get('genre'))
+    if not hits:
+        return HTTPStatus.OK, {'livres': []}
+    scores = dict(hits)
+    query = f"SELECT {BOOK_COLUMNS} FROM livres WHERE ID_livre IN ({_placeholders(scores)})"
+    if available_only:
+        query += " AND Quantite_disponible > 0"
+    books = database.run_query(query, list(scores))
+    books.sort(key=lambda book: -scores[book['ID_livre']])
+    for book in books:
+        book['score'] = round(scores[book['ID_livre']], 3)
+    return HTTPStatus.OK, {'livres': books[:limit]}
+
+
+def book_availability(request, book_id):
+    """GET /api/livres/<id> : disponibilité d'un livre"""
+    rows = database.run_query(BOOK_AVAILABILITY, (book_id,))
+    if not rows:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"Livre {book_id} inconnu")
+    book = rows[0]
+    book['disponible'] = (book['Quantite_disponible'] or 0) > 0
+    return HTTPStatus.OK, book
+
+
+def student_loans(request, student_id):
+    """GET /api/etudiants/<id>/locations : locations en cours d'un étudiant"""
+    _check_student_access(request.user, student_id)
+    loans = database.run_query(STUDENT_LOANS, (student_id,))
+    today = date.today()
+    for loan in loans:
+        due = loan['Date_retour_prevue']
+        if isinstance(due, str):
+            due = date.fromisoformat(due[:10])
+        loan['jours_retard'] = max((today - due).days, 0) if due else 0
+    return HTTPStatus.OK, {'ID_etudiant': student_id, 'locations': loans}
+
+
+def checkout(request):
+    """POST /api/locations {ID_livre (ou liste), ID_etudiant, jours} : emprunt d'un ou plusieurs livres"""
+    body = request.body
+    student_id = _int_list(body.get('ID_etudiant'), 'ID_etudiant', many=False)[0]
+    book_ids = _int_list(body.get('ID_livre'), 'ID_livre')
+    days = body.get('jours', LOAN_DAYS)
+    if not isinstance(days, int) or not 1 <= days <= MAX_LOAN_DAYS:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"« jours » doit être compris entre 1 et {MAX_LOAN_DAYS}")
+    _check_student_access(request.user, student_id)
+    roles = database.run_query("SELECT role FROM utilisateurs WHERE ID_utilisateur = %s", (student_id,))
+    if not roles or roles[0]['role'] != 'Etudiant':
+        raise ApiError(HTTPStatus.NOT_FOUND, f"Étudiant {student_id} inconnu")
+
+    loan_date = date.today()
+    due_date = loan_date + timedelta(days=days)
+    if not isinstance(body.get('ID_livre'), list):
+        try:
+            location_id = circulation.checkout(book_ids[0], student_id, loan_date, due_date)
+        except circulation.NoCopyAvailableError as e:
+            raise ApiError(HTTPStatus.CONFLICT, str(e))
+        return HTTPStatus.CREATED, {'ID_location': location_id, 'ID_livre': book_ids[0],
+                                    'Date_retour_prevue': due_date}
+
+    # Lot scanné à une borne : une transaction, les livres sans exemplaire disponible sont refusés
+    loaned, refused = circulation.batch_checkout(book_ids, student_id, loan_date, due_date)
+    return HTTPStatus.CREATED, {'pretes': loaned, 'refuses': refused, 'Date_retour_prevue': due_date}
+
+
+def return_books(request):
+    """POST /api/retours {ID_location ou ID_livre, entier ou liste} : retours (personnel uniquement)"""
+    body = request.body
+    _require_admin(request.user)
+    if 'ID_location' in body:
+        location_ids, unmatched = _int_list(body['ID_location'], 'ID_location'), []
+    elif 'ID_livre' in body:
+        # Livre scanné : rattaché à sa location active dont l'échéance est la plus proche
+        location_ids, unmatched = circulation.resolve_active_loans(_int_list(body['ID_livre'], 'ID_livre'))
+    else:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "« ID_location » ou « ID_livre » est requis")
+
+    returned, rejected = circulation.batch_return(location_ids, date.today()) if location_ids else ([], [])
+    if not returned and (rejected or unmatched) and not isinstance(body.get('ID_location', body.get('ID_livre')), list):
+        raise ApiError(HTTPStatus.CONFLICT, "Aucune location en cours pour cet identifiant")
+    return HTTPStatus.OK, {'retournees': returned, 'refusees': rejected, 'livres_sans_location': unmatched}
+
+
+def health(request):
+    """GET /api/sante : le serveur répond (sans authentification, donc sans détail interne)"""
+    return HTTPStatus.OK, {'ok': True}
+
+
+def _require_admin(user):
+    if user['role'] != 'Admin':
+        raise ApiError(HTTPStatus.FORBIDDEN, "Opération réservée au personnel")
+
+
+def _check_student_access(user, student_id):
+    # Un étudiant n'accède qu'à ses propres locations (borne en libre-service)
+    if user['role'] != 'Admin' and user['ID_utilisateur'] != student_id:
+        raise ApiError(HTTPStatus.FORBIDDEN, "Accès limité à vos propres locations")
+
+
+# ================================= SERVEUR HTTP ==========================================
+
+class ApiRequest:
+    """Corps JSON, paramètres d'URL, jeton et utilisateur authentifié d'une requête"""
+
+    def __init__(self, body, params, token):
+        self.body = body
+        self.params = params
+        self.token = token
+        self.user = None
+
+    def authenticate(self):
+        """Profil de l'utilisateur du jeton (sessions de l'application : révocables par un administrateur)"""
+        store = sessions.get_store()
+        user_id = store.validate(self.token)
+        self.user = store.get_profile(user_id) if user_id is not None else None
+        if self.user is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Jeton de session absent, expiré ou révoqué")
+
+
+# (méthode, motif du chemin, fonction, authentification requise)
+ROUTES = [
+    ('GET', re.compile(r'/api/sante'), health, False),
+    ('POST', re.compile(r'/api/session'), login, False),
+    ('DELETE', re.compile(r'/api/session'), logout, True),
+    ('GET', re.compile(r'/api/livres'), search_books, True),
+    ('GET', re.compile(r'/api/livres/(\d{1,18})'), book_availability, True),
+    ('GET', re.compile(r'/api/etudiants/(\d{1,18})/locations'), student_loans, True),
+    ('POST', re.compile(r'/api/locations'), checkout, True),
+    ('POST', re.compile(r'/api/retours'), return_books, True),
+]
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Requêtes JSON ; connexions persistantes (HTTP/1.1) pour les bornes qui enchaînent les scans"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'BiblioAPI/1.0'
+    # En-têtes et corps partent en deux écritures : sans TCP_NODELAY, l'ACK retardé du client ajoute ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        matches = [(route_method, match, func, auth) for route_method, pattern, func, auth in ROUTES
+                   for match in [pattern.fullmatch(path)] if match]
+        try:
+            # Corps lu avant toute réponse pour garder la connexion persistante utilisable
+            body = self._read_body()
+            route = next((route for route in matches if route[0] == method), None)
+            if route is None:
+                if matches:
+                    raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Méthode non autorisée")
+                raise ApiError(HTTPStatus.NOT_FOUND, "Ressource inconnue")
+            _, match, func, auth = route
+
+            header = self.headers.get('Authorization', '')
+            request = ApiRequest(body, {key: values[-1] for key, values in parse_qs(url.query).items()},
+                                 header[7:].strip() if header.startswith('Bearer ') else '')
+            with instrumentation.timed('api', f"{method} {func.__name__}"):
+                if auth:
+                    request.authenticate()
+                status, payload = func(request, *(int(group) for group in match.groups()))
+        except ApiError as e:
+            status, payload = e.status, {'erreur': str(e)}
+        except (ValueError, OverflowError) as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {'erreur': str(e)}
+        except database.PoolTimeoutError as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {'erreur': str(e)}
+        except Exception as e:
+            # Détail (message du pilote) dans le journal du serveur seulement
+            self.log_error("Erreur sur %s %s: %r", method, self.path, e)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'erreur': "Erreur interne du serveur"}
+        self._send(status, payload)
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Corps de taille inconnue : non lu, la connexion ne peut pas servir d'autre requête
+            self.close_connection = True
+            raise ApiError(HTTPStatus.BAD_REQUEST, "En-tête Content-Length invalide")
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Requête trop volumineuse")
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Le corps doit être un objet JSON")
+        return body
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, default=_json_default, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Cache-Control', 'no-store')
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Le détail des temps passe par instrumentation (BIBLIO_PERF_LOG) ; seules les erreurs sont affichées
+        pass
+
+    def log_error(self, format, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Un thread par connexion ; les requêtes partagent le pool de connexions et le cache des lectures"""
+
+    daemon_threads = True
+
+
+def create_server(host=API_HOST, port=API_PORT):
+    # Lectures servies depuis le cache du processus, avec une durée de vie propre à l'API
+    database.query_cache.ttl = API_CACHE_TTL
+    return ApiServer((host, port), ApiHandler)
+
+
+def main(argv):
+    """Point d'entrée : `python api.py [--host H] [--port P]`"""
+    parser = argparse.ArgumentParser(description="API JSON pour les bornes et postes de scan")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args(argv[1:])
+
+    server = create_server(args.host, args.port)
+    # Index de recherche construit avant la première requête
+    search.get_catalog_index()
+    print(f"API à l'écoute sur http://{args.host}:{args.port}/api (Ctrl+C pour arrêter)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,271 @@
+import configparser
+import functools
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+
+import mysql.connector
+from mysql.connector import errors as mysql_errors
+
+
+# ================================= CONFIGURATION ==========================================
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Fichier INI optionnel (section [database]) ; les variables BIBLIO_DB_* sont prioritaires
+CONFIG_FILE = os.environ.get('BIBLIO_CONFIG', os.path.join(APP_DIR, 'biblio.ini'))
+
+BACKENDS = ('mysql', 'sqlite')
+
+DEFAULTS = {
+    'backend': 'mysql',
+    'host': 'localhost',
+    'port': '3306',
+    'user': 'root',
+    'password': '',
+    'database': 'biblio',
+    'path': os.path.join(APP_DIR, 'biblio.db')
+}
+
+# Fichiers de création du schéma de base, par moteur
+SCHEMA_FILES = {
+    'mysql': os.path.join(APP_DIR, 'Tables_Mysql.sql'),
+    'sqlite': os.path.join(APP_DIR, 'Tables_SQLite.sql')
+}
+
+# Erreurs des deux pilotes, pour les blocs qui ne dépendent pas du moteur
+ERRORS = (mysql_errors.Error, sqlite3.Error)
+
+
+def load_config(path=CONFIG_FILE):
+    """Paramètres de connexion : variables d'environnement BIBLIO_DB_*, puis fichier INI, puis défauts"""
+    parser = configparser.ConfigParser()
+    parser.read(path, encoding='utf-8')
+    section = parser['database'] if parser.has_section('database') else {}
+
+    config = {key: os.environ.get(f'BIBLIO_DB_{key.upper()}', section.get(key, default))
+              for key, default in DEFAULTS.items()}
+    config['backend'] = config['backend'].lower()
+    if config['backend'] not in BACKENDS:
+        raise ValueError(f"Moteur de base inconnu: {config['backend']} (attendu: {', '.join(BACKENDS)})")
+    config['port'] = int(config['port'])
+    return config
+
+
+# ================================= MYSQL ==========================================
+
+def connect_mysql(config):
+    return mysql.connector.connect(**config)
+
+
+# ================================= SQLITE ==========================================
+
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter('DATETIME', lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SQLiteCursor:
+    """Curseur SQLite exposant l'interface utilisée du curseur mysql.connector
+
+    Les requêtes, écrites en dialecte MySQL avec des paramètres %s, sont traduites à la volée.
+    """
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, query, params=()):
+        self._cursor.execute(translate_sql(query), tuple(params or ()))
+        return self
+
+    def executemany(self, query, seq_params):
+        self._cursor.executemany(translate_sql(query), [tuple(params) for params in seq_params])
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SQLiteConnection:
+    """Connexion SQLite exposant l'interface utilisée de mysql.connector (autocommit, transactions explicites)"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, dictionary=False, buffered=False):
+        return SQLiteCursor(self._connection.cursor(), dictionary)
+
+    def start_transaction(self):
+        # Verrou d'écriture pris dès le début : équivaut aux SELECT ... FOR UPDATE de MySQL
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    @property
+    def in_transaction(self):
+        return self._connection.in_transaction
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        self._connection.execute("SELECT 1").fetchall()
+
+    def close(self):
+        self._connection.close()
+
+
+def connect_sqlite(path, timeout=10):
+    """Ouvre la base SQLite `path` (':memory:' : base en mémoire partagée par les connexions du pool)"""
+    uri = path == ':memory:'
+    if uri:
+        path = 'file:biblio_memory?mode=memory&cache=shared'
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False,
+                                 detect_types=sqlite3.PARSE_DECLTYPES, uri=uri)
+    if not uri:
+        # Lecteurs et écrivain concurrents (plusieurs sessions Streamlit)
+        connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    return SQLiteConnection(connection)
+
+
+# ================================= DIALECTE ==========================================
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_FUNCTION_RE = re.compile(r'\b(CURDATE|NOW|DATE_SUB|DATE_ADD|DATEDIFF|DATE_FORMAT|LEAST|GREATEST)\s*\(',
+                          re.IGNORECASE)
+_INTERVAL_RE = re.compile(r'^INTERVAL\s+(.+?)\s+(DAY|MONTH|YEAR)$', re.IGNORECASE | re.DOTALL)
+_UPSERT_RE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+_REWRITES = [
+    (re.compile(r'\bFOR\s+UPDATE\b|\bLOCK\s+IN\s+SHARE\s+MODE\b', re.IGNORECASE), ''),
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE), 'INSERT OR IGNORE'),
+    (re.compile(r'\bTRUNCATE\s+TABLE\b', re.IGNORECASE), 'DELETE FROM'),
+    (re.compile(r'\bANALYZE\s+TABLE\b', re.IGNORECASE), 'ANALYZE')
+]
+
+
+def _split_arguments(sql, start):
+    """Arguments d'un appel de fonction dont la parenthèse ouvrante précède `start` ; retourne (arguments, fin)"""
+    depth, current, arguments = 0, start, []
+    i = start
+    while i < len(sql):
+        char = sql[i]
+        if char == "'":
+            i = _STRING_RE.match(sql, i).end()
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                arguments.append(sql[current:i].strip())
+                return [argument for argument in arguments if argument], i + 1
+            depth -= 1
+        elif char == ',' and depth == 0:
+            arguments.append(sql[current:i].strip())
+            current = i + 1
+        i += 1
+    raise ValueError(f"Parenthèse non fermée dans la requête: {sql[:200]}")
+
+
+def _date_shift(base, interval, sign):
+    match = _INTERVAL_RE.match(interval)
+    if not match:
+        raise ValueError(f"Intervalle non pris en charge par SQLite: {interval}")
+    amount, unit = match.groups()
+    return f"date({base}, '{sign}' || ({amount}) || ' {unit.lower()}s')"
+
+
+def _translate_function(name, arguments):
+    name = name.upper()
+    if name == 'CURDATE':
+        return "date('now', 'localtime')"
+    if name == 'NOW':
+        return "datetime('now', 'localtime')"
+    if name in ('DATE_SUB', 'DATE_ADD'):
+        return _date_shift(arguments[0], arguments[1], '-' if name == 'DATE_SUB' else '+')
+    if name == 'DATEDIFF':
+        return f"CAST(julianday({arguments[0]}) - julianday({arguments[1]}) AS INTEGER)"
+    if name == 'DATE_FORMAT':
+        # Les formats %Y, %m et %d utilisés par l'application sont communs à MySQL et strftime
+        return f"strftime({arguments[1]}, {arguments[0]})"
+    # LEAST / GREATEST : MIN / MAX à plusieurs arguments sont scalaires en SQLite
+    return f"{'MIN' if name == 'LEAST' else 'MAX'}({', '.join(arguments)})"
+
+
+def _translate_code(sql):
+    """Traduit un fragment de requête hors chaînes littérales"""
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    upsert = _UPSERT_RE.search(sql)
+    if upsert:
+        update = _VALUES_RE.sub(r'excluded.\1', sql[upsert.end():])
+        sql = sql[:upsert.start()] + 'ON CONFLICT DO UPDATE SET' + update
+    return sql.replace('%s', '?')
+
+
+@functools.lru_cache(maxsize=1024)
+def translate_sql(sql):
+    """Traduit une requête du dialecte MySQL de l'application vers SQLite
+
+    Couvre le sous-ensemble utilisé : CURDATE, NOW, DATE_SUB/DATE_ADD (INTERVAL n DAY|MONTH|YEAR),
+    DATEDIFF, DATE_FORMAT, LEAST/GREATEST, ON DUPLICATE KEY UPDATE ... VALUES(col), FOR UPDATE,
+    INSERT IGNORE, TRUNCATE TABLE, ANALYZE TABLE et les paramètres %s.
+    """
+    # Fonctions MySQL : arguments traduits récursivement (les chaînes littérales sont ignorées)
+    while True:
+        literals = [literal.span() for literal in _STRING_RE.finditer(sql)]
+        match = next((candidate for candidate in _FUNCTION_RE.finditer(sql)
+                      if not any(start < candidate.start() < end for start, end in literals)), None)
+        if match is None:
+            break
+        arguments, end = _split_arguments(sql, match.end())
+        arguments = [translate_sql(argument) for argument in arguments]
+        sql = sql[:match.start()] + _translate_function(match.group(1), arguments) + sql[end:]
+
+    parts, position = [], 0
+    for literal in _STRING_RE.finditer(sql):
+        parts.append(_translate_code(sql[position:literal.start()]))
+        parts.append(literal.group(0))
+        position = literal.end()
+    parts.append(_translate_code(sql[position:]))
+    return ''.join(parts)
+
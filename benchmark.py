@@ -0,0 +1,407 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import backends
+import database
+import migrate
+import queries
+import rollups
+
+
+# ================================= CONFIGURATION ==========================================
+
+BENCH_DIR = os.environ.get('BIBLIO_BENCH_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+# Base dédiée (schéma MySQL ou fichier SQLite selon le moteur) : ses tables sont vidées à chaque palier,
+# ce ne doit jamais être la base de l'application
+BENCH_DATABASE = os.environ.get('BIBLIO_BENCH_DATABASE',
+                                'biblio_bench.db' if database.BACKEND == 'sqlite' else 'biblio_bench')
+
+# Paliers exprimés en nombre de locations ; livres et utilisateurs suivent en proportion
+DEFAULT_SCALES = [10000, 100000, 1000000]
+BOOKS_PER_LOAN = 1 / 10
+USERS_PER_LOAN = 1 / 25
+HISTORY_YEARS = 3
+LOAN_DAYS = 14
+INSERT_BATCH = 5000
+
+# Seuil (ratio p95 nouveau / ancien) au-delà duquel `compare` signale une régression
+REGRESSION_RATIO = 1.25
+
+BENCH_TABLES = ['locations', 'livres', 'utilisateurs', 'stats_locations_jour', 'stats_locations_jour_genre_auteur']
+
+
+# ================================= DONNÉES SYNTHÉTIQUES ==========================================
+
+GENRES = ['Roman', 'Science-fiction', 'Policier', 'Fantasy', 'Histoire', 'Informatique', 'Mathématiques',
+          'Philosophie', 'Biographie', 'Poésie', 'Droit', 'Économie', 'Bande dessinée', 'Jeunesse', 'Théâtre']
+# Quelques genres concentrent l'essentiel du fonds
+GENRE_WEIGHTS = [0.20, 0.12, 0.12, 0.10, 0.08, 0.08, 0.06, 0.05, 0.04, 0.04, 0.03, 0.03, 0.02, 0.02, 0.01]
+
+FIRST_NAMES = ['Camille', 'Lucas', 'Emma', 'Hugo', 'Lea', 'Nathan', 'Chloe', 'Louis', 'Manon', 'Jules',
+               'Ines', 'Adam', 'Sarah', 'Yanis', 'Lina', 'Noah', 'Jade', 'Rayan', 'Zoe', 'Mehdi']
+LAST_NAMES = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+              'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'Benali', 'Roux', 'Fournier', 'Girard', 'Diallo']
+TITLE_WORDS = ['Ombre', 'Voyage', 'Nuit', 'Mémoires', 'Secret', 'Jardin', 'Empire', 'Chemins', 'Silence', 'Mer',
+               'Algorithmes', 'Histoire', 'Lumière', 'Cité', 'Principes', 'Étoiles', 'Héritage', 'Frontière']
+
+# Rentrées (septembre-octobre) et révisions (janvier, mai) ; creux de l'été
+MONTH_WEIGHTS = {1: 1.3, 2: 1.0, 3: 1.0, 4: 0.9, 5: 1.2, 6: 0.8, 7: 0.3, 8: 0.3, 9: 1.5, 10: 1.4, 11: 1.1, 12: 0.8}
+
+
+def generate(loans, seed=42, today=None):
+    """Génère un jeu de données reproductible de `loans` locations
+
+    Retourne {'livres', 'utilisateurs', 'locations'} (listes de tuples dans l'ordre des colonnes de
+    INSERT_QUERIES) avec une distribution réaliste : quelques titres très empruntés (loi de Zipf),
+    étudiants plus ou moins actifs, pics saisonniers et une traîne de retards jamais rendus.
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    n_books = max(50, int(loans * BOOKS_PER_LOAN))
+    n_users = max(20, int(loans * USERS_PER_LOAN))
+    n_admins = max(1, n_users // 200)
+
+    # Livres
+    book_ids = np.arange(1, n_books + 1)
+    authors = [f"{FIRST_NAMES[i % 20]} {LAST_NAMES[(i // 20) % 20]}" + (f" {i // 400}" if i >= 400 else "")
+               for i in range(max(10, n_books // 4))]
+    genres = rng.choice(len(GENRES), size=n_books, p=GENRE_WEIGHTS)
+    words = rng.integers(0, len(TITLE_WORDS), size=(n_books, 2))
+    years = rng.integers(1950, today.year + 1, size=n_books)
+    quantities = rng.integers(0, 6, size=n_books)
+    author_ids = rng.integers(0, len(authors), size=n_books)
+    livres = [(int(book_id), f"{TITLE_WORDS[w1]} et {TITLE_WORDS[w2].lower()} {book_id}", authors[author],
+               int(year), GENRES[genre], int(quantity), None)
+              for book_id, (w1, w2), author, year, genre, quantity
+              in zip(book_ids, words, author_ids, years, genres, quantities)]
+
+    # Utilisateurs (les premiers sont administrateurs)
+    password = hashlib.sha256(b'benchmark').hexdigest()
+    first = rng.integers(0, len(FIRST_NAMES), size=n_users)
+    last = rng.integers(0, len(LAST_NAMES), size=n_users)
+    utilisateurs = [(user_id, LAST_NAMES[l], FIRST_NAMES[f],
+                     f"{FIRST_NAMES[f].lower()}.{LAST_NAMES[l].lower()}.{user_id}@bench.example", password,
+                     'Admin' if user_id <= n_admins else 'Etudiant')
+                    for user_id, f, l in zip(range(1, n_users + 1), first, last)]
+
+    # Locations : popularité des livres en loi de Zipf, activité des étudiants log-normale
+    popularity = 1.0 / np.arange(1, n_books + 1) ** 1.1
+    book_weights = np.empty(n_books)
+    book_weights[rng.permutation(n_books)] = popularity / popularity.sum()
+    students = np.arange(n_admins + 1, n_users + 1)
+    activity = rng.lognormal(0, 1, size=len(students))
+
+    span = HISTORY_YEARS * 365
+    start = today - timedelta(days=span - 1)
+    days = [start + timedelta(days=i) for i in range(span)]
+    day_weights = np.array([MONTH_WEIGHTS[d.month] * (0.3 if d.weekday() >= 5 else 1.0) for d in days])
+
+    loan_days = np.sort(rng.choice(span, size=loans, p=day_weights / day_weights.sum()))
+    loan_books = rng.choice(book_ids, size=loans, p=book_weights)
+    loan_students = rng.choice(students, size=loans, p=activity / activity.sum())
+
+    # Durée de prêt : la plupart rendus avant l'échéance, 10 % en retard, 1,5 % jamais rendus
+    delays = np.ceil(rng.gamma(2.0, 5.0, size=loans)).astype(int)
+    late = rng.random(loans) < 0.10
+    delays[late] += LOAN_DAYS + np.ceil(rng.exponential(15.0, size=late.sum())).astype(int)
+    lost = rng.random(loans) < 0.015
+    cancelled = rng.random(loans) < 0.01
+    returned = ~lost & ~cancelled & (loan_days + delays <= span - 1)
+
+    locations = []
+    for location_id, (day, book_id, student_id, delay, is_returned, is_cancelled) in enumerate(
+            zip(loan_days.tolist(), loan_books.tolist(), loan_students.tolist(), delays.tolist(),
+                returned.tolist(), cancelled.tolist()), start=1):
+        loan_date = days[day]
+        if is_returned:
+            status, return_date = 'Retourné', loan_date + timedelta(days=delay)
+        else:
+            status, return_date = ('Annulé' if is_cancelled else 'En cours'), None
+        locations.append((location_id, book_id, student_id, loan_date, loan_date + timedelta(days=LOAN_DAYS),
+                          return_date, status))
+
+    return {'livres': livres, 'utilisateurs': utilisateurs, 'locations': locations}
+
+
+# ================================= CHARGEMENT ==========================================
+
+INSERT_QUERIES = {
+    'livres': """INSERT INTO livres (ID_livre, Titre, Auteur, Annee_publication, Genre, Quantite_disponible,
+                                     Autres_informations) VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+    'utilisateurs': """INSERT INTO utilisateurs (ID_utilisateur, nom, prenom, mail, password, role)
+                       VALUES (%s, %s, %s, %s, %s, %s)""",
+    'locations': """INSERT INTO locations (ID_location, ID_livre, ID_etudiant, Date_location, Date_retour_prevue,
+                                           Date_retour_effective, Statut) VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+}
+
+
+def use_database(name, log=print):
+    """Pointe l'application sur la base de benchmark (créée au besoin, schéma et migrations appliqués)"""
+    if database._pool is not None:
+        raise RuntimeError("Le pool est déjà ouvert sur une autre base")
+
+    if database.BACKEND == 'sqlite':
+        if name != ':memory:' and os.path.abspath(name) == os.path.abspath(database.SQLITE_PATH):
+            raise SystemExit(f"Refus : '{name}' est la base de l'application, choisissez une base dédiée")
+        database.SQLITE_PATH = name
+    else:
+        if name == database.DB_CONFIG['database']:
+            raise SystemExit(f"Refus : la base '{name}' est celle de l'application, choisissez une base dédiée")
+        server = {key: value for key, value in database.DB_CONFIG.items() if key != 'database'}
+        connection = backends.connect_mysql(server)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{name}` CHARACTER SET utf8mb4")
+            cursor.close()
+        finally:
+            connection.close()
+        database.DB_CONFIG['database'] = name
+
+    # Schéma de base créé sur une base vide, puis migrations
+    migrate.apply_pending(log)
+
+
+def load(data, log=print):
+    """Remplace le contenu des tables de benchmark par `data` puis reconstruit les agrégats"""
+    with database.pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            if database.BACKEND == 'mysql':
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in BENCH_TABLES:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            for table, insert in INSERT_QUERIES.items():
+                rows = data[table]
+                log(f"  {table}: {len(rows)} lignes")
+                for start in range(0, len(rows), INSERT_BATCH):
+                    cursor.executemany(insert, rows[start:start + INSERT_BATCH])
+        finally:
+            try:
+                # Rétabli même après un échec : la connexion retourne au pool
+                if database.BACKEND == 'mysql':
+                    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            finally:
+                cursor.close()
+
+    rollups.rebuild()
+    with database.pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            for table in BENCH_TABLES:
+                cursor.execute(f"ANALYZE TABLE {table}")
+                cursor.fetchall()
+        finally:
+            cursor.close()
+    database.query_cache.invalidate()
+
+
+# ================================= MESURES ==========================================
+
+def page_queries(data, today=None):
+    """Requêtes exécutées par chaque page, avec des paramètres représentatifs du jeu de données
+
+    Retourne [(page, nom, requête, paramètres)].
+    """
+    today = today or date.today()
+    livres, locations = data['livres'], data['locations']
+    top_genre = max(set(book[4] for book in livres), key=[book[4] for book in livres].count)
+    middle_book = livres[len(livres) // 2][0]
+    search_hits = [book[0] for book in livres[::max(1, len(livres) // 200)]][:200]
+    period = [today - timedelta(days=30), today]
+    # Page profonde de l'historique : dernière location de la première quinzaine de la période
+    deep = next((loan for loan in reversed(locations) if loan[3] <= today - timedelta(days=15)), locations[0])
+
+    by_id = [("ID_livre", "ID_livre")]
+    calls = [
+        ('get_advanced_analytics', 'kpi_snapshot', queries.KPI_SNAPSHOT, ()),
+        ('get_advanced_analytics', 'top_genres', queries.TOP_GENRES, ()),
+        ('get_advanced_analytics', 'recent_activity', queries.RECENT_ACTIVITY, ()),
+        ('get_advanced_analytics', 'popular_books', queries.POPULAR_BOOKS, ()),
+        ('show_book_catalog', 'unique_genres', queries.UNIQUE_GENRES, ()),
+        ('show_book_catalog', 'catalog_first_page') + queries.keyset_page(queries.CATALOG, [], by_id),
+        ('show_book_catalog', 'catalog_genre_available') + queries.keyset_page(
+            queries.CATALOG + " AND Genre = %s AND Quantite_disponible > 0", [top_genre], by_id),
+        ('show_book_catalog', 'catalog_deep_page') + queries.keyset_page(queries.CATALOG, [], by_id, (middle_book,)),
+        ('show_book_catalog', 'catalog_search_hits', queries.CATALOG +
+         f" AND ID_livre IN ({', '.join(['%s'] * len(search_hits))})", search_hits),
+        ('show_rental_history', 'history_first_page') + queries.keyset_page(
+            queries.RENTAL_HISTORY, period, queries.RENTAL_HISTORY_ORDER, descending=True),
+        ('show_rental_history', 'history_deep_page') + queries.keyset_page(
+            queries.RENTAL_HISTORY, period, queries.RENTAL_HISTORY_ORDER, (deep[3], deep[0]), descending=True),
+        ('show_rental_history', 'history_period_stats', queries.RENTAL_PERIOD_STATS, period),
+        ('show_user_statistics', 'users_by_role', queries.USERS_BY_ROLE, ()),
+        ('show_user_statistics', 'most_active_students', queries.MOST_ACTIVE_STUDENTS, ()),
+        ('generate_comprehensive_report', 'monthly_loans', queries.MONTHLY_LOANS, ()),
+        ('generate_comprehensive_report', 'top_authors', queries.TOP_AUTHORS, ()),
+        ('advanced_analysis', 'overdue_loans', queries.OVERDUE_LOANS, ()),
+    ]
+    if database.BACKEND == 'mysql':
+        # Estimation du nombre de lignes du pager (voir estimate_row_count), sans équivalent SQLite
+        calls.append(('show_book_catalog', 'catalog_row_estimate', "EXPLAIN " + queries.CATALOG, ()))
+    return calls
+
+
+def _rows_read(cursor):
+    """Compteur de lignes lues par le moteur de stockage dans la session (somme des Handler_read_*)"""
+    cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+    return sum(int(value) for _, value in cursor.fetchall())
+
+
+def measure(query, params, repeat):
+    """Exécute `repeat` fois une requête (lecture + DataFrame) ; retourne ses statistiques
+
+    Les lignes lues sont mesurées sur une exécution préalable qui sert aussi d'échauffement
+    (MySQL uniquement : SQLite n'expose pas de compteur équivalent, `rows_scanned` vaut alors None).
+    """
+    with database.pooled_connection() as connection:
+        cursor = connection.cursor(buffered=True)
+        try:
+            if database.BACKEND == 'mysql':
+                # Coût propre de SHOW STATUS, retranché de la mesure
+                overhead = -_rows_read(cursor) + _rows_read(cursor)
+                before = _rows_read(cursor)
+                cursor.execute(query, params or ())
+                rows_returned = len(cursor.fetchall())
+                rows_scanned = max(0, _rows_read(cursor) - before - overhead)
+            else:
+                cursor.execute(query, params or ())
+                rows_returned = len(cursor.fetchall())
+                rows_scanned = None
+
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(query, params or ())
+                database.rows_to_dataframe(cursor.description, cursor.fetchall())
+                timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            cursor.close()
+
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'mean_ms': round(float(np.mean(timings)), 3),
+        'rows_returned': rows_returned,
+        'rows_scanned': rows_scanned
+    }
+
+
+def run_scale(loans, seed, repeat, log=print):
+    """Génère et charge un palier puis mesure toutes les requêtes des pages"""
+    log(f"Palier {loans} locations : génération...")
+    started = time.perf_counter()
+    data = generate(loans, seed)
+    log(f"Palier {loans} locations : chargement...")
+    load(data, log)
+    load_seconds = round(time.perf_counter() - started, 1)
+
+    results = {}
+    for page, name, query, params in page_queries(data):
+        results[name] = dict(page=page, **measure(query, params, repeat))
+        log(f"  {name:<28} p50 {results[name]['p50_ms']:>9.2f} ms   p95 {results[name]['p95_ms']:>9.2f} ms   "
+            f"{results[name]['rows_scanned'] if results[name]['rows_scanned'] is not None else '-':>10} lignes lues")
+    return {
+        'loans': loans,
+        'books': len(data['livres']),
+        'users': len(data['utilisateurs']),
+        'load_seconds': load_seconds,
+        'queries': results
+    }
+
+
+def _code_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales=DEFAULT_SCALES, seed=42, repeat=20, label=None, log=print):
+    """Exécute la suite sur chaque palier ; retourne le rapport (sérialisable en JSON)"""
+    report = {
+        'label': label or _code_version() or 'inconnu',
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'seed': seed,
+        'repeat': repeat,
+        'backend': database.BACKEND,
+        'database': database.SQLITE_PATH if database.BACKEND == 'sqlite' else database.DB_CONFIG['database'],
+        'python': platform.python_version(),
+        'scales': []
+    }
+    for loans in scales:
+        report['scales'].append(run_scale(loans, seed, repeat, log))
+    return report
+
+
+# ================================= COMPARAISON ==========================================
+
+def compare(old, new, threshold=REGRESSION_RATIO):
+    """Compare deux rapports palier par palier ; retourne [(palier, requête, p95 avant, p95 après, ratio)]
+    pour les requêtes dont le p95 s'est dégradé au-delà de `threshold`"""
+    old_scales = {scale['loans']: scale['queries'] for scale in old['scales']}
+    regressions = []
+    for scale in new['scales']:
+        before = old_scales.get(scale['loans'], {})
+        for name, stats in scale['queries'].items():
+            if name not in before or not before[name]['p95_ms']:
+                continue
+            ratio = stats['p95_ms'] / before[name]['p95_ms']
+            if ratio > threshold:
+                regressions.append((scale['loans'], name, before[name]['p95_ms'], stats['p95_ms'], round(ratio, 2)))
+    return regressions
+
+
+def main(argv):
+    """Point d'entrée : `python benchmark.py run|compare`"""
+    parser = argparse.ArgumentParser(description="Benchmarks des requêtes des pages sur données synthétiques")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Génère les paliers et mesure les requêtes")
+    run_parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                            help="Nombres de locations par palier, séparés par des virgules")
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--repeat', type=int, default=20, help="Exécutions mesurées par requête")
+    run_parser.add_argument('--database', default=BENCH_DATABASE, help="Base dédiée, schéma MySQL ou fichier SQLite (vidée à chaque palier)")
+    run_parser.add_argument('--label', help="Nom de la version mesurée (par défaut le commit courant)")
+    run_parser.add_argument('--output', help="Fichier JSON de résultats (par défaut dans le dossier benchmarks)")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare deux fichiers de résultats")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_RATIO)
+
+    args = parser.parse_args(argv[1:])
+    if args.command == 'run':
+        use_database(args.database)
+        report = run([int(value) for value in args.scales.split(',')], args.seed, args.repeat, args.label)
+        path = args.output or os.path.join(BENCH_DIR, f"bench_{report['label']}_"
+                                                      f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Résultats enregistrés dans {path}")
+        return 0
+
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    for loans, name, before, after, ratio in regressions:
+        print(f"[{loans}] {name}: p95 {before:.2f} ms -> {after:.2f} ms (x{ratio})")
+    print(f"{len(regressions)} régression(s) de {old['label']} à {new['label']}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,180 @@
+import csv
+import io
+from datetime import datetime
+
+import pandas as pd
+
+import database
+from search import normalize_text
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Nombre de lignes insérées par transaction
+BATCH_SIZE = 1000
+# Nombre maximal d'exemplaires d'un titre importé
+MAX_QUANTITY = 10000
+
+# Champs de la table livres : (obligatoire, longueur maximale)
+CATALOG_FIELDS = {
+    'Titre': (True, 100),
+    'Auteur': (True, 100),
+    'Annee_publication': (False, None),
+    'Genre': (True, 50),
+    'Quantite_disponible': (False, None),
+    'Autres_informations': (False, None)
+}
+
+# Noms de colonnes reconnus automatiquement (après normalisation)
+COLUMN_SYNONYMS = {
+    'Titre': ['titre', 'title', 'nom du livre', 'livre'],
+    'Auteur': ['auteur', 'author', 'auteurs', 'ecrivain'],
+    'Annee_publication': ['annee publication', 'annee', 'year', 'publication', 'date de publication'],
+    'Genre': ['genre', 'categorie', 'category', 'theme'],
+    'Quantite_disponible': ['quantite disponible', 'quantite', 'quantity', 'exemplaires', 'stock'],
+    'Autres_informations': ['autres informations', 'informations', 'description', 'notes', 'resume']
+}
+
+INSERT_QUERY = """INSERT INTO livres (Titre, Auteur, Annee_publication, Genre, Quantite_disponible, Autres_informations)
+                  VALUES (%s, %s, %s, %s, %s, %s)"""
+
+
+# ================================= LECTURE ET CORRESPONDANCE ==========================================
+
+def read_table(data, filename):
+    """Lit un fichier CSV (séparateur détecté) ou Excel en DataFrame de chaînes"""
+    if filename.lower().endswith(('.xlsx', '.xls')):
+        return pd.read_excel(io.BytesIO(data), dtype=str)
+
+    text = data.decode('utf-8-sig', errors='replace')
+    try:
+        delimiter = csv.Sniffer().sniff(text[:10000], delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ','
+    return pd.read_csv(io.StringIO(text), sep=delimiter, dtype=str, keep_default_na=False)
+
+
+def _column_key(name):
+    return ' '.join(normalize_text(name).replace('_', ' ').split())
+
+
+def guess_mapping(columns):
+    """Associe chaque champ du catalogue à la colonne du fichier la plus probable (ou None)"""
+    normalized = {_column_key(column): column for column in columns}
+    return {field: next((normalized[synonym] for synonym in synonyms if synonym in normalized), None)
+            for field, synonyms in COLUMN_SYNONYMS.items()}
+
+
+# ================================= VALIDATION ==========================================
+
+def validate(df, mapping):
+    """Valide le fichier de manière vectorisée
+
+    Retourne (livres valides, erreurs) ; chaque DataFrame garde le numéro de ligne du fichier
+    dans la colonne `ligne` (en-tête = ligne 1).
+    """
+    books = pd.DataFrame(index=df.index)
+    for field in CATALOG_FIELDS:
+        column = mapping.get(field)
+        books[field] = df[column].astype(str).str.strip() if column else ''
+    books = books.replace({'nan': '', 'None': ''})
+    books['ligne'] = df.index + 2
+
+    problems = pd.Series('', index=books.index)
+
+    def flag(mask, message):
+        problems[mask] = problems[mask] + message + '; '
+
+    for field, (required, max_length) in CATALOG_FIELDS.items():
+        if required:
+            flag(books[field] == '', f"{field} manquant")
+        if max_length:
+            flag(books[field].str.len() > max_length, f"{field} trop long (max {max_length})")
+
+    year = pd.to_numeric(books['Annee_publication'], errors='coerce')
+    flag((books['Annee_publication'] != '') & (year.isna() | (year % 1 != 0)), "Année invalide")
+    flag((year < 1000) | (year > datetime.now().year), "Année hors limites")
+
+    quantity = pd.to_numeric(books['Quantite_disponible'].replace('', '1'), errors='coerce')
+    valid_quantity = (quantity % 1 == 0) & quantity.between(0, MAX_QUANTITY)
+    flag(~valid_quantity, f"Quantité invalide (entier de 0 à {MAX_QUANTITY})")
+
+    # Les valeurs signalées sont mises à vide avant la conversion (un nombre géant ne tient pas en entier)
+    books['Annee_publication'] = year.where((year % 1 == 0) & year.between(1000, datetime.now().year)).astype('Int64')
+    books['Quantite_disponible'] = quantity.where(valid_quantity, 0).astype(int)
+
+    invalid = problems != ''
+    errors = pd.DataFrame({'ligne': books.loc[invalid, 'ligne'],
+                           'erreur': problems[invalid].str.rstrip('; ')})
+    return books[~invalid], errors
+
+
+def _dedup_key(titles, authors):
+    return [normalize_text(title).strip() + '\x1f' + normalize_text(author).strip()
+            for title, author in zip(titles, authors)]
+
+
+def find_duplicates(books):
+    """Sépare les doublons (dans le fichier ou déjà au catalogue, sur Titre + Auteur)
+
+    Retourne (livres à importer, erreurs pour les doublons).
+    """
+    existing = database.run_query("SELECT Titre, Auteur FROM livres", cache=False)
+    known = set(_dedup_key([row['Titre'] or '' for row in existing], [row['Auteur'] or '' for row in existing]))
+
+    keys = pd.Series(_dedup_key(books['Titre'], books['Auteur']), index=books.index)
+    in_catalog = keys.isin(known)
+    in_file = keys.duplicated(keep='first')
+
+    duplicate = in_catalog | in_file
+    messages = pd.Series("Doublon dans le fichier", index=books.index)
+    messages[in_catalog] = "Déjà présent au catalogue"
+    errors = pd.DataFrame({'ligne': books.loc[duplicate, 'ligne'], 'erreur': messages[duplicate]})
+    return books[~duplicate], errors
+
+
+# ================================= IMPORT ==========================================
+
+def _to_params(books):
+    params = []
+    for row in books.itertuples(index=False):
+        year = None if pd.isna(row.Annee_publication) else int(row.Annee_publication)
+        params.append((row.Titre, row.Auteur, year, row.Genre, int(row.Quantite_disponible),
+                       row.Autres_informations or None))
+    return params
+
+
+@database.retry_on_deadlock
+def _insert_batch(params):
+    with database.transaction() as cursor:
+        cursor.executemany(INSERT_QUERY, params)
+
+
+def import_books(books, batch_size=BATCH_SIZE, progress=None):
+    """Insère les livres par lots transactionnels (executemany)
+
+    Si un lot échoue, ses lignes sont rejouées une à une pour isoler les lignes fautives.
+    Retourne (nombre de livres insérés, erreurs).
+    """
+    inserted = 0
+    errors = []
+    lines = books['ligne'].tolist()
+    params = _to_params(books)
+    total = len(params)
+
+    for start in range(0, total, batch_size):
+        batch = params[start:start + batch_size]
+        try:
+            _insert_batch(batch)
+            inserted += len(batch)
+        except Exception:
+            for line, row in zip(lines[start:start + batch_size], batch):
+                try:
+                    _insert_batch([row])
+                    inserted += 1
+                except Exception as e:
+                    errors.append({'ligne': line, 'erreur': str(e)})
+        if progress:
+            progress(min(start + batch_size, total), total)
+
+    return inserted, pd.DataFrame(errors, columns=['ligne', 'erreur'])
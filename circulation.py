@@ -0,0 +1,177 @@
+from collections import Counter
+from datetime import date
+
+import database
+import rollups
+
+
+# ================================= ERREURS ==========================================
+
+class CirculationError(Exception):
+    """Opération d'emprunt ou de retour refusée"""
+
+
+class NoCopyAvailableError(CirculationError):
+    """Plus aucun exemplaire disponible pour ce livre"""
+
+
+class LoanNotActiveError(CirculationError):
+    """La location n'existe pas ou est déjà retournée / annulée"""
+
+
+# ================================= EMPRUNTS ET RETOURS ==========================================
+
+@database.retry_on_deadlock
+def checkout(book_id, student_id, loan_date, due_date, status="En cours"):
+    """Emprunte un exemplaire en une transaction ; retourne l'identifiant de la location
+
+    La décrémentation conditionnelle verrouille la ligne du livre : deux guichets ne peuvent pas
+    prêter le dernier exemplaire en même temps.
+    """
+    with database.transaction() as cursor:
+        cursor.execute("""
+            UPDATE livres SET Quantite_disponible = Quantite_disponible - 1
+            WHERE ID_livre = %s AND Quantite_disponible > 0
+        """, (book_id,))
+        if cursor.rowcount == 0:
+            raise NoCopyAvailableError(f"Aucun exemplaire disponible pour le livre {book_id}")
+
+        cursor.execute("""
+            INSERT INTO locations (ID_livre, ID_etudiant, Date_location, Date_retour_prevue, Statut)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (book_id, student_id, loan_date, due_date, status))
+        location_id = cursor.lastrowid
+        rollups.record_loan(cursor, book_id, loan_date)
+    return location_id
+
+
+@database.retry_on_deadlock
+def return_loan(location_id, return_date=None):
+    """Enregistre le retour d'une location et réapprovisionne le livre en une transaction"""
+    return_date = return_date or date.today()
+    with database.transaction() as cursor:
+        cursor.execute("""
+            UPDATE locations SET Statut = 'Retourné', Date_retour_effective = %s
+            WHERE ID_location = %s AND Statut NOT IN ('Retourné', 'Annulé')
+        """, (return_date, location_id))
+        if cursor.rowcount == 0:
+            raise LoanNotActiveError(f"La location {location_id} n'est pas en cours")
+
+        rollups.record_return(cursor, location_id, return_date)
+        cursor.execute("""
+            UPDATE livres SET Quantite_disponible = Quantite_disponible + 1
+            WHERE ID_livre = (SELECT ID_livre FROM locations WHERE ID_location = %s)
+        """, (location_id,))
+
+
+# ================================= TRAITEMENT PAR LOTS ==========================================
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def resolve_active_loans(book_ids):
+    """Associe chaque livre scanné à une location active (la plus ancienne échéance d'abord)
+
+    Retourne (identifiants de location, livres sans location active). Un livre scanné deux fois
+    est associé à deux locations distinctes.
+    """
+    wanted = Counter(book_ids)
+    if not wanted:
+        return [], []
+    rows = database.run_query(f"""
+        SELECT ID_location, ID_livre FROM locations
+        WHERE ID_livre IN ({_placeholders(wanted)}) AND Statut NOT IN ('Retourné', 'Annulé')
+        ORDER BY Date_retour_prevue, ID_location
+    """, list(wanted), cache=False)
+
+    location_ids = []
+    for row in rows:
+        if wanted[row['ID_livre']] > 0:
+            wanted[row['ID_livre']] -= 1
+            location_ids.append(row['ID_location'])
+    unmatched = [book_id for book_id, missing in wanted.items() for _ in range(missing)]
+    return location_ids, unmatched
+
+
+@database.retry_on_deadlock
+def batch_return(location_ids, return_date=None):
+    """Retourne un lot de locations en une transaction avec des UPDATE ensemblistes
+
+    Retourne (locations retournées, locations refusées car inconnues ou déjà retournées).
+    """
+    return_date = return_date or date.today()
+    location_ids = list(dict.fromkeys(location_ids))
+    if not location_ids:
+        return [], []
+
+    with database.transaction() as cursor:
+        cursor.execute(f"""
+            SELECT ID_location, ID_livre FROM locations
+            WHERE ID_location IN ({_placeholders(location_ids)}) AND Statut NOT IN ('Retourné', 'Annulé')
+            FOR UPDATE
+        """, location_ids)
+        book_ids = {row['ID_location']: row['ID_livre'] for row in cursor.fetchall()}
+        active = list(book_ids)
+        active_set = set(active)
+        rejected = [location_id for location_id in location_ids if location_id not in active_set]
+        if not active:
+            return [], rejected
+
+        cursor.execute(f"""
+            UPDATE locations SET Statut = 'Retourné', Date_retour_effective = %s
+            WHERE ID_location IN ({_placeholders(active)})
+        """, [return_date] + active)
+        rollups.record_returns(cursor, active, return_date)
+        returns = Counter(book_ids[location_id] for location_id in active)
+        cases = ' '.join(['WHEN %s THEN %s'] * len(returns))
+        cursor.execute(f"""
+            UPDATE livres SET Quantite_disponible = Quantite_disponible + CASE ID_livre {cases} END
+            WHERE ID_livre IN ({_placeholders(returns)})
+        """, [value for item in returns.items() for value in item] + list(returns))
+    return active, rejected
+
+
+@database.retry_on_deadlock
+def batch_checkout(book_ids, student_id, loan_date, due_date, status="En cours"):
+    """Emprunte un lot de livres pour un étudiant en une transaction
+
+    Les livres dont il ne reste pas assez d'exemplaires sont refusés, les autres sont prêtés.
+    Retourne (livres prêtés, livres refusés).
+    """
+    wanted = Counter(book_ids)
+    if not wanted:
+        return [], []
+
+    with database.transaction() as cursor:
+        # Verrouille les livres concernés : le stock lu reste valable jusqu'au commit
+        cursor.execute(f"""
+            SELECT ID_livre, Quantite_disponible FROM livres
+            WHERE ID_livre IN ({_placeholders(wanted)})
+            FOR UPDATE
+        """, list(wanted))
+        stock = {row['ID_livre']: int(row['Quantite_disponible'] or 0) for row in cursor.fetchall()}
+
+        granted = {book_id: min(count, stock.get(book_id, 0)) for book_id, count in wanted.items()}
+        granted = {book_id: count for book_id, count in granted.items() if count > 0}
+        rejected = [book_id for book_id, count in wanted.items()
+                    for _ in range(count - granted.get(book_id, 0))]
+        if not granted:
+            return [], rejected
+
+        cases = ' '.join(['WHEN %s THEN %s'] * len(granted))
+        cursor.execute(f"""
+            UPDATE livres SET Quantite_disponible = Quantite_disponible - CASE ID_livre {cases} END
+            WHERE ID_livre IN ({_placeholders(granted)})
+        """, [value for item in granted.items() for value in item] + list(granted))
+
+        loans = [(book_id, student_id, loan_date, due_date, status)
+                 for book_id, count in granted.items() for _ in range(count)]
+        cursor.executemany("""
+            INSERT INTO locations (ID_livre, ID_etudiant, Date_location, Date_retour_prevue, Statut)
+            VALUES (%s, %s, %s, %s, %s)
+        """, loans)
+        rollups.record_loans(cursor, granted, loan_date)
+
+    lent = [book_id for book_id, _, _, _, _ in loans]
+    return lent, rejected
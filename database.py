@@ -0,0 +1,719 @@
+import functools
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
+from mysql.connector import FieldType, errorcode
+from mysql.connector import errors as mysql_errors
+
+import backends
+import instrumentation
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Moteur et paramètres de connexion : variables BIBLIO_DB_* ou fichier biblio.ini (voir backends.py)
+CONFIG = backends.load_config()
+BACKEND = CONFIG['backend']
+
+DB_CONFIG = {
+    'host': CONFIG['host'],
+    'port': CONFIG['port'],
+    'user': CONFIG['user'],
+    'password': CONFIG['password'],
+    'database': CONFIG['database'],
+    'charset': 'utf8mb4',
+    'autocommit': True
+}
+# Fichier de la base pour le moteur sqlite (':memory:' pour une base en mémoire)
+SQLITE_PATH = CONFIG['path']
+
+# Taille du pool : à dimensionner sur le nombre de bibliothécaires connectés en heure de pointe
+POOL_SIZE = int(os.environ.get('BIBLIO_DB_POOL_SIZE', 5))
+# Temps d'attente maximal (secondes) pour obtenir une connexion quand le pool est saturé
+POOL_TIMEOUT = float(os.environ.get('BIBLIO_DB_POOL_TIMEOUT', 10))
+# Une connexion restée inactive plus longtemps est vérifiée (ping) avant d'être prêtée
+POOL_PING_INTERVAL = float(os.environ.get('BIBLIO_DB_POOL_PING_INTERVAL', 30))
+
+# Cache des résultats de lecture
+CACHE_TTL = float(os.environ.get('BIBLIO_CACHE_TTL', 60))
+CACHE_MAX_ENTRIES = int(os.environ.get('BIBLIO_CACHE_MAX_ENTRIES', 256))
+CACHE_MAX_ROWS = int(os.environ.get('BIBLIO_CACHE_MAX_ROWS', 200000))
+
+# Nouvelles tentatives d'une transaction victime d'un deadlock ou d'un délai de verrou
+TRANSACTION_RETRIES = int(os.environ.get('BIBLIO_TRANSACTION_RETRIES', 3))
+
+# Lectures indépendantes d'une page exécutées en parallèle (au plus une connexion du pool chacune)
+PARALLEL_WORKERS = int(os.environ.get('BIBLIO_PARALLEL_WORKERS', POOL_SIZE))
+# Délai maximal (secondes) d'une lecture parallèle, attente d'un thread libre comprise
+PARALLEL_TIMEOUT = float(os.environ.get('BIBLIO_PARALLEL_TIMEOUT', 15))
+
+
+class PoolTimeoutError(Exception):
+    """Aucune connexion libérée dans le délai imparti"""
+
+
+class QueryTimeoutError(Exception):
+    """Lecture parallèle non terminée dans le délai imparti"""
+
+
+def convert_decimal(value):
+    """Convertit les valeurs Decimal en int ou float"""
+    if isinstance(value, Decimal):
+        return int(value) if value % 1 == 0 else float(value)
+    return value
+
+
+# ================================= POOL DE CONNEXIONS ==========================================
+
+class ConnectionPool:
+    """Pool de connexions partagé par tout le processus"""
+
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, ping_interval=POOL_PING_INTERVAL, connect=None):
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._connect_func = connect or connect_database
+        self._cond = threading.Condition()
+        self._idle = []  # (connexion, instant de restitution), utilisé en LIFO
+        self._created = 0
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'max_wait': 0.0,
+            'timeouts': 0,
+            'reconnects': 0,
+            'discarded': 0
+        }
+
+    def _connect(self):
+        return self._connect_func()
+
+    def _check_health(self, connection, idle_since):
+        """Vérifie une connexion inactive et la remplace si elle est morte"""
+        if time.monotonic() - idle_since < self.ping_interval:
+            return connection
+        try:
+            connection.ping(reconnect=True, attempts=2, delay=0)
+            return connection
+        except backends.ERRORS:
+            with self._cond:
+                self._stats['reconnects'] += 1
+            try:
+                connection.close()
+            except backends.ERRORS:
+                pass
+            return self._connect()
+
+    def acquire(self):
+        """Emprunte une connexion, en attendant qu'une se libère si le pool est plein"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    connection, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Pool saturé: aucune connexion libre après {self.timeout:.1f}s ({self.size} connexions)")
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += wait_time
+                self._stats['max_wait'] = max(self._stats['max_wait'], wait_time)
+
+        try:
+            if connection is None:
+                connection = self._connect()
+            else:
+                connection = self._check_health(connection, idle_since)
+            instrumentation.note(acquire_ms=(time.monotonic() - start) * 1000)
+            return connection
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connection, discard=False):
+        """Restitue une connexion au pool (ou la ferme si elle est inutilisable)"""
+        if connection is not None and not discard:
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except backends.ERRORS:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if connection is None or discard:
+                self._created -= 1
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+        if connection is not None and discard:
+            try:
+                connection.close()
+            except backends.ERRORS:
+                pass
+
+    def stats(self):
+        """Statistiques d'utilisation du pool"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'created': self._created,
+                'in_use': self._in_use,
+                'idle': len(self._idle)
+            })
+        stats['avg_wait'] = stats['wait_time'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+    def close(self):
+        """Ferme toutes les connexions inactives"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except backends.ERRORS:
+                pass
+
+
+def connect_database():
+    """Ouvre une connexion sur le moteur configuré (mysql ou sqlite)"""
+    if BACKEND == 'sqlite':
+        return backends.connect_sqlite(SQLITE_PATH, timeout=POOL_TIMEOUT)
+    return backends.connect_mysql(DB_CONFIG)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Retourne le pool du processus (créé au premier appel)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def table_exists(cursor, table):
+    """Indique si la table existe dans la base courante (nom insensible à la casse)"""
+    if BACKEND == 'sqlite':
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND LOWER(name) = LOWER(%s)",
+                       (table,))
+    else:
+        cursor.execute("""SELECT COUNT(*) FROM information_schema.tables
+                          WHERE table_schema = DATABASE() AND LOWER(table_name) = LOWER(%s)""", (table,))
+    return cursor.fetchone()[0] > 0
+
+
+def is_connection_error(error):
+    """Indique si l'erreur laisse la connexion dans un état inutilisable"""
+    return isinstance(error, (mysql_errors.OperationalError, mysql_errors.InterfaceError,
+                              sqlite3.InterfaceError, sqlite3.ProgrammingError))
+
+
+@contextmanager
+def pooled_connection():
+    """Emprunte une connexion du pool pour la durée du bloc"""
+    pool = get_pool()
+    connection = pool.acquire()
+    discard = False
+    try:
+        yield connection
+    except Exception as e:
+        discard = is_connection_error(e)
+        raise
+    finally:
+        pool.release(connection, discard=discard)
+
+
+# ================================= CACHE DES REQUÊTES ==========================================
+
+_READ_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+`?([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+_WRITE_TABLE_RE = re.compile(
+    r'\b(?:UPDATE|INTO|DELETE\s+FROM|TRUNCATE(?:\s+TABLE)?|(?:ALTER|DROP|CREATE)\s+TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)'
+    r'\s+`?([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(query):
+    """Normalise une requête (espaces) pour servir de clé de cache"""
+    return _WHITESPACE_RE.sub(' ', query).strip()
+
+
+def tables_read(query):
+    """Tables lues par une requête SELECT"""
+    return frozenset(name.lower() for name in _READ_TABLE_RE.findall(query))
+
+
+def tables_written(query):
+    """Tables modifiées par une requête d'écriture"""
+    return frozenset(name.lower() for name in _WRITE_TABLE_RE.findall(query))
+
+
+def _freeze(params):
+    """Rend les paramètres utilisables comme clé de dictionnaire"""
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted((key, _freeze(value)) for key, value in params.items()))
+    if isinstance(params, (list, tuple, set)):
+        return tuple(_freeze(value) for value in params)
+    return params
+
+
+def _copy_result(result):
+    """Les pages modifient les résultats reçus : on ne partage jamais les objets du cache"""
+    if isinstance(result, pd.DataFrame):
+        return result.copy()
+    return [dict(row) for row in result]
+
+
+class QueryCache:
+    """Cache LRU des résultats de lecture, avec TTL et invalidation par table"""
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_rows=CACHE_MAX_ROWS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # clé -> (expiration, tables, lignes)
+        self._rows = 0
+        # Compteur d'écritures par table : une lecture commencée avant une écriture n'est pas mise en cache
+        self._generations = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    @staticmethod
+    def make_key(query, params):
+        return normalize_sql(query), _freeze(params)
+
+    def generation(self, tables):
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    def get(self, key):
+        """Retourne une copie du résultat en cache, ou None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires, _, rows = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+        return _copy_result(rows)
+
+    def put(self, key, tables, rows, generation):
+        """Stocke un résultat si aucune écriture n'a eu lieu pendant la lecture"""
+        if self.ttl <= 0 or len(rows) > self.max_rows:
+            return
+        stored = _copy_result(rows)
+        with self._lock:
+            if tuple(self._generations.get(table, 0) for table in sorted(tables)) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tables, stored)
+            self._rows += len(stored)
+            while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def invalidate(self, tables=None):
+        """Supprime les entrées dépendant des tables données (toutes si None)"""
+        with self._lock:
+            if tables is None:
+                tables = set(self._generations)
+                for _, entry_tables, _ in self._entries.values():
+                    tables.update(entry_tables)
+                stale = list(self._entries)
+            else:
+                stale = [key for key, (_, entry_tables, _) in self._entries.items() if entry_tables & tables]
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            for key in stale:
+                self._remove(key)
+            self._stats['invalidations'] += len(stale)
+
+    def _remove(self, key):
+        _, _, rows = self._entries.pop(key)
+        self._rows -= len(rows)
+
+    def stats(self):
+        """Compteurs du cache"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'entries': len(self._entries), 'rows': self._rows})
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+query_cache = QueryCache()
+
+
+# ================================= EXÉCUTION DES REQUÊTES ==========================================
+
+_write_listeners = []
+
+
+def add_write_listener(listener):
+    """Appelle `listener(tables)` après chaque écriture validée (tables modifiées, None si inconnues)"""
+    _write_listeners.append(listener)
+
+
+def notify_write(tables):
+    """Invalide le cache et prévient les abonnés d'une écriture sur `tables`"""
+    query_cache.invalidate(tables)
+    for listener in list(_write_listeners):
+        listener(tables)
+
+
+def run_query(query, params=None, fetch=True, cache=True):
+    """Exécute une requête SQL sur une connexion du pool (lève les exceptions)"""
+    if fetch and cache:
+        key = query_cache.make_key(query, params)
+        cached = query_cache.get(key)
+        if cached is not None:
+            instrumentation.note(cached=True)
+            return cached
+        tables = tables_read(query)
+        generation = query_cache.generation(tables)
+        result = _execute(query, params, fetch)
+        query_cache.put(key, tables, result, generation)
+        return result
+
+    result = _execute(query, params, fetch)
+    if not fetch:
+        notify_write(tables_written(query) or None)
+    return result
+
+
+def _execute(query, params, fetch):
+    with pooled_connection() as connection:
+        cursor = connection.cursor(dictionary=True, buffered=True)
+        try:
+            cursor.execute(query, params or ())
+
+            if fetch:
+                result = cursor.fetchall()
+                # Convertir les Decimal en types natifs Python
+                for row in result:
+                    for key, value in row.items():
+                        row[key] = convert_decimal(value)
+                return result
+            else:
+                connection.commit()
+                return True
+        finally:
+            cursor.close()
+
+
+# ================================= LECTURE EN COLONNES ==========================================
+
+_INTEGER_TYPES = (FieldType.TINY, FieldType.SHORT, FieldType.INT24, FieldType.LONG, FieldType.LONGLONG, FieldType.YEAR)
+_DECIMAL_TYPES = (FieldType.DECIMAL, FieldType.NEWDECIMAL)
+
+# Types pandas des colonnes Arrow : entiers nullables, dates affichées sans heure
+_PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.date32(): pd.ArrowDtype(pa.date32())
+}
+
+
+def arrow_type(type_code):
+    """Type Arrow correspondant au type MySQL d'une colonne (cursor.description), None si inconnu (SQLite)"""
+    if type_code is None:
+        return None
+    if type_code in _INTEGER_TYPES:
+        return pa.int64()
+    if type_code in (FieldType.FLOAT, FieldType.DOUBLE) + _DECIMAL_TYPES:
+        return pa.float64()
+    if type_code == FieldType.DATE:
+        return pa.date32()
+    if type_code in (FieldType.DATETIME, FieldType.TIMESTAMP):
+        return pa.timestamp('us')
+    return pa.string()
+
+
+def declared_arrow_type(declared):
+    """Type Arrow d'un type déclaré SQLite (règles d'affinité), None pour une expression sans type"""
+    declared = (declared or '').upper()
+    if not declared:
+        return None
+    if declared == 'DATE':
+        return pa.date32()
+    if declared in ('DATETIME', 'TIMESTAMP'):
+        return pa.timestamp('us')
+    if 'INT' in declared:
+        return pa.int64()
+    if any(name in declared for name in ('CHAR', 'CLOB', 'TEXT')):
+        return pa.string()
+    return pa.float64()
+
+
+def sqlite_column_types(query):
+    """Types Arrow des colonnes d'une requête SQLite, d'après le schéma (None pour une expression)
+
+    Le curseur SQLite ne donne pas les types des colonnes : la requête est déclarée en vue temporaire,
+    sans l'exécuter, et les types déclarés des colonnes sources sont lus par PRAGMA table_info.
+    """
+    with pooled_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            # Paramètres remplacés par NULL : les types ne dépendent pas de leurs valeurs
+            cursor.execute("DROP VIEW IF EXISTS temp.biblio_column_types")
+            cursor.execute("CREATE TEMP VIEW biblio_column_types AS " + query.replace('%s', 'NULL'))
+            try:
+                cursor.execute("PRAGMA table_info(biblio_column_types)")
+                return [declared_arrow_type(row[2]) for row in cursor.fetchall()]
+            finally:
+                cursor.execute("DROP VIEW temp.biblio_column_types")
+        finally:
+            cursor.close()
+
+
+def arrow_column(values, type_code):
+    """Construit une colonne Arrow typée (conversion vectorisée, sans boucle Python par valeur)"""
+    if type_code in _DECIMAL_TYPES:
+        # DECIMAL entier (COUNT, SUM d'entiers) -> int64, sinon float64
+        array = pa.array(values)
+        if pa.types.is_decimal(array.type) and array.type.scale == 0:
+            return array.cast(pa.int64())
+        return array.cast(pa.float64())
+    try:
+        return pa.array(values, type=arrow_type(type_code))
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array(values)
+
+
+def rows_to_dataframe(description, rows):
+    """Assemble un DataFrame typé à partir des tuples d'un curseur"""
+    names = [column[0] for column in description]
+    columns = list(zip(*rows)) if rows else [()] * len(names)
+    arrays = [arrow_column(list(values), column[1]) for values, column in zip(columns, description)]
+    return arrow_to_pandas(pa.Table.from_arrays(arrays, names=names))
+
+
+def arrow_to_pandas(table):
+    """DataFrame d'une table Arrow avec les types de l'application (entiers nullables, dates sans heure)"""
+    return table.to_pandas(types_mapper=_PANDAS_TYPES.get)
+
+
+def run_query_df(query, params=None, cache=True):
+    """Exécute une requête de lecture et retourne directement un DataFrame aux colonnes typées"""
+    if cache:
+        key = ('dataframe',) + query_cache.make_key(query, params)
+        cached = query_cache.get(key)
+        if cached is not None:
+            instrumentation.note(cached=True)
+            return cached
+        tables = tables_read(query)
+        generation = query_cache.generation(tables)
+
+    with pooled_connection() as connection:
+        cursor = connection.cursor(buffered=True)
+        try:
+            cursor.execute(query, params or ())
+            df = rows_to_dataframe(cursor.description, cursor.fetchall())
+        finally:
+            cursor.close()
+
+    if cache:
+        query_cache.put(key, tables, df, generation)
+    return df
+
+
+# ================================= LECTURE EN FLUX ==========================================
+
+STREAM_CHUNK_SIZE = 5000
+
+
+def stream_query(query, params=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Parcourt un résultat par blocs via un curseur non bufferisé (mémoire constante)
+
+    Le premier élément produit est la description des colonnes (cursor.description), puis des listes
+    de tuples d'au plus `chunk_size` lignes. Le résultat ne passe pas par le cache.
+    """
+    pool = get_pool()
+    connection = pool.acquire()
+    cursor = None
+    exhausted = False
+    write_timeout = None
+    try:
+        if BACKEND == 'mysql':
+            # Un export lent côté client ne doit pas être coupé par le serveur ; valeur rétablie ensuite
+            with connection.cursor() as session:
+                session.execute("SELECT @@SESSION.net_write_timeout")
+                write_timeout = session.fetchall()[0][0]
+                session.execute("SET SESSION net_write_timeout = 3600")
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(query, params or ())
+        yield cursor.description
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+        exhausted = True
+    finally:
+        # Un curseur non bufferisé interrompu laisse des lignes non lues : la connexion est abandonnée
+        discard = not exhausted
+        if cursor is not None and exhausted:
+            cursor.close()
+        if write_timeout is not None and not discard:
+            # La connexion retourne au pool avec le délai habituel, sinon elle est abandonnée
+            try:
+                with connection.cursor() as session:
+                    session.execute("SET SESSION net_write_timeout = %s", (write_timeout,))
+            except Exception:
+                discard = True
+        pool.release(connection, discard=discard)
+
+
+# ================================= EXÉCUTION PARALLÈLE ==========================================
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Threads partagés par le processus pour les lectures parallèles"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(PARALLEL_WORKERS, 1), thread_name_prefix='biblio-query')
+    return _executor
+
+
+def run_parallel(tasks, timeout=PARALLEL_TIMEOUT):
+    """Exécute des lectures indépendantes en parallèle ; retourne (résultats, erreurs)
+
+    `tasks` associe une clé à une fonction sans argument. Une fonction qui échoue ou dépasse
+    `timeout` secondes figure dans `erreurs` (clé -> exception) sans retarder ni empêcher les
+    autres : la durée totale est celle de la plus lente, bornée par `timeout`. Une requête
+    abandonnée se termine en arrière-plan puis rend sa connexion au pool.
+    """
+    parent = instrumentation.recorder.current()
+
+    def call(func):
+        # Les requêtes du thread sont comptées dans l'appel (page) qui les a lancées
+        with instrumentation.recorder.attached(parent):
+            return func()
+
+    executor = get_executor()
+    futures = {key: executor.submit(call, func) for key, func in tasks.items()}
+    wait(futures.values(), timeout=timeout)
+
+    results, errors = {}, {}
+    for key, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[key] = QueryTimeoutError(f"Lecture « {key} » interrompue après {timeout:g} s")
+        elif future.exception() is not None:
+            errors[key] = future.exception()
+        else:
+            results[key] = future.result()
+    return results, errors
+
+
+# ================================= TRANSACTIONS ==========================================
+
+class _TrackingCursor:
+    """Curseur qui retient les tables modifiées pour invalider le cache au commit"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.written = set()
+
+    def execute(self, query, params=None):
+        self.written |= tables_written(query)
+        return self._cursor.execute(query, params or ())
+
+    def executemany(self, query, seq_params):
+        self.written |= tables_written(query)
+        return self._cursor.executemany(query, seq_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@contextmanager
+def transaction():
+    """Exécute un bloc d'écritures dans une seule transaction, sur une seule connexion du pool"""
+    with pooled_connection() as connection:
+        connection.start_transaction()
+        cursor = _TrackingCursor(connection.cursor(dictionary=True, buffered=True))
+        try:
+            yield cursor
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        notify_write(frozenset(cursor.written))
+
+
+def is_retryable_error(error):
+    """Deadlock ou attente de verrou expirée : la transaction peut être rejouée"""
+    if isinstance(error, sqlite3.OperationalError):
+        # Base verrouillée par un autre écrivain au-delà du délai d'attente
+        return 'locked' in str(error) or 'busy' in str(error)
+    return isinstance(error, mysql_errors.DatabaseError) and error.errno in (
+        errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT)
+
+
+def retry_on_deadlock(func):
+    """Rejoue une fonction transactionnelle en cas de deadlock (attente exponentielle avec gigue)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(TRANSACTION_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt == TRANSACTION_RETRIES or not is_retryable_error(e):
+                    raise
+                time.sleep(0.02 * (2 ** attempt) * (1 + random.random()))
+    return wrapper
@@ -0,0 +1,203 @@
+import argparse
+import csv
+import gzip
+import io
+import os
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+EXPORT_DIR = os.environ.get('BIBLIO_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+# Taille maximale (Mo) d'un export proposé au téléchargement dans l'application (au-delà : chemin sur le serveur)
+DOWNLOAD_MAX_MB = float(os.environ.get('BIBLIO_EXPORT_DOWNLOAD_MAX_MB', 50))
+# Durée de conservation (heures) des exports du dossier d'exports
+RETENTION_HOURS = float(os.environ.get('BIBLIO_EXPORT_RETENTION_HOURS', 24))
+
+FORMATS = {
+    'csv': '.csv',
+    'csv.gz': '.csv.gz',
+    'parquet': '.parquet'
+}
+
+HISTORY_QUERY = """
+    SELECT loc.ID_location, loc.ID_livre, l.Titre, l.Auteur, loc.ID_etudiant, u.nom, u.prenom,
+           loc.Date_location, loc.Date_retour_prevue, loc.Date_retour_effective, loc.Statut
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    WHERE loc.Date_location BETWEEN %s AND %s
+    ORDER BY loc.Date_location, loc.ID_location
+"""
+
+OVERDUE_QUERY = """
+    SELECT loc.ID_location, u.nom, u.prenom, u.mail, l.Titre, loc.Date_location, loc.Date_retour_prevue,
+           DATEDIFF(CURDATE(), loc.Date_retour_prevue) as jours_retard
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    WHERE loc.Date_retour_prevue < CURDATE()
+    AND loc.Statut NOT IN ('Retourné', 'Annulé')
+    ORDER BY jours_retard DESC
+"""
+
+
+# ================================= ÉCRITURE EN FLUX ==========================================
+
+def _csv_value(value):
+    if isinstance(value, Decimal):
+        return database.convert_decimal(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def write_csv(query, params, output, compress=False, chunk_size=database.STREAM_CHUNK_SIZE):
+    """Écrit le résultat en CSV (éventuellement gzip) dans un flux binaire ; retourne le nombre de lignes"""
+    raw = gzip.GzipFile(fileobj=output, mode='wb') if compress else output
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    count = 0
+    try:
+        stream = database.stream_query(query, params, chunk_size)
+        description = next(stream)
+        writer.writerow([column[0] for column in description])
+        for rows in stream:
+            writer.writerows([_csv_value(value) for value in row] for row in rows)
+            count += len(rows)
+        text.flush()
+    finally:
+        # Détache le wrapper texte pour ne pas fermer le flux de l'appelant
+        text.detach()
+        if compress:
+            raw.close()
+    return count
+
+
+def _parquet_schema(description, columns, declared=None):
+    """Schéma Arrow des colonnes
+
+    Sous SQLite, le curseur ne donne pas les types : ceux du schéma (`declared`) sont utilisés, et
+    ceux des expressions sont déduits du premier bloc puis élargis (un entier peut être suivi d'un réel
+    dans un bloc suivant, une colonne vide devient du texte).
+    """
+    import pyarrow as pa
+
+    fields = []
+    for index, column in enumerate(description):
+        field_type = database.arrow_type(column[1])
+        if field_type is None and declared:
+            field_type = declared[index]
+        if field_type is None and columns:
+            field_type = pa.array(columns[index]).type
+            if pa.types.is_integer(field_type):
+                field_type = pa.float64()
+        if field_type is None or pa.types.is_null(field_type):
+            field_type = pa.string()
+        fields.append((column[0], field_type))
+    return pa.schema(fields)
+
+
+def write_parquet(query, params, output, chunk_size=database.STREAM_CHUNK_SIZE):
+    """Écrit le résultat en Parquet, un groupe de lignes par bloc lu ; retourne le nombre de lignes"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    declared = database.sqlite_column_types(query) if database.BACKEND == 'sqlite' else None
+    stream = database.stream_query(query, params, chunk_size)
+    description = next(stream)
+    writer = None
+    count = 0
+    try:
+        for rows in stream:
+            columns = list(zip(*rows))
+            if writer is None:
+                writer = pq.ParquetWriter(output, _parquet_schema(description, columns, declared),
+                                          compression='snappy')
+            arrays = []
+            for field, values in zip(writer.schema, columns):
+                if pa.types.is_floating(field.type):
+                    values = [None if value is None else float(value) for value in values]
+                elif pa.types.is_string(field.type):
+                    values = [None if value is None else str(_csv_value(value)) for value in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=writer.schema))
+            count += len(rows)
+        if writer is None:
+            # Résultat vide : fichier Parquet avec le seul schéma
+            writer = pq.ParquetWriter(output, _parquet_schema(description, [], declared), compression='snappy')
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def export_to_file(query, params, path, fmt):
+    """Exporte une requête vers un fichier au format csv, csv.gz ou parquet ; retourne le nombre de lignes"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu: {fmt}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as output:
+        if fmt == 'parquet':
+            return write_parquet(query, params, output)
+        return write_csv(query, params, output, compress=(fmt == 'csv.gz'))
+
+
+def export_path(name, fmt):
+    """Chemin horodaté d'un export dans le dossier d'exports"""
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(EXPORT_DIR, f"{name}_{stamp}{FORMATS[fmt]}")
+
+
+def purge_exports(max_age_hours=RETENTION_HOURS):
+    """Supprime les exports plus anciens que `max_age_hours` ; retourne le nombre de fichiers supprimés"""
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if entry.is_file() and entry.name.endswith(tuple(FORMATS.values())):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                # Supprimé entre-temps par un autre processus
+                pass
+    return removed
+
+
+def main(argv):
+    """Point d'entrée : `python export.py historique|retards [options]`"""
+    parser = argparse.ArgumentParser(description="Export en flux de l'historique et des retards")
+    parser.add_argument('report', choices=['historique', 'retards'])
+    parser.add_argument('--since', type=date.fromisoformat, default=date(1900, 1, 1),
+                        help="Premier jour de l'historique (AAAA-MM-JJ)")
+    parser.add_argument('--until', type=date.fromisoformat, default=date.today(),
+                        help="Dernier jour de l'historique (AAAA-MM-JJ)")
+    parser.add_argument('--format', choices=list(FORMATS), default='csv.gz')
+    parser.add_argument('--output', help="Fichier de sortie (par défaut dans le dossier d'exports)")
+    args = parser.parse_args(argv[1:])
+
+    if args.report == 'historique':
+        query, params = HISTORY_QUERY, (args.since, args.until)
+    else:
+        query, params = OVERDUE_QUERY, ()
+    if not args.output:
+        purge_exports()
+    path = args.output or export_path(args.report, args.format)
+
+    count = export_to_file(query, params, path, args.format)
+    print(f"{count} ligne(s) exportée(s) vers {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
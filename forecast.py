@@ -0,0 +1,250 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+FORECAST_DIR = os.environ.get('BIBLIO_FORECAST_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forecasts'))
+FORECAST_FILE = 'prevision.parquet'
+# Semaines d'historique lues et semaines prévues
+HISTORY_WEEKS = int(os.environ.get('BIBLIO_FORECAST_HISTORY_WEEKS', 156))
+HORIZON_WEEKS = int(os.environ.get('BIBLIO_FORECAST_HORIZON_WEEKS', 12))
+
+SEASONS = 52
+# Pseudo-observations du profil saisonnier du catalogue : un titre peu emprunté en hérite
+SEASONAL_PRIOR = 4.0
+# Lissage circulaire du profil saisonnier (semaines voisines)
+SEASONAL_KERNEL = np.array([1.0, 2.0, 3.0, 2.0, 1.0])
+# Demi-vie (semaines) de la moyenne pondérée donnant le niveau actuel de la demande
+LEVEL_HALF_LIFE = 8
+# Plancher d'un indice saisonnier (une semaine sans aucun emprunt ne divise pas par zéro)
+MIN_SEASONAL_INDEX = 0.05
+# Pseudo-emprunts de la durée moyenne du catalogue dans la durée d'emprunt de chaque titre
+DURATION_PRIOR = 5.0
+# Marge de service sur les emprunts simultanés (quantile 90 % d'une loi de Poisson, approché)
+SERVICE_Z = 1.28
+
+CATALOG_QUERY = """
+    SELECT l.ID_livre, l.Titre, l.Auteur, l.Quantite_disponible, COUNT(loc.ID_location) AS en_cours
+    FROM livres l
+    LEFT JOIN locations loc ON loc.ID_livre = l.ID_livre AND loc.Statut NOT IN ('Retourné', 'Annulé')
+    GROUP BY l.ID_livre, l.Titre, l.Auteur, l.Quantite_disponible
+    ORDER BY l.ID_livre
+"""
+
+LOANS_QUERY = """
+    SELECT ID_livre, Date_location, Date_retour_effective, Date_retour_prevue
+    FROM locations
+    WHERE Statut <> 'Annulé' AND Date_location >= %s AND Date_location < %s
+"""
+
+
+def week_start(day=None):
+    """Lundi de la semaine du jour donné"""
+    day = day or date.today()
+    return day - timedelta(days=day.weekday())
+
+
+def week_of_year(start, weeks):
+    """Semaine de l'année (0 à SEASONS - 1) de chacune des `weeks` semaines commençant le lundi `start`"""
+    days = np.datetime64(start, 'D') + 7 * np.arange(weeks)
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(int)
+    return np.minimum(day_of_year // 7, SEASONS - 1)
+
+
+# ================================= DONNÉES ==========================================
+
+def load_catalog():
+    """Titres du catalogue avec leurs exemplaires (disponibles + en cours de location)"""
+    catalog = database.run_query_df(CATALOG_QUERY, cache=False)
+    catalog['Quantite_disponible'] = catalog['Quantite_disponible'].fillna(0).astype(int)
+    catalog['Exemplaires'] = catalog['Quantite_disponible'] + catalog['en_cours'].astype(int)
+    return catalog
+
+
+def load_weekly_loans(book_ids, start, weeks):
+    """Matrice titres × semaines des emprunts, lue en flux, et durées d'emprunt cumulées par titre
+
+    `book_ids` est trié ; retourne (emprunts, jours d'emprunt, emprunts terminés ou échus).
+    """
+    start = np.datetime64(start, 'D')
+    cells, duration_books, durations = [], [], []
+    stream = database.stream_query(LOANS_QUERY, (start.item(), (start + 7 * weeks).item()))
+    next(stream)
+    for rows in stream:
+        ids, loaned, returned, due = zip(*rows)
+        ids = np.asarray(ids, dtype=np.int64)
+        columns = np.searchsorted(book_ids, ids)
+        known = columns < len(book_ids)
+        known[known] = book_ids[columns[known]] == ids[known]
+        loaned = np.asarray(loaned, dtype='datetime64[D]')
+        week = (loaned - start).astype(int) // 7
+        cells.append(columns[known] * weeks + week[known])
+
+        # Durée d'un emprunt : jusqu'au retour effectif, sinon jusqu'à la date prévue
+        end = np.asarray(returned, dtype='datetime64[D]')
+        end = np.where(np.isnat(end), np.asarray(due, dtype='datetime64[D]'), end)
+        finished = known & ~np.isnat(end)
+        duration_books.append(columns[finished])
+        durations.append(np.maximum((end[finished] - loaned[finished]).astype(int), 1))
+
+    size = len(book_ids)
+    cells = np.concatenate(cells) if cells else np.zeros(0, dtype=np.int64)
+    counts = np.bincount(cells, minlength=size * weeks).reshape(size, weeks).astype(np.float64)
+    duration_books = np.concatenate(duration_books) if duration_books else np.zeros(0, dtype=np.int64)
+    durations = np.concatenate(durations) if durations else np.zeros(0)
+    return (counts, np.bincount(duration_books, weights=durations, minlength=size),
+            np.bincount(duration_books, minlength=size).astype(np.float64))
+
+
+# ================================= PRÉVISION ==========================================
+
+def _smooth(values):
+    """Lissage circulaire sur le dernier axe (semaines de l'année)"""
+    half = len(SEASONAL_KERNEL) // 2
+    smoothed = sum(weight * np.roll(values, shift, axis=-1)
+                   for shift, weight in zip(range(-half, half + 1), SEASONAL_KERNEL))
+    return smoothed / SEASONAL_KERNEL.sum()
+
+
+def seasonal_forecast(counts, seasons, future_seasons, prior=SEASONAL_PRIOR, half_life=LEVEL_HALF_LIFE):
+    """Prévision hebdomadaire de tous les titres à la fois : niveau × indice saisonnier
+
+    `counts` est la matrice titres × semaines, `seasons` la semaine de l'année de chaque colonne
+    et `future_seasons` celle de chaque semaine à prévoir ; retourne la matrice titres × horizon.
+    Le profil saisonnier d'un titre est ramené vers celui du catalogue en proportion de ses
+    emprunts ; le niveau est la demande désaisonnalisée, moyennée avec une décroissance exponentielle.
+    """
+    weeks = counts.shape[1]
+    onehot = np.zeros((weeks, SEASONS))
+    onehot[np.arange(weeks), seasons] = 1.0
+    occurrences = onehot.sum(axis=0)
+
+    # Profil du catalogue (moyenne 1 sur les semaines observées)
+    observed_total = _smooth(counts.sum(axis=0) @ onehot)
+    expected_total = _smooth(counts.sum() / weeks * occurrences)
+    catalog = np.where(expected_total > 0, observed_total / np.maximum(expected_total, 1e-12), 1.0)
+
+    # Profil de chaque titre : emprunts observés par semaine de l'année rapportés aux emprunts attendus
+    observed = _smooth(counts @ onehot)
+    expected = _smooth(counts.mean(axis=1, keepdims=True) * occurrences)
+    profile = (observed + prior * catalog) / (expected + prior)
+    profile /= (profile @ occurrences / occurrences.sum())[:, None]
+    profile = np.maximum(profile, MIN_SEASONAL_INDEX)
+
+    weights = 0.5 ** ((weeks - 1 - np.arange(weeks)) / half_life)
+    level = (counts / profile[:, seasons]) @ weights / weights.sum()
+    return level[:, None] * profile[:, future_seasons]
+
+
+def copy_recommendations(today=None, horizon=HORIZON_WEEKS, history_weeks=HISTORY_WEEKS):
+    """Demande prévue et exemplaires recommandés pour tout le catalogue (DataFrame, manques d'abord)"""
+    catalog = load_catalog()
+    book_ids = catalog['ID_livre'].to_numpy(np.int64)
+    # La semaine en cours, incomplète, n'entre pas dans l'historique
+    end = week_start(today)
+    start = end - timedelta(weeks=history_weeks)
+    counts, durations, finished = load_weekly_loans(book_ids, start, history_weeks)
+    demand = seasonal_forecast(counts, week_of_year(start, history_weeks), week_of_year(end, horizon))
+
+    peak_week = demand.argmax(axis=1)
+    peak = demand[np.arange(len(demand)), peak_week]
+    # Durée moyenne d'emprunt, ramenée vers celle du catalogue pour les titres peu empruntés
+    catalog_duration = durations.sum() / finished.sum() if finished.sum() else 14.0
+    duration = (durations + DURATION_PRIOR * catalog_duration) / (finished + DURATION_PRIOR)
+    # Emprunts simultanés au pic (loi de Little) et exemplaires couvrant les variations de la demande
+    concurrent = peak * duration / 7
+    needed = np.ceil(concurrent + SERVICE_Z * np.sqrt(concurrent)).astype(int)
+
+    result = catalog[['ID_livre', 'Titre', 'Auteur', 'Exemplaires']].assign(
+        Emprunts_12_semaines=counts[:, -12:].sum(axis=1).astype(int),
+        Demande_pic=peak.round(2),
+        Semaine_pic=pd.to_datetime(np.datetime64(end, 'D') + 7 * peak_week),
+        Duree_moyenne_jours=duration.round(1),
+        Emprunts_simultanes_pic=concurrent.round(1),
+        Exemplaires_recommandes=needed,
+        Manque=np.maximum(needed - catalog['Exemplaires'].to_numpy(), 0))
+    return result.sort_values(['Manque', 'Demande_pic'], ascending=False, ignore_index=True)
+
+
+# ================================= RÉSULTATS ==========================================
+
+_cached = (None, None)  # (date de modification du fichier, DataFrame)
+_cached_lock = threading.Lock()
+
+
+def forecast_path():
+    return os.path.join(FORECAST_DIR, FORECAST_FILE)
+
+
+def save_forecast(result):
+    """Enregistre la prévision (remplacement atomique du fichier lu par l'application)"""
+    os.makedirs(FORECAST_DIR, exist_ok=True)
+    path = forecast_path()
+    result.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def load_forecast():
+    """Dernière prévision enregistrée et sa date de calcul, ou (None, None)"""
+    global _cached
+    try:
+        modified = os.path.getmtime(forecast_path())
+    except OSError:
+        return None, None
+    with _cached_lock:
+        if _cached[0] != modified:
+            _cached = (modified, pd.read_parquet(forecast_path()))
+        return _cached[1], datetime.fromtimestamp(modified)
+
+
+def run(horizon=HORIZON_WEEKS, history_weeks=HISTORY_WEEKS):
+    """Calcule et enregistre la prévision ; retourne (résultat, secondes)"""
+    started = time.perf_counter()
+    result = copy_recommendations(horizon=horizon, history_weeks=history_weeks)
+    save_forecast(result)
+    return result, time.perf_counter() - started
+
+
+def main(argv):
+    """Point d'entrée : `python forecast.py run|show` (run : tâche nocturne)"""
+    parser = argparse.ArgumentParser(description="Prévision de la demande et exemplaires recommandés")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Calcule et enregistre la prévision")
+    run_parser.add_argument('--horizon', type=int, default=HORIZON_WEEKS, help="Semaines prévues")
+    run_parser.add_argument('--history', type=int, default=HISTORY_WEEKS, help="Semaines d'historique")
+
+    show_parser = subparsers.add_parser('show', help="Affiche les titres en manque d'exemplaires")
+    show_parser.add_argument('--limit', type=int, default=20)
+
+    args = parser.parse_args(argv[1:])
+    if args.command == 'run':
+        result, seconds = run(args.horizon, args.history)
+        print(f"{len(result)} titre(s) en {seconds:.1f} s, {int((result['Manque'] > 0).sum())} en manque "
+              f"d'exemplaires ({int(result['Manque'].sum())} au total) -> {forecast_path()}")
+        return 0
+
+    result, computed_at = load_forecast()
+    if result is None:
+        print("Aucune prévision : lancer `python forecast.py run`")
+        return 1
+    print(f"Prévision du {computed_at:%d/%m/%Y %H:%M}")
+    shortfall = result[result['Manque'] > 0].head(args.limit)
+    print(shortfall[['ID_livre', 'Titre', 'Exemplaires', 'Exemplaires_recommandes', 'Manque',
+                     'Semaine_pic']].to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
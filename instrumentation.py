@@ -0,0 +1,179 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Nombre d'appels conservés en mémoire (les plus anciens sont oubliés)
+BUFFER_SIZE = int(os.environ.get('BIBLIO_PERF_BUFFER_SIZE', 5000))
+# Au-delà de cette durée (ms), un appel est journalisé et gardé dans la liste des appels lents
+SLOW_THRESHOLD_MS = float(os.environ.get('BIBLIO_PERF_SLOW_MS', 500))
+# Fichier JSON lines recevant chaque appel (vide : pas d'écriture sur disque)
+LOG_PATH = os.environ.get('BIBLIO_PERF_LOG', '')
+
+logger = logging.getLogger('biblio.perf')
+
+
+# ================================= ENREGISTREMENT ==========================================
+
+class Recorder:
+    """Tampon circulaire des durées d'appels (requêtes, pages, authentification), partagé par le processus"""
+
+    def __init__(self, size=BUFFER_SIZE, slow_threshold_ms=SLOW_THRESHOLD_MS, log_path=LOG_PATH):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.log_path = log_path
+        self._events = deque(maxlen=max(int(size), 1))
+        self._slow = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def timed(self, kind, name):
+        """Mesure le bloc ; le dictionnaire fourni peut recevoir des champs (ex. `rows`)"""
+        event = {'kind': kind, 'name': name, 'rows': None, 'acquire_ms': 0.0, 'queries': 0, 'cached': False,
+                 'error': None}
+        stack = self._stack()
+        if stack and kind == 'query':
+            # L'appel parent peut être partagé avec d'autres threads (voir `attached`)
+            with self._lock:
+                stack[-1]['queries'] += 1
+        stack.append(event)
+        started = time.perf_counter()
+        try:
+            yield event
+        except Exception as e:
+            event['error'] = type(e).__name__
+            raise
+        finally:
+            event['duration_ms'] = (time.perf_counter() - started) * 1000
+            stack.pop()
+            if stack:
+                # Le temps d'attente du pool d'un appel imbriqué compte aussi pour la page
+                with self._lock:
+                    stack[-1]['acquire_ms'] += event['acquire_ms']
+            self.record(event)
+
+    def current(self):
+        """Appel en cours du thread (None hors d'un bloc `timed`)"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def attached(self, event):
+        """Rattache les appels du bloc à `event`, ouvert dans un autre thread (lectures parallèles)"""
+        if event is None:
+            yield
+            return
+        stack = self._stack()
+        stack.append(event)
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def note(self, **fields):
+        """Complète l'appel en cours du thread (sans effet hors d'un bloc `timed`) ; les durées s'additionnent"""
+        stack = self._stack()
+        if not stack:
+            return
+        event = stack[-1]
+        for key, value in fields.items():
+            if key.endswith('_ms'):
+                event[key] = event.get(key, 0.0) + value
+            else:
+                event[key] = value
+
+    def record(self, event):
+        """Ajoute un appel terminé au tampon"""
+        event = dict(event, at=datetime.now().isoformat(timespec='milliseconds'))
+        slow = event['duration_ms'] >= self.slow_threshold_ms
+        with self._lock:
+            self._events.append(event)
+            if slow:
+                self._slow.append(event)
+        if slow:
+            logger.warning("Appel lent (%s) %.0f ms : %s", event['kind'], event['duration_ms'], event['name'][:200])
+        if self.log_path:
+            try:
+                with self._lock, open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            except OSError as e:
+                logger.error("Écriture du journal de performance impossible: %s", e)
+
+    def events(self, kind=None):
+        """DataFrame des appels conservés (du plus ancien au plus récent)"""
+        with self._lock:
+            events = list(self._events)
+        df = pd.DataFrame(events, columns=['at', 'kind', 'name', 'duration_ms', 'rows', 'acquire_ms', 'queries',
+                                           'cached', 'error'])
+        return df[df['kind'] == kind] if kind else df
+
+    def slow_calls(self):
+        """DataFrame des derniers appels lents (le plus récent en premier)"""
+        with self._lock:
+            slow = list(self._slow)
+        return pd.DataFrame(slow[::-1], columns=['at', 'kind', 'name', 'duration_ms', 'rows', 'acquire_ms',
+                                                 'error'])
+
+    def summary(self, kind):
+        """Agrégat par requête ou page, trié par temps total décroissant"""
+        df = self.events(kind)
+        if df.empty:
+            return pd.DataFrame(columns=['name', 'calls', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms',
+                                         'rows', 'acquire_ms', 'queries', 'cache_hits', 'errors'])
+        grouped = df.groupby('name')
+        summary = pd.DataFrame({
+            'calls': grouped.size(),
+            'total_ms': grouped['duration_ms'].sum(),
+            'mean_ms': grouped['duration_ms'].mean(),
+            'p50_ms': grouped['duration_ms'].quantile(0.5),
+            'p95_ms': grouped['duration_ms'].quantile(0.95),
+            'max_ms': grouped['duration_ms'].max(),
+            'rows': grouped['rows'].mean(),
+            'acquire_ms': grouped['acquire_ms'].mean(),
+            'queries': grouped['queries'].mean(),
+            'cache_hits': grouped['cached'].sum(),
+            'errors': grouped['error'].count()
+        })
+        return summary.sort_values('total_ms', ascending=False).reset_index().round(2)
+
+    def to_jsonl(self):
+        """Contenu du tampon au format JSON lines"""
+        with self._lock:
+            events = list(self._events)
+        return ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._slow.clear()
+
+
+recorder = Recorder()
+timed = recorder.timed
+note = recorder.note
+
+
+def instrumented(kind, name=None):
+    """Décorateur : chaque appel de la fonction est mesuré sous le nom `name` (par défaut celui de la fonction)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with recorder.timed(kind, name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,13 +1,30 @@
 import streamlit as st
 from streamlit_option_menu import option_menu
-import mysql.connector
 import pandas as pd
 import hashlib
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+import os
+import re
 import warnings
-from decimal import Decimal
+from collections import Counter
+
+import analytics
+import catalog_import
+import circulation
+import database
+import export
+import forecast
+import instrumentation
+import migrate
+import precompute
+import queries
+import recommend
+import reminders
+import search
+import sessions
+from database import convert_decimal
 
 warnings.filterwarnings('ignore')
 
@@ -62,65 +79,207 @@ st.markdown("""
 
 # ================================= CONFIGURATION DATABASE ==========================================
 
+# Application des migrations de schéma au démarrage du serveur (sinon : python migrate.py)
+AUTO_MIGRATE = os.environ.get('BIBLIO_AUTO_MIGRATE', '1') == '1'
+
+
+@st.cache_resource(show_spinner=False)
+def apply_schema_migrations():
+    """Applique les migrations en attente une seule fois par processus serveur"""
+    return migrate.apply_pending(log=lambda message: None)
+
+
+@st.cache_resource(show_spinner=False)
+def get_analytics_store():
+    """Instantanés analytiques, mis à jour par un seul thread par serveur (jamais pendant l'affichage d'une page)"""
+    store = analytics.get_store()
+    store.start()
+    return store
+
+
+@st.cache_resource(show_spinner=False)
+def get_precomputer():
+    """Résultats partagés par toutes les sessions, recalculés par un seul thread par serveur"""
+    precomputer = precompute.Precomputer()
+    dashboard_tables = frozenset().union(*map(database.tables_read, DASHBOARD_QUERIES.values()))
+    precomputer.register('dashboard', lambda: complete_results(dashboard_tasks()), tables=dashboard_tables)
+    precomputer.register('overdue', report_task('overdue_loans', queries.OVERDUE_LOANS),
+                         tables=database.tables_read(queries.OVERDUE_LOANS))
+    precomputer.register('top_books', query_task(queries.TOP_BOOKS), tables=database.tables_read(queries.TOP_BOOKS))
+    precomputer.register('top_users', report_task('most_active_students', queries.MOST_ACTIVE_STUDENTS),
+                         tables=database.tables_read(queries.MOST_ACTIVE_STUDENTS))
+    precomputer.start()
+    return precomputer
+
+
+def read_shared(name):
+    """Résultat partagé (voir get_precomputer) ; None en cas d'erreur"""
+    try:
+        return get_precomputer().get(name)
+    except Exception as e:
+        st.error(f"❌ Erreur SQL: {str(e)}")
+        return None
+
+
 def get_db_connection():
-    """Connexion à la base de données avec gestion d'erreurs"""
+    """Emprunte une connexion au pool partagé avec gestion d'erreurs"""
     try:
-        connection = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="",
-            database="biblio",
-            charset='utf8mb4',
-            autocommit=True
-        )
-        return connection
+        return database.get_pool().acquire()
     except Exception as e:
         st.error(f"❌ Erreur de connexion DB: {str(e)}")
         return None
 
 
+def release_db_connection(connection, discard=False):
+    """Restitue une connexion au pool partagé"""
+    database.get_pool().release(connection, discard=discard)
+
+
 def hash_password(password):
     """Hachage sécurisé des mots de passe"""
     return hashlib.sha256(password.encode('utf-8')).hexdigest()
 
 
-def convert_decimal(value):
-    """Convertit les valeurs Decimal en int ou float"""
-    if isinstance(value, Decimal):
-        return int(value) if value % 1 == 0 else float(value)
-    return value
-
-
 def execute_query(query, params=None, fetch=True):
     """Exécute une requête SQL avec gestion des erreurs"""
-    connection = get_db_connection()
-    if not connection:
+    try:
+        with instrumentation.timed('query', database.normalize_sql(query)) as call:
+            result = database.run_query(query, params, fetch=fetch)
+            if fetch:
+                call['rows'] = len(result)
+        return result
+    except Exception as e:
+        st.error(f"❌ Erreur SQL: {str(e)}")
         return None
 
-    cursor = None
-    try:
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(query, params or ())
-
-        if fetch:
-            result = cursor.fetchall()
-            # Convertir les Decimal en types natifs Python
-            for row in result:
-                for key, value in row.items():
-                    row[key] = convert_decimal(value)
-            return result
-        else:
-            connection.commit()
-            return True
 
+def fetch_query_df(query, params=None):
+    """Lecture mesurée en DataFrame typé, sans appel à Streamlit (utilisable dans un thread)"""
+    with instrumentation.timed('query', database.normalize_sql(query)) as call:
+        df = database.run_query_df(query, params)
+        call['rows'] = len(df)
+    return df
+
+
+def fetch_report_df(name):
+    """Rapport mesuré lu dans les instantanés analytiques, sans appel à Streamlit"""
+    with instrumentation.timed('query', f"analytics.{name}") as call:
+        df = analytics.get_store().run_report(name)
+        call['rows'] = len(df)
+    return df
+
+
+def execute_query_df(query, params=None):
+    """Exécute une requête de lecture et retourne un DataFrame typé (None en cas d'erreur)"""
+    try:
+        return fetch_query_df(query, params)
     except Exception as e:
         st.error(f"❌ Erreur SQL: {str(e)}")
         return None
-    finally:
-        if cursor:
-            cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+
+
+def execute_report_df(name, fallback_query):
+    """Rapport lu dans les instantanés analytiques (DuckDB), à défaut directement dans la base"""
+    if analytics.available():
+        try:
+            return fetch_report_df(name)
+        except analytics.SnapshotUnavailableError:
+            # Première copie en cours : show_report_freshness l'indique (données en temps réel)
+            pass
+        except Exception as e:
+            st.warning(f"⚠️ Moteur analytique indisponible, lecture directe de la base: {str(e)}")
+    return execute_query_df(fallback_query)
+
+
+def query_task(query, params=None):
+    """Lecture à passer à `execute_parallel`"""
+    return lambda: fetch_query_df(query, params)
+
+
+def report_task(name, fallback_query):
+    """Rapport à passer à `execute_parallel` (instantanés analytiques, à défaut la base)"""
+    def task():
+        if analytics.available():
+            try:
+                return fetch_report_df(name)
+            except Exception:
+                # Hors du thread Streamlit : l'indisponibilité est signalée par show_report_freshness
+                pass
+        return fetch_query_df(fallback_query)
+    return task
+
+
+def execute_parallel(tasks):
+    """Exécute en parallèle des lectures indépendantes {clé: tâche} ; retourne {clé: résultat}"""
+    return partial_results(database.run_parallel(tasks))
+
+
+def complete_results(tasks):
+    """Comme database.run_parallel, mais lève l'erreur d'une lecture en échec (résultat partagé)
+
+    Un résultat incomplet n'est pas enregistré : precompute garde la dernière valeur complète
+    et l'erreur, et le prochain recalcul réessaie.
+    """
+    results, errors = database.run_parallel(tasks)
+    if errors:
+        key, error = next(iter(errors.items()))
+        raise RuntimeError(f"Lecture « {key} » en échec: {str(error)}") from error
+    return results, errors
+
+
+def partial_results(outcome):
+    """Résultats (résultats, erreurs) de database.run_parallel en un seul dictionnaire
+
+    Une lecture en échec ou trop lente (BIBLIO_PARALLEL_TIMEOUT) vaut None et est signalée, les
+    autres résultats restent affichés.
+    """
+    results, errors = outcome
+    for key, error in errors.items():
+        st.warning(f"⚠️ Données partielles, « {key} » indisponible: {str(error)}")
+    return {**{key: None for key in errors}, **results}
+
+
+def show_report_freshness(key):
+    """Indique la date des données des rapports (et permet aux administrateurs de l'actualiser)"""
+    refreshed_at = None
+    if analytics.available():
+        # Lecture seule de l'état : les copies se font dans le thread de get_analytics_store
+        store = get_analytics_store()
+        refreshed_at = store.refreshed_at()
+        if store.last_error is not None:
+            st.warning(f"⚠️ Instantanés analytiques non mis à jour: {str(store.last_error)}")
+
+    if refreshed_at is None:
+        st.caption("🕒 Données en temps réel")
+        return
+
+    col_info, col_refresh = st.columns([4, 1])
+    with col_info:
+        st.caption(f"🕒 Données au {refreshed_at.strftime('%d/%m/%Y à %H:%M')} "
+                   f"(mises à jour toutes les {analytics.SYNC_INTERVAL / 60:.0f} min)")
+    if st.session_state.user_role == "Admin":
+        with col_refresh:
+            if st.button("🔄 Actualiser", key=key):
+                store.request_sync()
+                st.info("🔄 Mise à jour lancée en arrière-plan")
+
+
+def has_rows(df):
+    """Vrai si le DataFrame existe et contient au moins une ligne"""
+    return df is not None and not df.empty
+
+
+def lazy_tabs(key, tabs):
+    """Onglets dont seul l'onglet sélectionné est exécuté (requêtes et rendu)
+
+    `tabs` est une liste de couples (libellé, fonction d'affichage). Changer d'onglet relance le
+    script ; un onglet déjà visité relit ses données dans le cache des requêtes (BIBLIO_CACHE_TTL).
+    """
+    containers = st.tabs([label for label, _ in tabs], key=key, on_change="rerun")
+    for container, (_, render) in zip(containers, tabs):
+        if container.open:
+            with container, instrumentation.timed('page', render.__name__):
+                render()
 
 
 # ================================= AUTHENTIFICATION ==========================================
@@ -133,6 +292,7 @@ def init_session_state():
         'user_role': None,
         'user_email': None,
         'user_id': None,
+        'session_token': None,
         'last_activity': datetime.now()
     }
     for key, value in defaults.items():
@@ -140,6 +300,76 @@ def init_session_state():
             st.session_state[key] = value
 
 
+def start_session(user_id):
+    """Ouvre une session persistante : le jeton est gardé dans l'URL et survit au rechargement de la page"""
+    try:
+        token = sessions.get_store().create(user_id)
+    except Exception as e:
+        st.warning(f"⚠️ Session non conservée au rechargement: {str(e)}")
+        return
+    st.session_state.session_token = token
+    st.query_params[sessions.TOKEN_PARAM] = token
+
+
+@instrumentation.instrumented('auth', 'restore_session')
+def restore_session():
+    """Reprend la session du jeton de l'URL sans vérifier à nouveau les identifiants"""
+    token = st.query_params.get(sessions.TOKEN_PARAM)
+    if not token:
+        return
+    store = sessions.get_store()
+    try:
+        user_id = store.validate(token)
+        profile = store.get_profile(user_id) if user_id is not None else None
+    except Exception as e:
+        st.error(f"❌ Erreur de connexion DB: {str(e)}")
+        return
+
+    if profile is None:
+        # Jeton expiré, révoqué ou altéré : retour à l'écran de connexion
+        del st.query_params[sessions.TOKEN_PARAM]
+        return
+    st.session_state.update({
+        'authenticated': True,
+        'username': f"{profile['prenom']} {profile['nom']}",
+        'user_role': profile['role'],
+        'user_email': profile['mail'],
+        'user_id': profile['ID_utilisateur'],
+        'session_token': token
+    })
+
+
+def check_session():
+    """Met fin à la session en cours si son jeton a été révoqué (déconnexion ailleurs, administrateur)"""
+    token = st.session_state.session_token
+    if not token:
+        return
+    try:
+        user_id = sessions.get_store().validate(token)
+    except Exception as e:
+        # Relevé des révocations impossible : la session est conservée jusqu'au prochain relevé
+        st.error(f"❌ Erreur de connexion DB: {str(e)}")
+        return
+    if user_id is None:
+        end_session()
+        st.warning("🔒 Session expirée ou révoquée, veuillez vous reconnecter")
+
+
+def end_session():
+    """Déconnexion : révoque le jeton et vide l'état de la session"""
+    token = st.session_state.get('session_token')
+    if token:
+        try:
+            sessions.get_store().revoke(token)
+        except Exception as e:
+            st.error(f"❌ Erreur SQL: {str(e)}")
+    st.query_params.clear()
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    init_session_state()
+
+
+@instrumentation.instrumented('auth')
 def authenticate_user(email, password):
     """Authentification des utilisateurs"""
     connection = get_db_connection()
@@ -147,6 +377,7 @@ def authenticate_user(email, password):
         return False, None, None, None
 
     cursor = None
+    discard = False
     try:
         cursor = connection.cursor(dictionary=True, buffered=True)
         query = "SELECT ID_utilisateur, nom, prenom, password, role FROM utilisateurs WHERE mail = %s"
@@ -166,79 +397,64 @@ def authenticate_user(email, password):
         return False, None, None, None
 
     except Exception as e:
+        discard = database.is_connection_error(e)
         st.error(f"❌ Erreur d'authentification: {str(e)}")
         return False, None, None, None
     finally:
         if cursor:
             cursor.close()
-        if connection and connection.is_connected():
-            connection.close()
+        release_db_connection(connection, discard=discard)
 
 
 # ================================= ANALYTICS AVANCÉS ==========================================
 
-def get_advanced_analytics():
-    """Analytics avancés"""
-    metrics = {}
+def compute_kpis(df):
+    """KPIs principaux à partir du résultat de KPI_SNAPSHOT (lecture cohérente en une requête)"""
+    if not has_rows(df):
+        return {}
 
-    try:
-        # KPIs de base
-        queries = {
-            'total_books': "SELECT COUNT(*) as count FROM livres",
-            'total_copies': "SELECT COALESCE(SUM(Quantite_disponible), 0) as count FROM livres",
-            'total_users': "SELECT COUNT(*) as count FROM utilisateurs",
-            'total_rentals': "SELECT COUNT(*) as count FROM locations",
-            'active_rentals': "SELECT COUNT(*) as count FROM locations WHERE Statut NOT IN ('Retourné', 'Annulé')",
-            'overdue_rentals': "SELECT COUNT(*) as count FROM locations WHERE Date_retour_prevue < CURDATE() AND Statut NOT IN ('Retourné', 'Annulé')"
-        }
-
-        for key, query in queries.items():
-            result = execute_query(query)
-            if result:
-                metrics[key] = int(result[0]['count'])  # Convertir en int
-
-        # Calculs de ratios
-        if metrics.get('total_users', 0) > 0:
-            metrics['rental_per_user'] = round(metrics.get('total_rentals', 0) / max(metrics.get('total_users', 1), 1),
-                                               2)
-            metrics['utilization_rate'] = round(
-                (metrics.get('active_rentals', 0) / max(metrics.get('total_copies', 1), 1)) * 100, 2)
-
-        # Top genres
-        result = execute_query(
-            "SELECT Genre, COUNT(*) as count FROM livres WHERE Genre IS NOT NULL GROUP BY Genre ORDER BY count DESC LIMIT 5")
-        metrics['top_genres'] = result or []
-
-        # Activité récente
-        result = execute_query("""
-            SELECT DATE(Date_location) as date, COUNT(*) as rentals 
-            FROM locations 
-            WHERE Date_location >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-            GROUP BY DATE(Date_location) 
-            ORDER BY date
-        """)
-        metrics['recent_activity'] = result or []
-
-        # Livres les plus populaires
-        result = execute_query("""
-            SELECT l.Titre, l.Auteur, COUNT(loc.ID_location) as rental_count
-            FROM livres l
-            LEFT JOIN locations loc ON l.ID_livre = loc.ID_livre
-            GROUP BY l.ID_livre, l.Titre, l.Auteur
-            ORDER BY rental_count DESC
-            LIMIT 5
-        """)
-        metrics['popular_books'] = result or []
-
-        return metrics
+    kpis = {key: int(value or 0) for key, value in df.iloc[0].items()}
 
-    except Exception as e:
-        st.error(f"❌ Erreur analytics: {str(e)}")
+    # Calculs de ratios
+    if kpis['total_users'] > 0:
+        kpis['rental_per_user'] = round(kpis['total_rentals'] / kpis['total_users'], 2)
+        kpis['utilization_rate'] = round((kpis['active_rentals'] / max(kpis['total_copies'], 1)) * 100, 2)
+
+    return kpis
+
+
+DASHBOARD_QUERIES = {
+    # KPIs de base
+    'kpis': queries.KPI_SNAPSHOT,
+    # Top genres
+    'top_genres': queries.TOP_GENRES,
+    # Activité récente
+    'recent_activity': queries.RECENT_ACTIVITY,
+    # Livres les plus populaires
+    'popular_books': queries.POPULAR_BOOKS
+}
+
+
+def dashboard_tasks():
+    """Lectures indépendantes du dashboard, exécutées en parallèle"""
+    return {key: query_task(query) for key, query in DASHBOARD_QUERIES.items()}
+
+
+def get_advanced_analytics():
+    """Analytics avancés, partagés par toutes les sessions (recalculés en arrière-plan)"""
+    outcome = read_shared('dashboard')
+    if outcome is None:
         return {}
+    data = partial_results(outcome)
+
+    metrics = compute_kpis(data.pop('kpis'))
+    metrics.update(data)
+    return metrics
 
 
 # ================================= DASHBOARD AVANCÉ ==========================================
 
+@instrumentation.instrumented('page')
 def advanced_dashboard():
     """Dashboard avec visualisations avancées"""
     st.markdown("# 📊 Analytics Dashboard - BiblioStat Intelligence")
@@ -246,86 +462,331 @@ def advanced_dashboard():
     with st.spinner('🔄 Chargement des données...'):
         metrics = get_advanced_analytics()
 
-    if not metrics:
+    if not any(value is not None for value in metrics.values()):
         st.error("Impossible de charger les données")
         return
 
-    # KPIs principaux - Conversion en int pour Streamlit
-    st.markdown("## 🎯 Key Performance Indicators")
-    col1, col2, col3, col4, col5, col6 = st.columns(6)
+    # KPIs principaux - Conversion en int pour Streamlit (absents si leur lecture a échoué)
+    if 'total_books' in metrics:
+        st.markdown("## 🎯 Key Performance Indicators")
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
 
-    with col1:
-        st.metric("📚 Total Livres", int(metrics.get('total_books', 0)))
-    with col2:
-        st.metric("📖 Exemplaires", int(metrics.get('total_copies', 0)))
-    with col3:
-        st.metric("👥 Utilisateurs", int(metrics.get('total_users', 0)))
-    with col4:
-        st.metric("📅 Locations", int(metrics.get('total_rentals', 0)))
-    with col5:
-        utilization = metrics.get('utilization_rate', 0)
-        st.metric("📈 Taux Utilisation", f"{float(utilization):.1f}%")
-    with col6:
-        overdue = metrics.get('overdue_rentals', 0)
-        st.metric("⚠️ Retards", int(overdue))
+        with col1:
+            st.metric("📚 Total Livres", int(metrics.get('total_books', 0)))
+        with col2:
+            st.metric("📖 Exemplaires", int(metrics.get('total_copies', 0)))
+        with col3:
+            st.metric("👥 Utilisateurs", int(metrics.get('total_users', 0)))
+        with col4:
+            st.metric("📅 Locations", int(metrics.get('total_rentals', 0)))
+        with col5:
+            utilization = metrics.get('utilization_rate', 0)
+            st.metric("📈 Taux Utilisation", f"{float(utilization):.1f}%")
+        with col6:
+            overdue = metrics.get('overdue_rentals', 0)
+            st.metric("⚠️ Retards", int(overdue))
 
     # Visualisations
     col_left, col_right = st.columns(2)
 
     with col_left:
-        if metrics.get('top_genres'):
+        if has_rows(metrics.get('top_genres')):
             st.markdown("### 🎭 Distribution des Genres")
-            df_genres = pd.DataFrame(metrics['top_genres'])
-            # S'assurer que les valeurs sont numériques
-            df_genres['count'] = df_genres['count'].astype(int)
+            df_genres = metrics['top_genres']
             fig_donut = go.Figure(data=[go.Pie(
                 labels=df_genres['Genre'], values=df_genres['count'], hole=0.4
             )])
             st.plotly_chart(fig_donut, use_container_width=True)
 
     with col_right:
-        if metrics.get('recent_activity'):
+        if has_rows(metrics.get('recent_activity')):
             st.markdown("### 📈 Activité des 30 derniers jours")
-            df_activity = pd.DataFrame(metrics['recent_activity'])
-            df_activity['date'] = pd.to_datetime(df_activity['date'])
-            df_activity['rentals'] = df_activity['rentals'].astype(int)
+            # Résultat partagé entre sessions : conversion sur une copie
+            df_activity = metrics['recent_activity'].assign(date=lambda df: pd.to_datetime(df['date']))
             fig_line = px.line(df_activity, x='date', y='rentals')
             st.plotly_chart(fig_line, use_container_width=True)
 
     # Livres populaires
-    if metrics.get('popular_books'):
+    if has_rows(metrics.get('popular_books')):
         st.markdown("### 🔥 Livres les Plus Populaires")
-        df_popular = pd.DataFrame(metrics['popular_books'])
-        df_popular['rental_count'] = df_popular['rental_count'].astype(int)
+        df_popular = metrics['popular_books']
         st.dataframe(df_popular, use_container_width=True)
 
 
+# ================================= PAGINATION ==========================================
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+def estimate_row_count(query, params=None):
+    """Estimation du nombre de lignes via EXPLAIN, sans COUNT(*) complet"""
+    if database.BACKEND != 'mysql':
+        # L'EXPLAIN de SQLite ne fournit pas d'estimation du nombre de lignes
+        return None
+    plan = execute_query("EXPLAIN " + query, params)
+    if not plan:
+        return None
+    driving = plan[0]
+    rows = driving.get('rows') or 0
+    filtered = driving.get('filtered') or 100
+    return int(rows * filtered / 100)
+
+
+def fetch_keyset_page(query, params, order_columns, cursor=None, page_size=PAGE_SIZES[0], descending=False):
+    """Récupère une page en se positionnant après la clé `cursor` (pagination par clé)
+
+    `order_columns` est une liste de couples (expression SQL, nom de colonne du résultat) formant
+    une clé unique ; la requête doit déjà contenir une clause WHERE.
+    """
+    query, params = queries.keyset_page(query, params, order_columns, cursor, page_size, descending)
+    rows = execute_query_df(query, params)
+    next_cursor = None
+    if rows is not None and len(rows) > page_size:
+        rows = rows.iloc[:page_size]
+        last = rows.iloc[-1]
+        # Valeurs numpy reconverties en types Python pour les paramètres SQL
+        next_cursor = tuple(getattr(last[name], 'item', lambda: last[name])() for _, name in order_columns)
+    return rows, next_cursor
+
+
+def keyset_pager(state_key, query, params, order_columns, descending=False):
+    """Pagination par clé avec contrôle de taille de page ; retourne les lignes de la page courante"""
+    page_size = st.selectbox("Lignes par page", PAGE_SIZES, key=f"{state_key}_page_size")
+
+    # Toute modification des filtres ou de la taille de page ramène à la première page
+    signature = repr((query, list(params or []), page_size))
+    state = st.session_state.get(state_key)
+    if not state or state['signature'] != signature:
+        state = {'signature': signature, 'cursors': [None], 'next': None}
+        st.session_state[state_key] = state
+
+    rows, state['next'] = fetch_keyset_page(query, params, order_columns, state['cursors'][-1], page_size,
+                                            descending)
+    if not has_rows(rows):
+        return rows
+
+    def go_next():
+        state['cursors'].append(state['next'])
+
+    def go_previous():
+        state['cursors'].pop()
+
+    page = len(state['cursors'])
+    estimate = estimate_row_count(query, params)
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        st.button("◀ Précédent", key=f"{state_key}_prev", on_click=go_previous, disabled=page == 1)
+    with col_info:
+        caption = f"Page {page} · lignes {(page - 1) * page_size + 1} à {(page - 1) * page_size + len(rows)}"
+        if estimate is not None:
+            caption += f" · ~{max(estimate, (page - 1) * page_size + len(rows))} résultats (estimation)"
+        st.caption(caption)
+    with col_next:
+        st.button("Suivant ▶", key=f"{state_key}_next", on_click=go_next, disabled=state['next'] is None)
+
+    return rows
+
+
+# ================================= SÉLECTEURS ==========================================
+
+# Nombre maximal de propositions chargées par un sélecteur avec recherche
+TYPEAHEAD_LIMIT = 20
+# Dernières sélections proposées par poste (session) avant toute saisie
+RECENT_SELECTIONS = 5
+
+
+def like_prefix(text):
+    """Motif LIKE « commence par », les caractères spéciaux échappés avec ESCAPE '!'"""
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+
+
+def in_clause(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def ordered_by_ids(rows, ids, id_key):
+    """Lignes remises dans l'ordre des identifiants demandés"""
+    position = {value: index for index, value in enumerate(ids)}
+    return sorted((row for row in rows if row[id_key] in position), key=lambda row: position[row[id_key]])
+
+
+def fetch_books(ids, available_only=False):
+    """Livres par identifiant, dans l'ordre donné"""
+    ids = list(ids)
+    if not ids:
+        return []
+    query = f"SELECT ID_livre, Titre, Auteur, Quantite_disponible FROM livres WHERE ID_livre IN ({in_clause(ids)})"
+    if available_only:
+        query += " AND Quantite_disponible > 0"
+    return ordered_by_ids(execute_query(query, ids) or [], ids, 'ID_livre')
+
+
+def search_books(text, limit, available_only=False):
+    """Livres correspondant à la saisie : identifiant exact puis recherche dans l'index du catalogue"""
+    ids = [int(text)] if text.isdigit() else []
+    # Marge pour les livres indisponibles écartés par la relecture
+    for book_id, _ in search_catalog(text)[:limit * 3 if available_only else limit]:
+        if book_id not in ids:
+            ids.append(book_id)
+    return fetch_books(ids, available_only)[:limit]
+
+
+def fetch_students(ids):
+    """Étudiants par identifiant, dans l'ordre donné"""
+    ids = list(ids)
+    if not ids:
+        return []
+    rows = execute_query(f"""
+        SELECT ID_utilisateur, nom, prenom, mail FROM utilisateurs
+        WHERE role = 'Etudiant' AND ID_utilisateur IN ({in_clause(ids)})
+    """, ids)
+    return ordered_by_ids(rows or [], ids, 'ID_utilisateur')
+
+
+def search_students(text, limit):
+    """Étudiants par identifiant exact ou par début de nom, de prénom ou de mail"""
+    if text.isdigit():
+        return fetch_students([int(text)])
+    words = text.lower().split()
+    # Le premier mot interroge les index ; les suivants filtrent les candidats (« dupont je »)
+    branch_limit = limit * 3 if len(words) > 1 else limit
+    pattern = like_prefix(words[0])
+    rows = execute_query(queries.STUDENT_LOOKUP, [pattern, branch_limit] * 3 + [branch_limit]) or []
+    return [row for row in rows
+            if all(any(str(row.get(field) or '').lower().startswith(word) for field in ('nom', 'prenom', 'mail'))
+                   for word in words[1:])][:limit]
+
+
+def fetch_active_loans(ids):
+    """Locations en cours par identifiant, dans l'ordre donné"""
+    ids = list(ids)
+    if not ids:
+        return []
+    rows = execute_query(queries.ACTIVE_LOANS + f" AND loc.ID_location IN ({in_clause(ids)})", ids)
+    return ordered_by_ids(rows or [], ids, 'ID_location')
+
+
+def search_active_loans(text, limit):
+    """Locations en cours : identifiant exact (location, étudiant ou livre), sinon étudiants et livres recherchés"""
+    if text.isdigit():
+        loans = fetch_active_loans([int(text)])
+        student_ids = book_ids = [int(text)]
+    else:
+        loans = []
+        student_ids = [student['ID_utilisateur'] for student in search_students(text, limit)]
+        book_ids = [book_id for book_id, _ in search_catalog(text)[:limit]]
+    # Une requête bornée par colonne : chacune suit son index (ID_etudiant, ID_livre)
+    for column, ids in (('loc.ID_etudiant', student_ids), ('loc.ID_livre', book_ids)):
+        if ids and len(loans) < limit:
+            loans += execute_query(queries.ACTIVE_LOANS + f" AND {column} IN ({in_clause(ids)})"
+                                   " ORDER BY loc.Date_retour_prevue LIMIT %s", ids + [limit]) or []
+    return list({loan['ID_location']: loan for loan in loans}.values())[:limit]
+
+
+def remember_selection(key, item_id):
+    """Ajoute un élément en tête des sélections récentes du sélecteur"""
+    recent = [item_id] + [value for value in st.session_state.get(f"{key}_recent", []) if value != item_id]
+    st.session_state[f"{key}_recent"] = recent[:RECENT_SELECTIONS]
+
+
+def typeahead(key, label, search_func, fetch_func, format_option, placeholder=None):
+    """Sélecteur avec recherche côté serveur ; retourne l'élément choisi ou None
+
+    Seules les TYPEAHEAD_LIMIT meilleures correspondances de `search_func(texte, limite)` sont
+    chargées, quelle que soit la taille de la table. La recherche part à la validation de la
+    saisie (Entrée ou sortie du champ), pas à chaque caractère. Sans saisie, les sélections
+    récentes du poste (`remember_selection`) sont relues par `fetch_func(ids)`.
+    """
+    text = st.text_input(label, key=f"{key}_search", placeholder=placeholder).strip()
+    if text:
+        options = search_func(text, TYPEAHEAD_LIMIT)
+    else:
+        options = fetch_func(st.session_state.get(f"{key}_recent", []))
+
+    if not options:
+        st.caption("Aucun résultat" if text else "🔍 Saisir quelques lettres ou un identifiant")
+        return None
+    labels = {format_option(option): option for option in options}
+    caption = f"{len(options)} résultat(s)" if text else "Sélections récentes"
+    choice = st.selectbox(f"{label} — {caption}", list(labels), help=(
+        f"Les {TYPEAHEAD_LIMIT} meilleures correspondances sont proposées : préciser la saisie au besoin"))
+    return labels[choice]
+
+
+# ================================= RECOMMANDATIONS ==========================================
+
+def recommendations_for(book_id=None, student_id=None, k=recommend.TOP_K):
+    """Recommandations par co-emprunts (index en mémoire) d'un livre ou d'un étudiant ; vides sans SciPy"""
+    if not recommend.available():
+        return []
+    try:
+        index = recommend.get_index()
+        if book_id is not None:
+            return index.similar_books(book_id, k)
+        return index.for_student(student_id, k)
+    except Exception as e:
+        st.warning(f"⚠️ Recommandations indisponibles: {str(e)}")
+        return []
+
+
+def show_recommendations(recommendations, empty_message):
+    """Tableau des livres recommandés, avec leur disponibilité"""
+    books = {book['ID_livre']: book for book in fetch_books([book_id for book_id, _, _ in recommendations])}
+    rows = [{'ID_livre': book_id, 'Titre': books[book_id]['Titre'], 'Auteur': books[book_id]['Auteur'],
+             'Disponibles': books[book_id]['Quantite_disponible'], 'Emprunteurs communs': support}
+            for book_id, _, support in recommendations if book_id in books]
+    if rows:
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+    else:
+        st.caption(empty_message)
+
+
 # ================================= GESTION DES LIVRES ==========================================
 
 def get_unique_genres():
     """Récupère les genres uniques"""
-    result = execute_query("SELECT DISTINCT Genre FROM livres WHERE Genre IS NOT NULL")
+    result = execute_query(queries.UNIQUE_GENRES)
     return [row['Genre'] for row in result] if result else []
 
 
+def search_catalog(text, genre=None, limit=search.RESULT_LIMIT):
+    """Recherche plein texte dans le catalogue (insensible aux accents, par préfixe)"""
+    try:
+        return search.get_catalog_index().search(text, limit, genre=genre)
+    except Exception as e:
+        st.error(f"❌ Erreur de recherche: {str(e)}")
+        return []
+
+
+def update_search_index(book=None):
+    """Répercute une écriture du catalogue dans l'index de recherche"""
+    try:
+        index = search.get_catalog_index()
+        if book:
+            index.upsert(book)
+        else:
+            index.sync_new()
+    except Exception as e:
+        st.warning(f"⚠️ Index de recherche non mis à jour: {str(e)}")
+
+
+@instrumentation.instrumented('page')
 def book_management():
     """Gestion complète des livres"""
     st.markdown("# 📚 Gestion des Livres")
 
     # Onglets pour différentes fonctionnalités
-    tab1, tab2, tab3, tab4 = st.tabs(["📋 Catalogue", "➕ Ajouter Livre", "✏️ Modifier Livre", "📊 Statistiques"])
+    lazy_tabs("book_tabs", [
+        ("📋 Catalogue", show_book_catalog),
+        ("➕ Ajouter Livre", add_book_form),
+        ("📥 Import en Masse", bulk_import_books),
+        ("✏️ Modifier Livre", edit_book_form),
+        ("📊 Statistiques", show_book_statistics)
+    ])
 
-    with tab1:
-        show_book_catalog()
 
-    with tab2:
-        add_book_form()
-
-    with tab3:
-        edit_book_form()
-
-    with tab4:
-        show_book_statistics()
+# Identifiants relus par requête lors d'une recherche filtrée sur la disponibilité
+CATALOG_SEARCH_BATCH = 500
 
 
 def show_book_catalog():
@@ -342,37 +803,62 @@ def show_book_catalog():
         disponibility_filter = st.selectbox("Disponibilité", ["Tous", "Disponible", "Indisponible"])
 
     # Construction de la requête
-    query = "SELECT * FROM livres WHERE 1=1"
+    query = queries.CATALOG
     params = []
 
     if genre_filter != "Tous":
         query += " AND Genre = %s"
         params.append(genre_filter)
 
-    if search_term:
-        query += " AND (Titre LIKE %s OR Auteur LIKE %s)"
-        params.extend([f"%{search_term}%", f"%{search_term}%"])
-
     if disponibility_filter == "Disponible":
         query += " AND Quantite_disponible > 0"
     elif disponibility_filter == "Indisponible":
         query += " AND Quantite_disponible = 0"
 
-    books = execute_query(query, params)
-
-    if books:
-        # Nettoyer les données Decimal
-        for book in books:
-            for key in ['ID_livre', 'Annee_publication', 'Quantite_disponible']:
-                if key in book:
-                    book[key] = convert_decimal(book[key])
+    if search_term:
+        # Recherche plein texte dans l'index en mémoire, résultats classés par pertinence. La disponibilité
+        # n'est pas dans l'index : avec ce filtre, tous les résultats sont relus par lots jusqu'à en avoir assez
+        limit = search.RESULT_LIMIT
+        hits = search_catalog(search_term, None if genre_filter == "Tous" else genre_filter,
+                              limit=None if disponibility_filter != "Tous" else limit)
+        ranks = {book_id: rank for rank, (book_id, _) in enumerate(hits)}
+        frames, found = [], 0
+        for start in range(0, len(hits), CATALOG_SEARCH_BATCH):
+            batch = [book_id for book_id, _ in hits[start:start + CATALOG_SEARCH_BATCH]]
+            frame = execute_query_df(query + f" AND ID_livre IN ({in_clause(batch)})", params + batch)
+            if frame is None:
+                break
+            frames.append(frame)
+            found += len(frame)
+            if found >= limit:
+                break
+        books = None
+        if frames:
+            books = pd.concat(frames, ignore_index=True)
+            books = books.sort_values('ID_livre', key=lambda ids: ids.map(ranks), ignore_index=True).head(limit)
+            if has_rows(books):
+                st.caption(f"{len(books)} résultat(s) les plus pertinents")
+    else:
+        books = keyset_pager("catalog_pager", query, params, [("ID_livre", "ID_livre")])
 
-        df = pd.DataFrame(books)
-        st.dataframe(df, use_container_width=True)
+    if has_rows(books):
+        st.dataframe(books, use_container_width=True)
+        show_catalog_recommendations(books)
     else:
         st.info("Aucun livre trouvé avec ces critères")
 
 
+def show_catalog_recommendations(books):
+    """« Les lecteurs de ce livre ont aussi emprunté » pour un livre de la page affichée"""
+    if not recommend.available():
+        return
+    with st.expander("🤝 Les lecteurs de ce livre ont aussi emprunté"):
+        titles = dict(zip(books['ID_livre'].astype(int), books['Titre'].fillna("")))
+        book_id = st.selectbox("Livre", list(titles), format_func=lambda value: f"{value} - {titles[value]}",
+                               key="catalog_recommend_book")
+        show_recommendations(recommendations_for(book_id=book_id), "Pas encore assez d'emprunts communs pour ce livre")
+
+
 def add_book_form():
     """Formulaire d'ajout de livre"""
     st.markdown("## ➕ Ajouter un Nouveau Livre")
@@ -400,39 +886,90 @@ def add_book_form():
                          VALUES (%s, %s, %s, %s, %s, %s)"""
                 success = execute_query(query, (titre, auteur, annee, genre, quantite, infos), fetch=False)
                 if success:
+                    update_search_index()
                     st.success("✅ Livre ajouté avec succès!")
                     st.rerun()
 
 
-def edit_book_form():
-    """Formulaire de modification de livre"""
-    st.markdown("## ✏️ Modifier un Livre")
+def bulk_import_books():
+    """Import en masse du catalogue depuis un fichier CSV ou Excel"""
+    st.markdown("## 📥 Import en Masse")
 
-    books = execute_query("SELECT * FROM livres")
+    uploaded = st.file_uploader("Fichier CSV ou Excel", type=["csv", "xlsx"], key="bulk_import_file")
+    if not uploaded:
+        st.info("Colonnes attendues : Titre, Auteur, Genre (obligatoires), Année, Quantité, Informations")
+        return
 
-    if not books:
-        st.info("Aucun livre à modifier")
+    try:
+        df = catalog_import.read_table(uploaded.getvalue(), uploaded.name)
+    except Exception as e:
+        st.error(f"❌ Fichier illisible: {str(e)}")
         return
 
-    # Nettoyer les données Decimal
-    for book in books:
-        for key in ['ID_livre', 'Annee_publication', 'Quantite_disponible']:
-            if key in book:
-                book[key] = convert_decimal(book[key])
+    st.caption(f"{len(df)} ligne(s) lue(s)")
+    st.dataframe(df.head(10), use_container_width=True)
+
+    # Correspondance des colonnes
+    st.markdown("### 🔗 Correspondance des Colonnes")
+    guessed = catalog_import.guess_mapping(df.columns)
+    options = ["(aucune)"] + list(df.columns)
+    mapping = {}
+    columns = st.columns(3)
+    for i, field in enumerate(catalog_import.CATALOG_FIELDS):
+        with columns[i % 3]:
+            default = options.index(guessed[field]) if guessed[field] else 0
+            choice = st.selectbox(field, options, index=default, key=f"bulk_import_map_{field}")
+            mapping[field] = None if choice == "(aucune)" else choice
+
+    # Validation
+    valid_books, errors = catalog_import.validate(df, mapping)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Lignes valides", len(valid_books))
+    with col2:
+        st.metric("Lignes en erreur", len(errors))
+
+    if st.button("🚀 Lancer l'Import", type="primary", disabled=valid_books.empty):
+        with st.spinner("Recherche des doublons..."):
+            new_books, duplicates = catalog_import.find_duplicates(valid_books)
+
+        progress_bar = st.progress(0.0, text="Import en cours...")
+
+        def on_progress(done, total):
+            progress_bar.progress(done / total, text=f"Import en cours... {done}/{total}")
+
+        try:
+            inserted, insert_errors = catalog_import.import_books(new_books, progress=on_progress)
+        except Exception as e:
+            st.error(f"❌ Erreur d'import: {str(e)}")
+            return
+
+        update_search_index()
+        st.success(f"✅ {inserted} livre(s) importé(s) | {len(duplicates)} doublon(s) ignoré(s)")
+        errors = pd.concat([errors, duplicates, insert_errors], ignore_index=True).sort_values('ligne')
+
+    if not errors.empty:
+        st.markdown("### ❌ Rapport d'Erreurs")
+        st.dataframe(errors, use_container_width=True, hide_index=True)
+        st.download_button("📄 Télécharger le rapport", errors.to_csv(index=False).encode('utf-8'),
+                           file_name="rapport_import.csv", mime="text/csv")
+
+
+def edit_book_form():
+    """Formulaire de modification de livre"""
+    st.markdown("## ✏️ Modifier un Livre")
 
-    book_titles = [f"{book['ID_livre']} - {book['Titre']} by {book['Auteur']}" for book in books]
-    selected_book = st.selectbox("Sélectionner un livre à modifier", book_titles)
+    selected_book = typeahead("edit_book", "Sélectionner un livre à modifier", search_books, fetch_books,
+                              lambda book: f"{book['ID_livre']} - {book['Titre'] or ''} by {book['Auteur'] or ''}",
+                              placeholder="Titre, auteur ou identifiant")
 
     if selected_book:
-        book_id = int(selected_book.split(" - ")[0])
+        book_id = int(selected_book['ID_livre'])
         book_result = execute_query("SELECT * FROM livres WHERE ID_livre = %s", (book_id,))
 
         if book_result:
             book = book_result[0]
-            # Nettoyer les données Decimal
-            for key in ['ID_livre', 'Annee_publication', 'Quantite_disponible']:
-                if key in book:
-                    book[key] = convert_decimal(book[key])
+            show_copy_recommendation(book_id)
 
             with st.form("edit_book_form"):
                 col1, col2 = st.columns(2)
@@ -457,6 +994,9 @@ def edit_book_form():
                              WHERE ID_livre=%s"""
                     success = execute_query(query, (titre, auteur, annee, genre, quantite, infos, book_id), fetch=False)
                     if success:
+                        update_search_index({'ID_livre': book_id, 'Titre': titre, 'Auteur': auteur, 'Genre': genre,
+                                             'Autres_informations': infos})
+                        remember_selection("edit_book", book_id)
                         st.success("✅ Livre modifié avec succès!")
 
 
@@ -465,66 +1005,42 @@ def show_book_statistics():
     st.markdown("## 📊 Statistiques des Livres")
 
     # Statistiques par genre
-    genre_stats = execute_query(
+    df_genre = execute_query_df(
         "SELECT Genre, COUNT(*) as count, SUM(Quantite_disponible) as total FROM livres WHERE Genre IS NOT NULL GROUP BY Genre")
 
-    if genre_stats:
-        # Nettoyer les données Decimal
-        for stat in genre_stats:
-            for key in ['count', 'total']:
-                if key in stat:
-                    stat[key] = convert_decimal(stat[key])
-
-        df_genre = pd.DataFrame(genre_stats)
-        df_genre['count'] = df_genre['count'].astype(int)
+    if has_rows(df_genre):
         fig = px.bar(df_genre, x='Genre', y='count', title="Nombre de livres par genre")
         st.plotly_chart(fig, use_container_width=True)
 
     # Livres les plus empruntés
-    popular_books = execute_query("""
-        SELECT l.Titre, l.Auteur, COUNT(loc.ID_location) as rentals
-        FROM livres l LEFT JOIN locations loc ON l.ID_livre = loc.ID_livre
-        GROUP BY l.ID_livre, l.Titre, l.Auteur ORDER BY rentals DESC LIMIT 10
-    """)
-
-    if popular_books:
-        # Nettoyer les données Decimal
-        for book in popular_books:
-            if 'rentals' in book:
-                book['rentals'] = convert_decimal(book['rentals'])
+    df_popular = read_shared('top_books')
 
+    if has_rows(df_popular):
         st.markdown("### 🔥 Livres les Plus Empruntés")
-        df_popular = pd.DataFrame(popular_books)
-        df_popular['rentals'] = df_popular['rentals'].astype(int)
         st.dataframe(df_popular, use_container_width=True)
 
 
 # ================================= GESTION DES LOCATIONS ==========================================
 
+@instrumentation.instrumented('page')
 def rental_management():
     """Gestion complète des locations"""
     st.markdown("# 📅 Gestion des Locations")
 
-    tab1, tab2, tab3, tab4 = st.tabs(["📋 Locations Actuelles", "➕ Nouvelle Location", "🔄 Retour Livre", "📈 Historique"])
-
-    with tab1:
-        show_current_rentals()
-
-    with tab2:
-        create_new_rental()
-
-    with tab3:
-        return_book()
-
-    with tab4:
-        show_rental_history()
+    lazy_tabs("rental_tabs", [
+        ("📋 Locations Actuelles", show_current_rentals),
+        ("➕ Nouvelle Location", create_new_rental),
+        ("🔄 Retour Livre", return_book),
+        ("📦 Mode Guichet", batch_desk),
+        ("📈 Historique", show_rental_history)
+    ])
 
 
 def show_current_rentals():
     """Affiche les locations en cours"""
     st.markdown("## 📋 Locations en Cours")
 
-    rentals = execute_query("""
+    df = execute_query_df("""
         SELECT loc.*, l.Titre, l.Auteur, u.nom, u.prenom 
         FROM locations loc
         JOIN livres l ON loc.ID_livre = l.ID_livre
@@ -533,18 +1049,11 @@ def show_current_rentals():
         ORDER BY loc.Date_retour_prevue
     """)
 
-    if rentals:
-        # Nettoyer les données Decimal
-        for rental in rentals:
-            for key in ['ID_location', 'ID_livre', 'ID_etudiant']:
-                if key in rental:
-                    rental[key] = convert_decimal(rental[key])
-
-        df = pd.DataFrame(rentals)
+    if has_rows(df):
         st.dataframe(df, use_container_width=True)
 
         # Alertes pour les retards
-        overdue_count = len([r for r in rentals if r['Date_retour_prevue'] < datetime.now().date()])
+        overdue_count = int((df['Date_retour_prevue'] < datetime.now().date()).sum())
         if overdue_count > 0:
             st.warning(f"⚠️ {overdue_count} location(s) en retard!")
     else:
@@ -555,110 +1064,74 @@ def create_new_rental():
     """Crée une nouvelle location"""
     st.markdown("## ➕ Nouvelle Location")
 
-    # Récupérer les livres disponibles
-    available_books = execute_query("SELECT * FROM livres WHERE Quantite_disponible > 0")
-    # Récupérer les étudiants
-    students = execute_query("SELECT * FROM utilisateurs WHERE role = 'Etudiant'")
-
-    if not available_books:
-        st.error("❌ Aucun livre disponible pour la location")
-        return
-
-    if not students:
-        st.error("❌ Aucun étudiant enregistré")
-        return
-
-    # Nettoyer les données Decimal
-    for book in available_books:
-        for key in ['ID_livre', 'Quantite_disponible']:
-            if key in book:
-                book[key] = convert_decimal(book[key])
-
-    for student in students:
-        for key in ['ID_utilisateur']:
-            if key in student:
-                student[key] = convert_decimal(student[key])
-        # S'assurer que les clés existent
-        student.setdefault('prenom', '')
-        student.setdefault('nom', '')
+    # Sélecteurs avec recherche hors du formulaire : la saisie relance la recherche sans le soumettre
+    col1, col2 = st.columns(2)
+    with col1:
+        selected_book = typeahead(
+            "rental_book", "Livre *", lambda text, limit: search_books(text, limit, available_only=True),
+            lambda ids: fetch_books(ids, available_only=True),
+            lambda book: f"{book['ID_livre']} - {book['Titre'] or ''} ({book['Quantite_disponible']} dispo.)",
+            placeholder="Titre, auteur ou identifiant")
+    with col2:
+        selected_student = typeahead(
+            "rental_student", "Étudiant *", search_students, fetch_students,
+            lambda student: f"{student['ID_utilisateur']} - {student['prenom'] or ''} {student['nom'] or ''}",
+            placeholder="Nom, prénom, mail ou identifiant")
+
+    # Suggestions au comptoir : co-emprunts du livre choisi, ou d'après l'historique de l'étudiant
+    if recommend.available() and (selected_book is not None or selected_student is not None):
+        with st.expander("💡 Suggestions", expanded=True):
+            if selected_book is not None:
+                st.caption("🤝 Souvent empruntés avec ce livre")
+                show_recommendations(recommendations_for(book_id=selected_book['ID_livre'], k=5),
+                                     "Pas encore assez d'emprunts communs pour ce livre")
+            if selected_student is not None:
+                st.caption("🎯 D'après l'historique de l'étudiant")
+                show_recommendations(recommendations_for(student_id=selected_student['ID_utilisateur'], k=5),
+                                     "Pas encore d'historique exploitable pour cet étudiant")
 
     with st.form("new_rental_form"):
         col1, col2 = st.columns(2)
 
         with col1:
-            book_options = {f"{book['ID_livre']} - {book['Titre']}": book for book in available_books}
-            selected_book_title = st.selectbox("Livre *", options=list(book_options.keys()))
-            selected_book = book_options[selected_book_title]
-
-            student_options = {
-                f"{student['ID_utilisateur']} - {student.get('prenom', '')} {student.get('nom', '')}": student for
-                student in students}
-            selected_student_title = st.selectbox("Étudiant *", options=list(student_options.keys()))
-            selected_student = student_options[selected_student_title]
-
-        with col2:
             date_location = st.date_input("Date de location", value=datetime.now().date())
             date_retour = st.date_input("Date de retour prévue", value=datetime.now().date() + timedelta(days=14))
+
+        with col2:
             statut = st.selectbox("Statut", ["En cours", "Confirmé", "En attente"])
 
         submitted = st.form_submit_button("✅ Créer la Location", type="primary")
 
         if submitted:
-            # Vérifier la disponibilité
-            if selected_book['Quantite_disponible'] <= 0:
+            if selected_book is None or selected_student is None:
+                st.error("❌ Choisir un livre disponible et un étudiant")
+                return
+
+            # Emprunt transactionnel : décrémentation gardée, location et agrégats validés ensemble
+            try:
+                circulation.checkout(int(selected_book['ID_livre']), int(selected_student['ID_utilisateur']),
+                                     date_location, date_retour, statut)
+            except circulation.NoCopyAvailableError:
                 st.error("❌ Ce livre n'est plus disponible")
                 return
+            except Exception as e:
+                st.error(f"❌ Erreur SQL: {str(e)}")
+                return
 
-            # Créer la location
-            query = """INSERT INTO locations (ID_livre, ID_etudiant, Date_location, Date_retour_prevue, Statut) 
-                     VALUES (%s, %s, %s, %s, %s)"""
-            success1 = execute_query(query, (
-                int(selected_book['ID_livre']),
-                int(selected_student['ID_utilisateur']),
-                date_location,
-                date_retour,
-                statut
-            ), fetch=False)
-
-            if success1:
-                # Mettre à jour la quantité disponible
-                update_query = "UPDATE livres SET Quantite_disponible = Quantite_disponible - 1 WHERE ID_livre = %s"
-                success2 = execute_query(update_query, (int(selected_book['ID_livre']),), fetch=False)
-
-                if success2:
-                    st.success("✅ Location créée avec succès!")
-                    st.rerun()
+            remember_selection("rental_book", int(selected_book['ID_livre']))
+            remember_selection("rental_student", int(selected_student['ID_utilisateur']))
+            st.success("✅ Location créée avec succès!")
+            st.rerun()
 
 
 def return_book():
     """Gère le retour des livres"""
     st.markdown("## 🔄 Retour de Livre")
 
-    # Récupérer les locations actives
-    active_rentals = execute_query("""
-        SELECT loc.*, l.Titre, u.nom, u.prenom 
-        FROM locations loc
-        JOIN livres l ON loc.ID_livre = l.ID_livre
-        JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
-        WHERE loc.Statut NOT IN ('Retourné', 'Annulé')
-    """)
-
-    if not active_rentals:
-        st.info("Aucune location active")
-        return
-
-    # Nettoyer les données Decimal
-    for rental in active_rentals:
-        for key in ['ID_location', 'ID_livre', 'ID_etudiant']:
-            if key in rental:
-                rental[key] = convert_decimal(rental[key])
-        rental.setdefault('prenom', '')
-        rental.setdefault('nom', '')
-
-    rental_options = {f"{r['ID_location']} - {r['Titre']} ({r.get('prenom', '')} {r.get('nom', '')})": r for r in
-                      active_rentals}
-    selected_rental_title = st.selectbox("Sélectionner une location à retourner", options=list(rental_options.keys()))
-    selected_rental = rental_options[selected_rental_title]
+    selected_rental = typeahead(
+        "return_loan", "Sélectionner une location à retourner", search_active_loans, fetch_active_loans,
+        lambda loan: f"{loan['ID_location']} - {loan['Titre'] or ''} ({loan['prenom'] or ''} {loan['nom'] or ''})",
+        placeholder="N° de location, étudiant (nom, mail, identifiant) ou livre")
 
     if selected_rental:
         st.info(
@@ -668,18 +1141,155 @@ def return_book():
         etat_retour = st.text_area("État du livre au retour", placeholder="Décrire l'état du livre...")
 
         if st.button("✅ Marquer comme Retourné", type="primary"):
-            # Mettre à jour la location
-            update_loc = "UPDATE locations SET Statut = 'Retourné' WHERE ID_location = %s"
-            success1 = execute_query(update_loc, (int(selected_rental['ID_location']),), fetch=False)
+            # Retour transactionnel : location, agrégats et stock validés ensemble
+            try:
+                circulation.return_loan(int(selected_rental['ID_location']), datetime.now().date())
+            except circulation.LoanNotActiveError:
+                st.error("❌ Cette location a déjà été retournée")
+                return
+            except Exception as e:
+                st.error(f"❌ Erreur SQL: {str(e)}")
+                return
+
+            st.success("✅ Livre retourné avec succès!")
+            st.rerun()
 
-            if success1:
-                # Réapprovisionner le livre
-                update_book = "UPDATE livres SET Quantite_disponible = Quantite_disponible + 1 WHERE ID_livre = %s"
-                success2 = execute_query(update_book, (int(selected_rental['ID_livre']),), fetch=False)
 
-                if success2:
-                    st.success("✅ Livre retourné avec succès!")
-                    st.rerun()
+def parse_scanned_ids(raw):
+    """Extrait les identifiants numériques d'une saisie (scan, copier-coller, séparateurs libres)"""
+    return [int(value) for value in re.findall(r'\d+', raw or "")]
+
+
+def batch_desk():
+    """Mode guichet : retours ou emprunts par lot en une seule transaction"""
+    st.markdown("## 📦 Mode Guichet")
+
+    mode = st.radio("Opération", ["🔄 Retours", "➕ Emprunts"], horizontal=True, key="desk_mode")
+    if mode == "🔄 Retours":
+        batch_desk_returns()
+    else:
+        batch_desk_checkouts()
+
+
+def batch_desk_returns():
+    """Retours par lot (bac de retours de fin de journée)"""
+    with st.form("desk_returns_form"):
+        id_type = st.radio("Identifiants scannés", ["Livre", "Location"], horizontal=True)
+        raw = st.text_area("Identifiants (un par ligne, scan ou copier-coller)", height=200)
+        if st.form_submit_button("👀 Prévisualiser"):
+            scanned = parse_scanned_ids(raw)
+            if id_type == "Livre":
+                location_ids, unmatched = circulation.resolve_active_loans(scanned)
+            else:
+                location_ids, unmatched = list(dict.fromkeys(scanned)), []
+            st.session_state['desk_returns'] = {'location_ids': location_ids, 'unmatched': unmatched}
+
+    pending = st.session_state.get('desk_returns')
+    if not pending:
+        return
+
+    if pending['unmatched']:
+        st.warning(f"⚠️ Aucune location active pour les livres: {', '.join(map(str, pending['unmatched']))}")
+
+    location_ids = pending['location_ids']
+    if not location_ids:
+        return
+
+    preview = execute_query(f"""
+        SELECT loc.ID_location, loc.ID_livre, l.Titre, u.nom, u.prenom, loc.Date_retour_prevue, loc.Statut
+        FROM locations loc
+        JOIN livres l ON loc.ID_livre = l.ID_livre
+        JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+        WHERE loc.ID_location IN ({', '.join(['%s'] * len(location_ids))})
+    """, location_ids) or []
+    st.dataframe(pd.DataFrame(preview), use_container_width=True, hide_index=True)
+
+    if st.button(f"✅ Valider {len(location_ids)} retour(s)", type="primary"):
+        try:
+            returned, rejected = circulation.batch_return(location_ids, datetime.now().date())
+        except Exception as e:
+            st.error(f"❌ Erreur SQL: {str(e)}")
+            return
+        del st.session_state['desk_returns']
+        st.success(f"✅ {len(returned)} livre(s) retourné(s)")
+        if rejected:
+            st.warning(f"⚠️ Locations ignorées (inconnues ou déjà retournées): {', '.join(map(str, rejected))}")
+
+
+def batch_desk_checkouts():
+    """Emprunts par lot pour un même étudiant"""
+    with st.form("desk_checkouts_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            student_id = st.number_input("ID Étudiant *", min_value=1, step=1)
+        with col2:
+            date_retour = st.date_input("Date de retour prévue", value=datetime.now().date() + timedelta(days=14))
+        raw = st.text_area("Identifiants des livres (un par ligne, scan ou copier-coller)", height=200)
+        if st.form_submit_button("👀 Prévisualiser"):
+            st.session_state['desk_checkouts'] = {'student_id': int(student_id), 'due_date': date_retour,
+                                                  'book_ids': parse_scanned_ids(raw)}
+
+    pending = st.session_state.get('desk_checkouts')
+    if not pending or not pending['book_ids']:
+        return
+
+    student = execute_query(
+        "SELECT ID_utilisateur, nom, prenom FROM utilisateurs WHERE ID_utilisateur = %s AND role = 'Etudiant'",
+        (pending['student_id'],))
+    if not student:
+        st.error("❌ Étudiant introuvable")
+        return
+    st.info(f"**Étudiant:** {student[0]['prenom']} {student[0]['nom']} | **Retour prévu:** {pending['due_date']}")
+
+    book_ids = pending['book_ids']
+    unique_ids = list(dict.fromkeys(book_ids))
+    preview = execute_query(f"""
+        SELECT ID_livre, Titre, Auteur, Quantite_disponible FROM livres
+        WHERE ID_livre IN ({', '.join(['%s'] * len(unique_ids))})
+    """, unique_ids) or []
+    df = pd.DataFrame(preview)
+    if not df.empty:
+        df['Demandés'] = df['ID_livre'].map(Counter(book_ids))
+    st.dataframe(df, use_container_width=True, hide_index=True)
+
+    if st.button(f"✅ Valider {len(book_ids)} emprunt(s)", type="primary"):
+        try:
+            lent, rejected = circulation.batch_checkout(book_ids, pending['student_id'], datetime.now().date(),
+                                                        pending['due_date'])
+        except Exception as e:
+            st.error(f"❌ Erreur SQL: {str(e)}")
+            return
+        del st.session_state['desk_checkouts']
+        st.success(f"✅ {len(lent)} livre(s) prêté(s)")
+        if rejected:
+            st.warning(f"⚠️ Livres indisponibles ou inconnus: {', '.join(map(str, rejected))}")
+
+
+def export_panel(name, query, params, key):
+    """Export en flux (CSV, CSV gzip, Parquet) d'une requête, sans charger le résultat en mémoire"""
+    with st.expander("📤 Exporter"):
+        fmt = st.selectbox("Format", list(export.FORMATS), index=1, key=f"{key}_format")
+        if st.button("📤 Générer l'export", key=f"{key}_button"):
+            path = export.export_path(name, fmt)
+            try:
+                with st.spinner("Export en cours..."):
+                    export.purge_exports()
+                    count = export.export_to_file(query, params, path, fmt)
+            except Exception as e:
+                st.error(f"❌ Erreur d'export: {str(e)}")
+                return
+            st.success(f"✅ {count} ligne(s) exportée(s) vers {path}")
+
+            # Le téléchargement passe par la mémoire du serveur Streamlit : réservé aux petits fichiers
+            size = os.path.getsize(path)
+            if size <= export.DOWNLOAD_MAX_MB * 1024 * 1024:
+                with open(path, 'rb') as f:
+                    st.download_button("⬇️ Télécharger", f.read(), file_name=os.path.basename(path),
+                                       key=f"{key}_download")
+            else:
+                st.info(f"📁 Fichier de {size / 1024 / 1024:.0f} Mo, trop volumineux pour le téléchargement "
+                        f"(max {export.DOWNLOAD_MAX_MB:.0f} Mo) : à récupérer sur le serveur, ou à générer "
+                        f"directement avec `python export.py`. Il est conservé {export.RETENTION_HOURS:.0f} h.")
 
 
 def show_rental_history():
@@ -693,60 +1303,45 @@ def show_rental_history():
     with col2:
         date_fin = st.date_input("Date de fin", value=datetime.now().date())
 
-    history = execute_query("""
-        SELECT loc.*, l.Titre, l.Auteur, u.nom, u.prenom 
-        FROM locations loc
-        JOIN livres l ON loc.ID_livre = l.ID_livre
-        JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
-        WHERE loc.Date_location BETWEEN %s AND %s
-        ORDER BY loc.Date_location DESC
-    """, (date_debut, date_fin))
-
-    if history:
-        # Nettoyer les données Decimal
-        for item in history:
-            for key in ['ID_location', 'ID_livre', 'ID_etudiant']:
-                if key in item:
-                    item[key] = convert_decimal(item[key])
-
-        df = pd.DataFrame(history)
-        st.dataframe(df, use_container_width=True)
+    history = keyset_pager("history_pager", queries.RENTAL_HISTORY, [date_debut, date_fin],
+                           queries.RENTAL_HISTORY_ORDER, descending=True)
+
+    if has_rows(history):
+        st.dataframe(history, use_container_width=True)
+
+        # Statistiques calculées côté serveur sur toute la période
+        period_stats = execute_query(queries.RENTAL_PERIOD_STATS, (date_debut, date_fin))
+        period_stats = period_stats[0] if period_stats else {'total': 0, 'returned': 0, 'active': 0}
 
-        # Statistiques
         st.markdown("### 📊 Statistiques de la Période")
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            total_rentals = len(history)
-            st.metric("Total Locations", total_rentals)
+            st.metric("Total Locations", int(period_stats['total']))
 
         with col2:
-            returned = len([h for h in history if h['Statut'] == 'Retourné'])
-            st.metric("Retournés", returned)
+            st.metric("Retournés", int(period_stats['returned']))
 
         with col3:
-            active = len([h for h in history if h['Statut'] not in ['Retourné', 'Annulé']])
-            st.metric("Actives", active)
+            st.metric("Actives", int(period_stats['active']))
     else:
         st.info("Aucune location trouvée pour cette période")
 
+    export_panel("historique", export.HISTORY_QUERY, (date_debut, date_fin), "history_export")
+
 
 # ================================= GESTION DES UTILISATEURS ==========================================
 
+@instrumentation.instrumented('page')
 def user_management():
     """Gestion complète des utilisateurs"""
     st.markdown("# 👥 Gestion des Utilisateurs")
 
-    tab1, tab2, tab3 = st.tabs(["📋 Liste Utilisateurs", "➕ Ajouter Utilisateur", "📊 Statistiques"])
-
-    with tab1:
-        show_users_list()
-
-    with tab2:
-        add_user_form()
-
-    with tab3:
-        show_user_statistics()
+    lazy_tabs("user_tabs", [
+        ("📋 Liste Utilisateurs", show_users_list),
+        ("➕ Ajouter Utilisateur", add_user_form),
+        ("📊 Statistiques", show_user_statistics)
+    ])
 
 
 def show_users_list():
@@ -761,7 +1356,7 @@ def show_users_list():
         search_term = st.text_input("Rechercher un utilisateur")
 
     # Requête avec filtres
-    query = "SELECT * FROM utilisateurs WHERE 1=1"
+    query = queries.USERS
     params = []
 
     if role_filter != "Tous":
@@ -772,25 +1367,23 @@ def show_users_list():
         query += " AND (nom LIKE %s OR prenom LIKE %s OR mail LIKE %s)"
         params.extend([f"%{search_term}%"] * 3)
 
-    users = execute_query(query, params)
-
-    if users:
-        # Nettoyer les données Decimal
-        for user in users:
-            for key in ['ID_utilisateur']:
-                if key in user:
-                    user[key] = convert_decimal(user[key])
-            # S'assurer que les clés existent
-            user.setdefault('prenom', '')
-            user.setdefault('nom', '')
-            user.setdefault('mail', '')
-            user.setdefault('role', '')
-
-        df = pd.DataFrame(users)
-        st.dataframe(df, use_container_width=True, hide_index=True)
+    users = keyset_pager("users_pager", query, params, [("ID_utilisateur", "ID_utilisateur")])
+
+    if has_rows(users):
+        st.dataframe(users.fillna(""), use_container_width=True, hide_index=True)
     else:
         st.info("Aucun utilisateur trouvé")
 
+    if st.session_state.user_role == "Admin":
+        with st.expander("🔒 Révoquer les sessions d'un utilisateur"):
+            user_id = st.number_input("ID utilisateur", min_value=1, step=1, key="revoke_user_id")
+            if st.button("Révoquer", key="revoke_user_sessions"):
+                try:
+                    count = sessions.get_store().revoke_user(int(user_id))
+                    st.success(f"✅ {count} session(s) révoquée(s)")
+                except Exception as e:
+                    st.error(f"❌ Erreur SQL: {str(e)}")
+
 
 def add_user_form():
     """Formulaire d'ajout d'utilisateur"""
@@ -842,123 +1435,79 @@ def add_user_form():
 def show_user_statistics():
     """Affiche les statistiques des utilisateurs"""
     st.markdown("## 📊 Statistiques des Utilisateurs")
+    show_report_freshness("user_stats_refresh")
 
     # Répartition par rôle
-    role_stats = execute_query("SELECT role, COUNT(*) as count FROM utilisateurs GROUP BY role")
+    df_roles = execute_report_df('users_by_role', queries.USERS_BY_ROLE)
 
-    if role_stats:
-        # Nettoyer les données Decimal
-        for stat in role_stats:
-            if 'count' in stat:
-                stat['count'] = convert_decimal(stat['count'])
-
-        df_roles = pd.DataFrame(role_stats)
-        df_roles['count'] = df_roles['count'].astype(int)
+    if has_rows(df_roles):
         fig = px.pie(df_roles, values='count', names='role', title="Répartition des utilisateurs par rôle")
         st.plotly_chart(fig, use_container_width=True)
 
     # Utilisateurs les plus actifs
-    active_users = execute_query("""
-        SELECT u.nom, u.prenom, u.role, COUNT(l.ID_location) as rental_count
-        FROM utilisateurs u
-        LEFT JOIN locations l ON u.ID_utilisateur = l.ID_etudiant
-        WHERE u.role = 'Etudiant'
-        GROUP BY u.ID_utilisateur, u.nom, u.prenom, u.role
-        ORDER BY rental_count DESC
-        LIMIT 10
-    """)
-
-    if active_users:
-        # Nettoyer les données Decimal
-        for user in active_users:
-            if 'rental_count' in user:
-                user['rental_count'] = convert_decimal(user['rental_count'])
+    df_active = read_shared('top_users')
 
+    if has_rows(df_active):
         st.markdown("### 🏆 Utilisateurs les Plus Actifs")
-        df_active = pd.DataFrame(active_users)
-        df_active['rental_count'] = df_active['rental_count'].astype(int)
         st.dataframe(df_active, use_container_width=True)
 
 
 # ================================= RAPPORTS AVANCÉS ==========================================
 
+@instrumentation.instrumented('page')
 def advanced_reports():
     """Module de rapports avancés"""
     st.markdown("# 📊 Rapports Avancés")
 
-    tab1, tab2 = st.tabs(["📈 Rapport Complet", "🔍 Analyse Avancée"])
-
-    with tab1:
-        generate_comprehensive_report()
-
-    with tab2:
-        advanced_analysis()
+    lazy_tabs("report_tabs", [
+        ("📈 Rapport Complet", generate_comprehensive_report),
+        ("🔍 Analyse Avancée", advanced_analysis),
+        ("📦 Prévision des Besoins", show_copy_forecast)
+    ])
 
 
 def generate_comprehensive_report():
     """Génère un rapport complet"""
     st.markdown("## 📈 Rapport Complet de la Bibliothèque")
+    show_report_freshness("report_refresh")
+
+    # Lectures indépendantes exécutées en parallèle
+    data = execute_parallel({
+        'kpis': report_task('kpis', queries.KPI_SNAPSHOT),
+        'monthly_loans': report_task('monthly_loans', queries.MONTHLY_LOANS),
+        'top_authors': report_task('top_authors', queries.TOP_AUTHORS)
+    })
 
     # Métriques principales
     col1, col2, col3, col4 = st.columns(4)
 
-    total_books = execute_query("SELECT COUNT(*) as total FROM livres")
-    total_users = execute_query("SELECT COUNT(*) as total FROM utilisateurs")
-    total_rentals = execute_query("SELECT COUNT(*) as total FROM locations")
-    active_rentals = execute_query(
-        "SELECT COUNT(*) as active FROM locations WHERE Statut NOT IN ('Retourné', 'Annulé')")
+    kpis = compute_kpis(data['kpis'])
 
     with col1:
-        st.metric("Total Livres", int(total_books[0]['total']) if total_books else 0)
+        st.metric("Total Livres", kpis.get('total_books', 0))
     with col2:
-        st.metric("Total Utilisateurs", int(total_users[0]['total']) if total_users else 0)
+        st.metric("Total Utilisateurs", kpis.get('total_users', 0))
     with col3:
-        st.metric("Total Locations", int(total_rentals[0]['total']) if total_rentals else 0)
+        st.metric("Total Locations", kpis.get('total_rentals', 0))
     with col4:
-        st.metric("Locations Actives", int(active_rentals[0]['active']) if active_rentals else 0)
+        st.metric("Locations Actives", kpis.get('active_rentals', 0))
 
     # Graphiques
     col_left, col_right = st.columns(2)
 
     with col_left:
         # Évolution mensuelle des locations
-        monthly_data = execute_query("""
-            SELECT DATE_FORMAT(Date_location, '%Y-%m') as mois, COUNT(*) as locations
-            FROM locations 
-            GROUP BY mois 
-            ORDER BY mois
-        """)
-
-        if monthly_data:
-            # Nettoyer les données Decimal
-            for data in monthly_data:
-                if 'locations' in data:
-                    data['locations'] = convert_decimal(data['locations'])
-
-            df_monthly = pd.DataFrame(monthly_data)
-            df_monthly['locations'] = df_monthly['locations'].astype(int)
+        df_monthly = data['monthly_loans']
+
+        if has_rows(df_monthly):
             fig = px.line(df_monthly, x='mois', y='locations', title="Évolution Mensuelle des Locations")
             st.plotly_chart(fig, use_container_width=True)
 
     with col_right:
         # Top 5 des auteurs les plus empruntés
-        top_authors = execute_query("""
-            SELECT l.Auteur, COUNT(loc.ID_location) as locations
-            FROM livres l
-            JOIN locations loc ON l.ID_livre = loc.ID_livre
-            GROUP BY l.Auteur
-            ORDER BY locations DESC
-            LIMIT 5
-        """)
-
-        if top_authors:
-            # Nettoyer les données Decimal
-            for author in top_authors:
-                if 'locations' in author:
-                    author['locations'] = convert_decimal(author['locations'])
-
-            df_authors = pd.DataFrame(top_authors)
-            df_authors['locations'] = df_authors['locations'].astype(int)
+        df_authors = data['top_authors']
+
+        if has_rows(df_authors):
             fig = px.bar(df_authors, x='Auteur', y='locations', title="Auteurs les Plus Populaires")
             st.plotly_chart(fig, use_container_width=True)
 
@@ -966,37 +1515,193 @@ def generate_comprehensive_report():
 def advanced_analysis():
     """Analyse avancée des données"""
     st.markdown("## 🔍 Analyse Avancée")
+    show_report_freshness("analysis_refresh")
 
     # Analyse des retards
     st.markdown("### ⚠️ Analyse des Retards")
 
-    retards = execute_query("""
-        SELECT u.nom, u.prenom, l.Titre, loc.Date_retour_prevue,
-               DATEDIFF(CURDATE(), loc.Date_retour_prevue) as jours_retard
-        FROM locations loc
-        JOIN livres l ON loc.ID_livre = l.ID_livre
-        JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
-        WHERE loc.Date_retour_prevue < CURDATE() 
-        AND loc.Statut NOT IN ('Retourné', 'Annulé')
-        ORDER BY jours_retard DESC
-    """)
+    df_retards = read_shared('overdue')
 
-    if retards:
-        # Nettoyer les données Decimal
-        for retard in retards:
-            if 'jours_retard' in retard:
-                retard['jours_retard'] = convert_decimal(retard['jours_retard'])
-
-        df_retards = pd.DataFrame(retards)
+    if has_rows(df_retards):
         st.dataframe(df_retards, use_container_width=True)
 
         # Statistiques des retards
-        if not df_retards.empty:
-            retard_moyen = df_retards['jours_retard'].mean()
-            st.metric("📅 Retard Moyen", f"{float(retard_moyen):.1f} jours")
+        retard_moyen = df_retards['jours_retard'].mean()
+        st.metric("📅 Retard Moyen", f"{float(retard_moyen):.1f} jours")
     else:
         st.info("Aucun retard actuellement")
 
+    export_panel("retards", export.OVERDUE_QUERY, (), "overdue_export")
+    if st.session_state.user_role == "Admin":
+        reminder_panel()
+
+
+def reminder_panel():
+    """Rappels par mail des locations en retard ou bientôt dues, un mail par utilisateur"""
+    with st.expander("📧 Rappels par mail"):
+        st.caption(f"Retards et retours prévus sous {reminders.DAYS_AHEAD} jour(s) · au plus un rappel tous les "
+                   f"{reminders.REMINDER_INTERVAL} jour(s) par utilisateur · serveur "
+                   f"{reminders.SMTP_HOST}:{reminders.SMTP_PORT} · gros volumes : `python reminders.py send`")
+        col1, col2 = st.columns(2)
+        with col1:
+            preview = st.button("🔍 Compter les rappels", key="reminders_preview")
+        with col2:
+            send = st.button("📧 Envoyer les rappels", key="reminders_send", type="primary")
+
+        if preview:
+            try:
+                pending = reminders.select_reminders()
+            except Exception as e:
+                st.error(f"❌ Erreur SQL: {str(e)}")
+                return
+            st.info(f"{len(pending)} rappel(s) à envoyer ({sum(len(r['loans']) for r in pending)} location(s))")
+
+        if send:
+            progress = st.progress(0.0)
+
+            def on_progress(sent, failed, total):
+                if (sent + failed) % 50 == 0 or sent + failed == total:
+                    progress.progress((sent + failed) / total, text=f"{sent + failed}/{total}")
+
+            try:
+                summary = reminders.send_reminders(on_progress=on_progress)
+            except Exception as e:
+                st.error(f"❌ Erreur d'envoi: {str(e)}")
+                return
+            st.success(f"✅ {summary['sent']} rappel(s) envoyé(s) en {summary['seconds']:.1f} s")
+            if summary['skipped']:
+                st.warning(f"⚠️ {summary['skipped']} utilisateur(s) sans adresse mail")
+            if summary['failed']:
+                st.error(f"❌ {summary['failed']} échec(s) : " + " ; ".join(summary['errors']))
+
+
+def show_copy_forecast():
+    """Titres dont la demande prévue au pic dépasse le nombre d'exemplaires"""
+    st.markdown("## 📦 Prévision de la Demande")
+    result, computed_at = forecast.load_forecast()
+
+    col_info, col_refresh = st.columns([4, 1])
+    with col_info:
+        if computed_at is not None:
+            st.caption(f"🕒 Prévision du {computed_at.strftime('%d/%m/%Y à %H:%M')} sur "
+                       f"{forecast.HORIZON_WEEKS} semaines (calcul nocturne : `python forecast.py run`)")
+    if st.session_state.user_role == "Admin":
+        with col_refresh:
+            if st.button("🔄 Recalculer", key="forecast_refresh"):
+                try:
+                    with st.spinner("Prévision en cours..."):
+                        forecast.run()
+                except Exception as e:
+                    st.error(f"❌ Erreur de prévision: {str(e)}")
+                    return
+                st.rerun()
+
+    if result is None:
+        st.info("Aucune prévision calculée")
+        return
+
+    shortfall = result[result['Manque'] > 0]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("📚 Titres en tension", len(shortfall))
+    with col2:
+        st.metric("➕ Exemplaires manquants", int(shortfall['Manque'].sum()))
+    with col3:
+        st.metric("📈 Emprunts prévus au pic", f"{result['Demande_pic'].sum():.0f} / semaine")
+
+    if not has_rows(shortfall):
+        st.success("✅ Les exemplaires couvrent la demande prévue de tous les titres")
+        return
+
+    fig = px.bar(shortfall.head(20), x='Titre', y=['Exemplaires', 'Manque'],
+                 title="Exemplaires actuels et manquants au pic de demande (20 premiers titres)")
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(shortfall, use_container_width=True, hide_index=True)
+
+
+def show_copy_recommendation(book_id):
+    """Exemplaires recommandés par la dernière prévision pour un livre"""
+    result, _ = forecast.load_forecast()
+    if result is None:
+        return
+    row = result[result['ID_livre'] == book_id]
+    if not has_rows(row):
+        return
+    row = row.iloc[0]
+    message = (f"📦 Prévision : {int(row['Exemplaires_recommandes'])} exemplaire(s) au total au pic de demande "
+               f"(semaine du {row['Semaine_pic'].strftime('%d/%m/%Y')}), {int(row['Exemplaires'])} actuellement")
+    if row['Manque'] > 0:
+        st.warning(message)
+    else:
+        st.caption(message)
+
+
+# ================================= PERFORMANCE ==========================================
+
+def performance_page():
+    """Temps des requêtes et des pages mesurés par le processus (administrateurs)"""
+    st.markdown("# ⏱️ Performance")
+    recorder = instrumentation.recorder
+
+    queries_summary = recorder.summary('query')
+    pages_summary = recorder.summary('page')
+    slow_calls = recorder.slow_calls()
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Appels mesurés", len(recorder.events()))
+    with col2:
+        st.metric("Requêtes distinctes", len(queries_summary))
+    with col3:
+        st.metric("Appels lents", len(slow_calls))
+    with col4:
+        st.metric("Seuil de lenteur", f"{recorder.slow_threshold_ms:.0f} ms")
+
+    tab1, tab2, tab3 = st.tabs(["🐢 Requêtes", "📄 Pages", "🚨 Appels Lents"])
+
+    with tab1:
+        st.markdown("### Requêtes par temps total")
+        if queries_summary.empty:
+            st.info("Aucune requête mesurée pour l'instant")
+        else:
+            st.dataframe(queries_summary, use_container_width=True, hide_index=True)
+            show_latency_histogram('query', queries_summary['name'].tolist(), "perf_query")
+
+    with tab2:
+        st.markdown("### Temps de rendu des pages")
+        if pages_summary.empty:
+            st.info("Aucune page mesurée pour l'instant")
+        else:
+            st.dataframe(pages_summary, use_container_width=True, hide_index=True)
+            show_latency_histogram('page', pages_summary['name'].tolist(), "perf_page")
+
+    with tab3:
+        st.markdown(f"### Derniers appels au-delà de {recorder.slow_threshold_ms:.0f} ms")
+        if slow_calls.empty:
+            st.info("Aucun appel lent")
+        else:
+            st.dataframe(slow_calls, use_container_width=True, hide_index=True)
+
+    col_export, col_clear = st.columns(2)
+    with col_export:
+        st.download_button("⬇️ Exporter (JSON lines)", recorder.to_jsonl(),
+                           file_name=f"performance_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                           mime="application/x-ndjson")
+    with col_clear:
+        if st.button("🧹 Réinitialiser les mesures"):
+            recorder.clear()
+            st.rerun()
+
+
+def show_latency_histogram(kind, names, key):
+    """Histogramme des durées d'une requête ou d'une page choisie"""
+    name = st.selectbox("Distribution des latences", names, key=key,
+                        format_func=lambda value: value if len(value) <= 120 else value[:117] + "...")
+    events = instrumentation.recorder.events(kind)
+    fig = px.histogram(events[events['name'] == name], x='duration_ms', nbins=40,
+                       labels={'duration_ms': "Durée (ms)"}, title="Répartition des durées")
+    st.plotly_chart(fig, use_container_width=True)
+
 
 # ================================= APPLICATION PRINCIPALE ==========================================
 
@@ -1004,6 +1709,14 @@ def main():
     """Application principale"""
     init_session_state()
 
+    if AUTO_MIGRATE:
+        try:
+            apply_schema_migrations()
+        except Exception as e:
+            st.error(f"❌ Erreur de migration du schéma: {str(e)}")
+    if analytics.available():
+        get_analytics_store()
+
     # En-tête
     st.markdown("""
     <div style="text-align: center; padding: 2rem; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 10px; margin-bottom: 2rem;">
@@ -1012,7 +1725,12 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
-    # Authentification
+    # Authentification (session persistante reprise depuis l'URL le cas échéant)
+    if not st.session_state.authenticated:
+        restore_session()
+    else:
+        check_session()
+
     if not st.session_state.authenticated:
         show_login_interface()
     else:
@@ -1046,6 +1764,7 @@ def show_login_interface():
                         'user_email': email,
                         'user_id': user_id
                     })
+                    start_session(user_id)
                     st.success(f"✅ Connexion réussie! Bienvenue {name}")
                     st.rerun()
                 else:
@@ -1072,6 +1791,54 @@ def show_login_interface():
             """)
 
 
+def show_pool_stats():
+    """Affiche l'occupation du pool de connexions (dimensionnement)"""
+    stats = database.get_pool().stats()
+    with st.expander("🔌 Pool de connexions"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Utilisées", f"{stats['in_use']}/{stats['size']}")
+            st.metric("Attentes", stats['waits'])
+        with col2:
+            st.metric("Attente moy.", f"{stats['avg_wait'] * 1000:.0f} ms")
+            st.metric("Attente max", f"{stats['max_wait'] * 1000:.0f} ms")
+        st.caption(f"Emprunts: {stats['checkouts']} | Reconnexions: {stats['reconnects']} | "
+                   f"Timeouts: {stats['timeouts']}")
+
+
+def show_cache_stats():
+    """Affiche l'efficacité du cache des requêtes"""
+    stats = database.query_cache.stats()
+    with st.expander("🗄️ Cache des requêtes"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Taux de succès", f"{stats['hit_rate'] * 100:.0f}%")
+            st.metric("Entrées", stats['entries'])
+        with col2:
+            st.metric("Hits", stats['hits'])
+            st.metric("Misses", stats['misses'])
+        st.caption(f"Évictions: {stats['evictions']} | Expirations: {stats['expirations']} | "
+                   f"Invalidations: {stats['invalidations']}")
+        if st.button("🧹 Vider le cache"):
+            database.query_cache.invalidate()
+
+
+def show_precompute_stats():
+    """Affiche l'état des résultats partagés entre sessions"""
+    stats = get_precomputer().stats()
+    with st.expander("♻️ Résultats partagés"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Lectures servies", stats['hits'])
+            st.metric("Calculs", stats['computes'])
+        with col2:
+            st.metric("Attentes groupées", stats['joins'])
+            st.metric("Erreurs", stats['errors'])
+        for name, entry in stats['entries'].items():
+            computed_at = entry['computed_at'] and datetime.fromtimestamp(entry['computed_at']).strftime('%H:%M:%S')
+            st.caption(f"{name}: {computed_at or '-'}{' (à recalculer)' if entry['stale'] else ''}")
+
+
 def show_main_application():
     """Application principale après connexion"""
     # Sidebar
@@ -1094,11 +1861,15 @@ def show_main_application():
             "👥 Gestion des Utilisateurs",
             "📈 Rapports Avancés"
         ]
+        menu_icons = ["graph-up", "book", "calendar-check", "people", "bar-chart"]
+        if st.session_state.user_role == "Admin":
+            menu_options.append("⏱️ Performance")
+            menu_icons.append("speedometer2")
 
         selected = option_menu(
             menu_title="📋 Navigation Principale",
             options=menu_options,
-            icons=["graph-up", "book", "calendar-check", "people", "bar-chart"],
+            icons=menu_icons,
             default_index=0,
             styles={
                 "container": {"padding": "0!important"},
@@ -1109,9 +1880,13 @@ def show_main_application():
 
         st.markdown("---")
 
+        if st.session_state.user_role == "Admin":
+            show_pool_stats()
+            show_cache_stats()
+            show_precompute_stats()
+
         if st.button("🚪 Déconnexion", type="secondary"):
-            for key in list(st.session_state.keys()):
-                del st.session_state[key]
+            end_session()
             st.rerun()
 
     # Routage des pages
@@ -1125,6 +1900,8 @@ def show_main_application():
         user_management()
     elif selected == "📈 Rapports Avancés":
         advanced_reports()
+    elif selected == "⏱️ Performance" and st.session_state.user_role == "Admin":
+        performance_page()
 
 
 if __name__ == "__main__":
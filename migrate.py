@@ -0,0 +1,167 @@
+import os
+import re
+import sys
+
+import backends
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# Verrou MySQL évitant que deux processus appliquent les migrations en même temps (SQLite : transaction)
+LOCK_NAME = 'biblio_schema_migrations'
+LOCK_TIMEOUT = 60
+
+# NNN_nom.sql, ou NNN_nom.<moteur>.sql pour la version propre à un moteur (prioritaire sur ce moteur)
+_FILENAME_RE = re.compile(r'^(\d+)_([A-Za-z0-9_]+)(?:\.(' + '|'.join(backends.BACKENDS) + r'))?\.sql$')
+
+
+class MigrationError(Exception):
+    """Échec d'application d'une migration"""
+
+
+# ================================= MIGRATIONS ==========================================
+
+def discover_migrations(directory=MIGRATIONS_DIR, backend=None):
+    """Liste triée des migrations [(version, nom, chemin)] du dossier migrations/ pour le moteur donné"""
+    backend = backend or database.BACKEND
+    generic, specific = [], {}
+    for filename in os.listdir(directory):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        migration = (int(match.group(1)), match.group(2), os.path.join(directory, filename))
+        if match.group(3) is None:
+            generic.append(migration)
+        elif match.group(3) == backend:
+            specific[migration[0]] = migration
+
+    versions = [version for version, _, _ in generic]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Deux fichiers de migration portent le même numéro")
+    return sorted(specific.get(migration[0], migration) for migration in generic)
+
+
+def split_statements(sql):
+    """Découpe un fichier SQL en instructions (commentaires -- ignorés)"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def bootstrap_schema(cursor, log=print):
+    """Crée les tables de base (Tables_Mysql.sql / Tables_SQLite.sql) sur une base vide ; retourne True si créées"""
+    if database.table_exists(cursor, 'livres'):
+        return False
+    log(f"Création du schéma de base ({database.BACKEND})...")
+    with open(backends.SCHEMA_FILES[database.BACKEND], encoding='utf-8') as f:
+        for statement in split_statements(f.read()):
+            cursor.execute(statement)
+    return True
+
+
+def _ensure_tracking_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+
+
+def _applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def status():
+    """Retourne [(version, nom, appliquée)] pour chaque migration connue"""
+    with database.pooled_connection() as connection:
+        cursor = connection.cursor(buffered=True)
+        try:
+            _ensure_tracking_table(cursor)
+            applied = _applied_versions(cursor)
+        finally:
+            cursor.close()
+    return [(version, name, version in applied) for version, name, _ in discover_migrations()]
+
+
+def _acquire_lock(cursor):
+    if database.BACKEND != 'mysql':
+        return
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        raise MigrationError("Impossible d'obtenir le verrou des migrations")
+
+
+def _release_lock(cursor):
+    if database.BACKEND != 'mysql':
+        return
+    cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    cursor.fetchall()
+
+
+def apply_pending(log=print):
+    """Applique dans l'ordre les migrations non encore enregistrées ; retourne leurs versions"""
+    applied_now = []
+    with database.pooled_connection() as connection:
+        cursor = connection.cursor(buffered=True)
+        try:
+            _acquire_lock(cursor)
+            try:
+                bootstrap_schema(cursor, log)
+                _ensure_tracking_table(cursor)
+                applied = _applied_versions(cursor)
+
+                for version, name, path in discover_migrations():
+                    if version in applied:
+                        continue
+                    with open(path, encoding='utf-8') as f:
+                        statements = split_statements(f.read())
+                    if database.BACKEND == 'sqlite':
+                        # DDL transactionnel : la migration est atomique, et le verrou d'écriture
+                        # empêche un autre processus de l'appliquer en même temps
+                        connection.start_transaction()
+                        if version in _applied_versions(cursor):
+                            connection.rollback()
+                            continue
+                    log(f"Application de la migration {version:03d}_{name}...")
+                    try:
+                        # MySQL valide implicitement chaque DDL : une migration doit rester rejouable à la main
+                        for statement in statements:
+                            cursor.execute(statement)
+                        cursor.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, NOW())",
+                                       (version, name))
+                        connection.commit()
+                    except Exception as e:
+                        raise MigrationError(f"Migration {version:03d}_{name} en échec: {e}") from e
+                    applied_now.append(version)
+            finally:
+                _release_lock(cursor)
+        finally:
+            cursor.close()
+
+    if applied_now:
+        # Le schéma a changé : les résultats en cache ne sont plus fiables
+        database.query_cache.invalidate()
+    return applied_now
+
+
+def main(argv):
+    """Point d'entrée : `python migrate.py [apply|status]`"""
+    command = argv[1] if len(argv) > 1 else 'apply'
+    if command == 'status':
+        for version, name, applied in status():
+            print(f"[{'x' if applied else ' '}] {version:03d}_{name}")
+    elif command == 'apply':
+        applied = apply_pending()
+        print(f"{len(applied)} migration(s) appliquée(s)" if applied else "Schéma à jour")
+    else:
+        print("Usage: python migrate.py [apply|status]")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
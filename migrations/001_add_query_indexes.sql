@@ -0,0 +1,14 @@
+-- Index correspondant aux filtres et regroupements de main.py
+
+-- Locations actives / en retard : Statut NOT IN (...) AND Date_retour_prevue < CURDATE()
+CREATE INDEX idx_locations_statut_retour ON locations (Statut, Date_retour_prevue);
+
+-- Historique, activité des 30 derniers jours, évolution mensuelle (clé de pagination Date_location, ID_location)
+CREATE INDEX idx_locations_date_location ON locations (Date_location);
+
+-- Filtres du catalogue et statistiques par genre
+CREATE INDEX idx_livres_genre ON livres (Genre);
+CREATE INDEX idx_livres_quantite ON livres (Quantite_disponible);
+
+-- Liste des étudiants et filtre par rôle
+CREATE INDEX idx_utilisateurs_role ON utilisateurs (role);
@@ -0,0 +1,4 @@
+-- Connexion par email : recherche par égalité sur mail, unicité garantie par la base
+-- (les doublons éventuels doivent être fusionnés avant d'appliquer cette migration)
+ALTER TABLE utilisateurs MODIFY mail VARCHAR(255);
+CREATE UNIQUE INDEX uq_utilisateurs_mail ON utilisateurs (mail);
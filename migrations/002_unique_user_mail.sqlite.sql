@@ -0,0 +1,2 @@
+-- Version SQLite de 002_unique_user_mail.sql : les colonnes TEXT s'indexent sans changer de type
+CREATE UNIQUE INDEX uq_utilisateurs_mail ON utilisateurs (mail);
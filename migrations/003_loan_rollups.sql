@@ -0,0 +1,39 @@
+-- Agrégats quotidiens des locations, tenus à jour par create_new_rental / return_book
+-- (reconstruction : python rollups.py rebuild)
+--   nb_emprunts : locations par Date_location
+--   nb_retours  : retours par Date_retour_effective
+--   nb_retards  : retours effectués après Date_retour_prevue, comptés le jour du retour
+
+ALTER TABLE locations ADD COLUMN Date_retour_effective DATE NULL;
+
+CREATE TABLE IF NOT EXISTS stats_locations_jour (
+    jour DATE PRIMARY KEY,
+    nb_emprunts INT NOT NULL DEFAULT 0,
+    nb_retours INT NOT NULL DEFAULT 0,
+    nb_retards INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_locations_jour_genre_auteur (
+    jour DATE NOT NULL,
+    Genre VARCHAR(50) NOT NULL DEFAULT '',
+    Auteur VARCHAR(100) NOT NULL DEFAULT '',
+    nb_emprunts INT NOT NULL DEFAULT 0,
+    nb_retours INT NOT NULL DEFAULT 0,
+    nb_retards INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (jour, Genre, Auteur),
+    INDEX idx_stats_auteur (Auteur)
+);
+
+-- Reprise de l'historique des emprunts (les retours antérieurs n'ont pas de date effective)
+INSERT INTO stats_locations_jour (jour, nb_emprunts)
+SELECT Date_location, COUNT(*)
+FROM locations
+WHERE Date_location IS NOT NULL
+GROUP BY Date_location;
+
+INSERT INTO stats_locations_jour_genre_auteur (jour, Genre, Auteur, nb_emprunts)
+SELECT loc.Date_location, COALESCE(l.Genre, ''), COALESCE(l.Auteur, ''), COUNT(*)
+FROM locations loc
+JOIN livres l ON loc.ID_livre = l.ID_livre
+WHERE loc.Date_location IS NOT NULL
+GROUP BY loc.Date_location, COALESCE(l.Genre, ''), COALESCE(l.Auteur, '');
@@ -0,0 +1,16 @@
+-- Sessions de connexion (jetons signés de sessions.py) : permet la révocation côté serveur
+--   Date_revocation : renseignée à la déconnexion ou par un administrateur
+
+CREATE TABLE IF NOT EXISTS sessions (
+    ID_session VARCHAR(64) PRIMARY KEY,
+    ID_utilisateur INT NOT NULL,
+    Date_creation DATETIME NOT NULL,
+    Date_expiration DATETIME NOT NULL,
+    Date_revocation DATETIME NULL
+);
+
+-- Révocation de toutes les sessions d'un utilisateur
+CREATE INDEX idx_sessions_utilisateur ON sessions (ID_utilisateur);
+
+-- Relevé périodique des révocations récentes par chaque processus serveur
+CREATE INDEX idx_sessions_revocation ON sessions (Date_revocation);
@@ -0,0 +1,4 @@
+-- Sélecteur d'étudiants de la nouvelle location : recherche par début de nom ou de prénom
+-- (le début de mail utilise uq_utilisateurs_mail)
+CREATE INDEX idx_utilisateurs_nom ON utilisateurs (nom);
+CREATE INDEX idx_utilisateurs_prenom ON utilisateurs (prenom);
@@ -0,0 +1,11 @@
+-- Journal des rappels de retour envoyés par mail (reminders.py) : un rappel par utilisateur et par jour
+--   la clé primaire empêche les doublons et sert la reprise d'un envoi interrompu
+
+CREATE TABLE IF NOT EXISTS rappels (
+    ID_utilisateur INT NOT NULL,
+    Date_rappel DATE NOT NULL,
+    Nb_retards INT NOT NULL,
+    Nb_echeances INT NOT NULL,
+    Date_envoi DATETIME NOT NULL,
+    PRIMARY KEY (ID_utilisateur, Date_rappel)
+);
@@ -0,0 +1,2 @@
+-- Retour de livre : recherche des locations en cours d'un étudiant ou d'un livre
+-- (sous MySQL, InnoDB indexe déjà les colonnes des clés étrangères ID_etudiant et ID_livre)
@@ -0,0 +1,3 @@
+-- Version SQLite de 007_loan_lookup_indexes.sql : les clés étrangères n'y sont pas indexées automatiquement
+CREATE INDEX idx_locations_etudiant ON locations (ID_etudiant);
+CREATE INDEX idx_locations_livre ON locations (ID_livre);
@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+
+import database
+import instrumentation
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Intervalle (secondes) de recalcul en arrière-plan des résultats partagés (0 : calcul à chaque lecture)
+REFRESH_INTERVAL = float(os.environ.get('BIBLIO_PRECOMPUTE_INTERVAL', 60))
+# Après une écriture, délai (secondes) laissé aux écritures suivantes avant le recalcul (rafales au comptoir)
+WRITE_DELAY = 1.0
+
+
+# ================================= RÉSULTATS PARTAGÉS ==========================================
+
+class _Entry:
+    def __init__(self, name, compute, tables):
+        self.name = name
+        self.compute = compute
+        self.tables = frozenset(tables)
+        self.value = None
+        self.error = None
+        self.computed_at = None  # time.time() du dernier calcul réussi
+        self.version = 0  # incrémenté à chaque écriture sur une des tables
+        self.computed_version = -1
+        self.inflight = None  # threading.Event du calcul en cours
+
+
+class Precomputer:
+    """Résultats coûteux partagés par toutes les sessions, recalculés par un thread d'arrière-plan
+
+    Chaque entrée est recalculée toutes les `interval` secondes et peu après une écriture sur une
+    des tables dont elle dépend. Une session qui trouve une entrée périmée la recalcule ; les
+    demandes simultanées attendent ce calcul unique au lieu d'en lancer chacune un (single-flight).
+    Les valeurs sont partagées : les appelants ne doivent pas les modifier.
+    """
+
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'hits': 0, 'computes': 0, 'joins': 0, 'errors': 0}
+
+    def register(self, name, compute, tables=()):
+        """Déclare une entrée : `compute` est une fonction sans argument, sans appel à Streamlit"""
+        with self._lock:
+            self._entries[name] = _Entry(name, compute, tables)
+
+    def start(self):
+        """Lance le thread de recalcul et l'abonne aux écritures (sans effet si interval vaut 0)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        database.add_write_listener(self.invalidate)
+        self._thread = threading.Thread(target=self._run, name='biblio-precompute', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def invalidate(self, tables=None):
+        """Périme les entrées dépendant des tables écrites (toutes si None) et réveille le thread"""
+        with self._lock:
+            for entry in self._entries.values():
+                if tables is None or entry.tables & set(tables):
+                    entry.version += 1
+        self._wake.set()
+
+    def _fresh(self, entry, max_age):
+        return (entry.computed_at is not None and entry.computed_version == entry.version
+                and time.time() - entry.computed_at < max_age)
+
+    # --------------------------------- Lecture ---------------------------------
+
+    def get(self, name):
+        """Valeur de l'entrée, recalculée d'abord si elle est périmée"""
+        entry = self._entries[name]
+        # Marge de deux intervalles : en temps normal le thread a recalculé l'entrée avant
+        max_age = self.interval * 2
+        with self._lock:
+            if self._fresh(entry, max_age):
+                self._stats['hits'] += 1
+                return entry.value
+            inflight = entry.inflight
+            if inflight is None:
+                entry.inflight = threading.Event()
+            else:
+                self._stats['joins'] += 1
+
+        if inflight is None:
+            self._compute(entry)
+        else:
+            inflight.wait()
+
+        with self._lock:
+            if entry.computed_at is None:
+                raise entry.error
+            # En cas d'échec du recalcul, la dernière valeur calculée reste servie
+            return entry.value
+
+    def refresh(self, name):
+        """Recalcule l'entrée, sauf si un calcul est déjà en cours"""
+        entry = self._entries[name]
+        with self._lock:
+            if entry.inflight is not None:
+                return
+            entry.inflight = threading.Event()
+        self._compute(entry)
+
+    def _compute(self, entry):
+        """Calcule l'entrée dont l'appelant a posé `inflight`, puis libère les threads en attente"""
+        with self._lock:
+            version = entry.version
+        value, error = None, None
+        try:
+            with instrumentation.timed('precompute', entry.name):
+                value = entry.compute()
+        except Exception as e:
+            error = e
+
+        with self._lock:
+            if error is None:
+                entry.value = value
+                entry.error = None
+                entry.computed_at = time.time()
+                # Une écriture survenue pendant le calcul laisse l'entrée périmée
+                entry.computed_version = version
+                self._stats['computes'] += 1
+            else:
+                entry.error = error
+                self._stats['errors'] += 1
+            inflight, entry.inflight = entry.inflight, None
+        inflight.set()
+
+    # --------------------------------- Arrière-plan ---------------------------------
+
+    def _run(self):
+        # Premier passage au démarrage du serveur : les premières sessions trouvent les calculs lancés
+        while True:
+            with self._lock:
+                # Seuil d'un demi-intervalle : chaque entrée est recalculée à chaque passage périodique
+                stale = [name for name, entry in self._entries.items()
+                         if not self._fresh(entry, self.interval / 2)]
+            for name in stale:
+                self.refresh(name)
+
+            woken = self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            if woken:
+                self._stop.wait(WRITE_DELAY)
+            if self._stop.is_set():
+                return
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = {name: {'computed_at': entry.computed_at,
+                                       'stale': entry.computed_version != entry.version,
+                                       'error': str(entry.error) if entry.error else None}
+                                for name, entry in self._entries.items()}
+        return stats
@@ -0,0 +1,174 @@
+# Requêtes SQL des pages de l'application, partagées avec la suite de benchmarks (benchmark.py)
+
+
+# ================================= DASHBOARD ==========================================
+
+KPI_SNAPSHOT = """
+    SELECT
+        (SELECT COUNT(*) FROM livres) as total_books,
+        (SELECT COALESCE(SUM(Quantite_disponible), 0) FROM livres) as total_copies,
+        (SELECT COUNT(*) FROM utilisateurs) as total_users,
+        loc.total_rentals, loc.active_rentals, loc.overdue_rentals
+    FROM (
+        SELECT COUNT(*) as total_rentals,
+               COALESCE(SUM(Statut NOT IN ('Retourné', 'Annulé')), 0) as active_rentals,
+               COALESCE(SUM(Statut NOT IN ('Retourné', 'Annulé') AND Date_retour_prevue < CURDATE()), 0)
+                   as overdue_rentals
+        FROM locations
+    ) loc
+"""
+
+TOP_GENRES = "SELECT Genre, COUNT(*) as count FROM livres WHERE Genre IS NOT NULL GROUP BY Genre ORDER BY count DESC LIMIT 5"
+
+RECENT_ACTIVITY = """
+    SELECT jour as date, nb_emprunts as rentals
+    FROM stats_locations_jour
+    WHERE jour >= DATE_SUB(CURDATE(), INTERVAL 30 DAY) AND nb_emprunts > 0
+    ORDER BY jour
+"""
+
+POPULAR_BOOKS = """
+    SELECT l.Titre, l.Auteur, COUNT(loc.ID_location) as rental_count
+    FROM livres l
+    LEFT JOIN locations loc ON l.ID_livre = loc.ID_livre
+    GROUP BY l.ID_livre, l.Titre, l.Auteur
+    ORDER BY rental_count DESC
+    LIMIT 5
+"""
+
+
+# ================================= CATALOGUE ==========================================
+
+UNIQUE_GENRES = "SELECT DISTINCT Genre FROM livres WHERE Genre IS NOT NULL"
+
+CATALOG = "SELECT * FROM livres WHERE 1=1"
+
+TOP_BOOKS = """
+    SELECT l.Titre, l.Auteur, COUNT(loc.ID_location) as rentals
+    FROM livres l LEFT JOIN locations loc ON l.ID_livre = loc.ID_livre
+    GROUP BY l.ID_livre, l.Titre, l.Auteur ORDER BY rentals DESC LIMIT 10
+"""
+
+
+# ================================= LOCATIONS ==========================================
+
+RENTAL_HISTORY = """
+    SELECT loc.*, l.Titre, l.Auteur, u.nom, u.prenom
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    WHERE loc.Date_location BETWEEN %s AND %s
+"""
+
+RENTAL_HISTORY_ORDER = [("loc.Date_location", "Date_location"), ("loc.ID_location", "ID_location")]
+
+RENTAL_PERIOD_STATS = """
+    SELECT COUNT(*) as total,
+           COALESCE(SUM(loc.Statut = 'Retourné'), 0) as returned,
+           COALESCE(SUM(loc.Statut NOT IN ('Retourné', 'Annulé')), 0) as active
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    WHERE loc.Date_location BETWEEN %s AND %s
+"""
+
+
+# ================================= UTILISATEURS ==========================================
+
+USERS = "SELECT * FROM utilisateurs WHERE 1=1"
+
+USERS_BY_ROLE = "SELECT role, COUNT(*) as count FROM utilisateurs GROUP BY role"
+
+# Locations en cours proposées au retour (complétée par un filtre sur la location, l'étudiant ou le livre)
+ACTIVE_LOANS = """
+    SELECT loc.ID_location, loc.ID_livre, loc.ID_etudiant, loc.Date_retour_prevue, l.Titre, u.nom, u.prenom
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    WHERE loc.Statut NOT IN ('Retourné', 'Annulé')
+"""
+
+# Recherche d'étudiants par préfixe : une branche par index (nom, prénom, mail), chacune bornée
+STUDENT_LOOKUP = """
+    SELECT ID_utilisateur, nom, prenom, mail FROM (
+        SELECT * FROM (SELECT ID_utilisateur, nom, prenom, mail FROM utilisateurs
+                       WHERE role = 'Etudiant' AND nom LIKE %s ESCAPE '!' ORDER BY nom LIMIT %s) par_nom
+        UNION
+        SELECT * FROM (SELECT ID_utilisateur, nom, prenom, mail FROM utilisateurs
+                       WHERE role = 'Etudiant' AND prenom LIKE %s ESCAPE '!' ORDER BY prenom LIMIT %s) par_prenom
+        UNION
+        SELECT * FROM (SELECT ID_utilisateur, nom, prenom, mail FROM utilisateurs
+                       WHERE role = 'Etudiant' AND mail LIKE %s ESCAPE '!' ORDER BY mail LIMIT %s) par_mail
+    ) candidats
+    ORDER BY nom, prenom
+    LIMIT %s
+"""
+
+MOST_ACTIVE_STUDENTS = """
+    SELECT u.nom, u.prenom, u.role, COUNT(l.ID_location) as rental_count
+    FROM utilisateurs u
+    LEFT JOIN locations l ON u.ID_utilisateur = l.ID_etudiant
+    WHERE u.role = 'Etudiant'
+    GROUP BY u.ID_utilisateur, u.nom, u.prenom, u.role
+    ORDER BY rental_count DESC
+    LIMIT 10
+"""
+
+
+# ================================= RAPPORTS ==========================================
+
+MONTHLY_LOANS = """
+    SELECT DATE_FORMAT(jour, '%Y-%m') as mois, SUM(nb_emprunts) as locations
+    FROM stats_locations_jour
+    GROUP BY mois
+    HAVING locations > 0
+    ORDER BY mois
+"""
+
+TOP_AUTHORS = """
+    SELECT Auteur, SUM(nb_emprunts) as locations
+    FROM stats_locations_jour_genre_auteur
+    WHERE Auteur <> ''
+    GROUP BY Auteur
+    ORDER BY locations DESC
+    LIMIT 5
+"""
+
+OVERDUE_LOANS = """
+    SELECT u.nom, u.prenom, l.Titre, loc.Date_retour_prevue,
+           DATEDIFF(CURDATE(), loc.Date_retour_prevue) as jours_retard
+    FROM locations loc
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    WHERE loc.Date_retour_prevue < CURDATE()
+    AND loc.Statut NOT IN ('Retourné', 'Annulé')
+    ORDER BY jours_retard DESC
+"""
+
+
+# ================================= PAGINATION ==========================================
+
+def keyset_page(query, params, order_columns, cursor=None, page_size=25, descending=False):
+    """Complète `query` pour lire une page après la clé `cursor` ; retourne (requête, paramètres)
+
+    `order_columns` est une liste de couples (expression SQL, nom de colonne du résultat) formant
+    une clé unique ; la requête doit déjà contenir une clause WHERE. Une ligne de plus que
+    `page_size` est demandée pour savoir s'il existe une page suivante.
+    """
+    params = list(params or [])
+    operator = "<" if descending else ">"
+    direction = "DESC" if descending else "ASC"
+
+    if cursor is not None:
+        # (a, b) > (x, y) développé pour que l'optimiseur utilise l'index
+        clauses = []
+        for i, (expr, _) in enumerate(order_columns):
+            equalities = [f"{prev} = %s" for prev, _ in order_columns[:i]]
+            clauses.append("(" + " AND ".join(equalities + [f"{expr} {operator} %s"]) + ")")
+            params.extend(cursor[:i + 1])
+        query += " AND (" + " OR ".join(clauses) + ")"
+
+    query += " ORDER BY " + ", ".join(f"{expr} {direction}" for expr, _ in order_columns)
+    query += " LIMIT %s"
+    params.append(page_size + 1)
+    return query, params
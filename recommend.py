@@ -0,0 +1,287 @@
+import argparse
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Intervalle (secondes) de prise en compte des locations faites par d'autres processus
+SYNC_INTERVAL = float(os.environ.get('BIBLIO_RECOMMEND_SYNC_INTERVAL', 60))
+# Intervalle (secondes) de reconstruction complète (locations annulées ou supprimées depuis)
+REBUILD_INTERVAL = float(os.environ.get('BIBLIO_RECOMMEND_REBUILD_INTERVAL', 3600))
+# Nombre de recommandations renvoyées par défaut
+TOP_K = 10
+# Nombre minimal d'emprunteurs communs pour qu'une paire de livres soit recommandée
+MIN_SUPPORT = int(os.environ.get('BIBLIO_RECOMMEND_MIN_SUPPORT', 2))
+
+LOANS_QUERY = "SELECT ID_location, ID_etudiant, ID_livre FROM locations WHERE Statut <> 'Annulé'"
+
+
+def available():
+    """Vrai si SciPy (matrices creuses) est installé"""
+    return importlib.util.find_spec('scipy') is not None
+
+
+def load_loans(after_id=None):
+    """Couples (ID_location, ID_etudiant, ID_livre) en tableau numpy, lus en flux"""
+    query, params = LOANS_QUERY, ()
+    if after_id is not None:
+        query += " AND ID_location > %s"
+        params = (after_id,)
+    stream = database.stream_query(query, params)
+    next(stream)
+    chunks = [np.asarray(rows, dtype=np.int64) for rows in stream]
+    return np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+
+
+def _grow(matrix, size):
+    """Matrice carrée creuse agrandie à `size` lignes et colonnes (sans copie des données)"""
+    from scipy import sparse
+
+    if matrix.shape[0] == size:
+        return matrix
+    indptr = np.concatenate([matrix.indptr, np.full(size - matrix.shape[0], matrix.indptr[-1])])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(size, size))
+
+
+def _top(scores, support, k):
+    """Indices des k meilleurs scores (à égalité, le plus d'emprunteurs communs d'abord)"""
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((-support[candidates], -scores[candidates]))]
+
+
+# ================================= CO-EMPRUNTS ==========================================
+
+class CoBorrowingIndex:
+    """« Les lecteurs de ce livre ont aussi emprunté » : co-emprunts livre × livre en mémoire
+
+    La matrice creuse des co-emprunts (nombre d'étudiants ayant emprunté les deux livres) est
+    calculée d'un bloc (BᵀB sur la matrice étudiant × livre) puis complétée par différences à
+    l'arrivée de nouvelles locations. La similarité est le cosinus entre les ensembles
+    d'emprunteurs ; une recommandation ne lit qu'une ligne de la matrice.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._co = None  # csr_matrix int32 : co-emprunts, diagonale nulle
+        self._borrowers = np.zeros(0, dtype=np.int64)  # emprunteurs distincts par colonne
+        self._books = np.zeros(0, dtype=np.int64)  # colonne -> ID_livre
+        self._columns = {}  # ID_livre -> colonne
+        self._user_books = {}  # ID_etudiant -> colonnes empruntées
+        self._max_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._dirty = False
+        database.add_write_listener(self._on_write)
+
+    def __len__(self):
+        return len(self._books)
+
+    # --------------------------------- Alimentation ---------------------------------
+
+    def build(self, loans):
+        """Reconstruit l'index à partir de toutes les locations (tableau ID_location, ID_etudiant, ID_livre)"""
+        from scipy import sparse
+
+        users, user_rows = np.unique(loans[:, 1], return_inverse=True)
+        books, book_columns = np.unique(loans[:, 2], return_inverse=True)
+        borrowed = sparse.csr_matrix((np.ones(len(loans), dtype=np.int32), (user_rows, book_columns)),
+                                     shape=(len(users), len(books)))
+        # Un livre emprunté plusieurs fois par le même étudiant compte une fois
+        borrowed.data[:] = 1
+
+        co = (borrowed.T @ borrowed).tocsr()
+        borrowers = co.diagonal().astype(np.int64)
+        co.setdiag(0)
+        co.eliminate_zeros()
+
+        user_books = {int(user): set(borrowed.indices[borrowed.indptr[row]:borrowed.indptr[row + 1]].tolist())
+                      for row, user in enumerate(users)}
+        with self._lock:
+            self._co, self._borrowers = co, borrowers
+            self._books = books
+            self._columns = {int(book): column for column, book in enumerate(books)}
+            self._user_books = user_books
+            self._max_id = int(loans[:, 0].max()) if len(loans) else 0
+            self._built_at = self._synced_at = time.monotonic()
+
+    def add_loans(self, loans):
+        """Intègre de nouvelles locations : seules les paires qu'elles créent sont recalculées"""
+        from scipy import sparse
+
+        if not len(loans):
+            return
+        # Seul le thread qui rafraîchit modifie l'index : le calcul se fait hors verrou
+        with self._lock:
+            co, borrowers, books = self._co, self._borrowers, list(self._books)
+            columns = dict(self._columns)
+            user_books = self._user_books
+
+        new_books = {}  # ID_etudiant -> colonnes nouvellement empruntées
+        for _, user, book in loans.tolist():
+            if book not in columns:
+                columns[book] = len(books)
+                books.append(book)
+            column = columns[book]
+            if column not in user_books.get(user, ()):
+                new_books.setdefault(user, set()).add(column)
+
+        size = len(books)
+        borrowers = np.concatenate([borrowers, np.zeros(size - len(borrowers), dtype=np.int64)])
+        co = _grow(co, size)
+        if new_books:
+            # Différence C' - C = ΔᵀB' + BᵀΔ, restreinte aux étudiants concernés
+            before, added = [], []
+            for row, (user, columns_added) in enumerate(new_books.items()):
+                before += [(row, column) for column in user_books.get(user, ())]
+                added += [(row, column) for column in columns_added]
+
+            def matrix(pairs):
+                pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+                return sparse.csr_matrix((np.ones(len(pairs), dtype=np.int32), (pairs[:, 0], pairs[:, 1])),
+                                         shape=(len(new_books), size))
+
+            old, delta = matrix(before), matrix(added)
+            difference = (delta.T @ (old + delta) + (delta.T @ old).T).tocsr()
+            borrowers = borrowers + difference.diagonal()
+            difference.setdiag(0)
+            difference.eliminate_zeros()
+            co = (co + difference).tocsr()
+
+        with self._lock:
+            self._co, self._borrowers = co, borrowers
+            self._books = np.asarray(books, dtype=np.int64)
+            self._columns = columns
+            for user, columns_added in new_books.items():
+                self._user_books.setdefault(user, set()).update(columns_added)
+            self._max_id = max(self._max_id, int(loans[:, 0].max()))
+
+    # --------------------------------- Recommandations ---------------------------------
+
+    def similar_books(self, book_id, k=TOP_K, min_support=MIN_SUPPORT):
+        """Livres les plus co-empruntés avec `book_id` : [(ID_livre, score, emprunteurs communs)]"""
+        with self._lock:
+            column = self._columns.get(int(book_id))
+            if column is None or self._co is None:
+                return []
+            co, borrowers, books = self._co, self._borrowers, self._books
+        start, end = co.indptr[column], co.indptr[column + 1]
+        neighbours, support = co.indices[start:end], co.data[start:end]
+        keep = support >= min_support
+        neighbours, support = neighbours[keep], support[keep]
+        if not len(neighbours):
+            return []
+        scores = support / np.sqrt(borrowers[column] * borrowers[neighbours])
+        top = _top(scores, support, k)
+        return [(int(books[neighbours[i]]), float(scores[i]), int(support[i])) for i in top]
+
+    def for_student(self, user_id, k=TOP_K, min_support=MIN_SUPPORT):
+        """Livres recommandés d'après l'historique de l'étudiant (hors livres déjà empruntés)
+
+        Retourne [(ID_livre, score, emprunteurs communs)] : somme des similarités avec les livres
+        de l'historique, et nombre de co-emprunts avec ceux-ci.
+        """
+        with self._lock:
+            history = list(self._user_books.get(int(user_id), ()))
+            if not history or self._co is None:
+                return []
+            co, borrowers, books = self._co, self._borrowers, self._books
+        rows = co[history]
+        rows.data = np.where(rows.data >= min_support, rows.data, 0)
+        support = np.asarray(rows.sum(axis=0)).ravel()
+        weights = rows.multiply(1 / np.sqrt(borrowers[history])[:, None]).tocsr()
+        scores = np.asarray(weights.sum(axis=0)).ravel() / np.sqrt(np.maximum(borrowers, 1))
+        scores[history] = 0
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        top = _top(scores[candidates], support[candidates], k)
+        return [(int(books[candidates[i]]), float(scores[candidates[i]]), int(support[candidates[i]]))
+                for i in top]
+
+    # --------------------------------- Synchronisation ---------------------------------
+
+    def _on_write(self, tables):
+        # Location enregistrée par ce processus : intégrée à la prochaine lecture, sans attendre l'intervalle
+        if tables is None or 'locations' in tables:
+            self._dirty = True
+
+    def refresh(self, force=False):
+        """Reconstruit l'index périodiquement et intègre les nouvelles locations"""
+        # Un seul rafraîchissement à la fois ; les autres threads lisent l'index courant
+        if not self._refresh_lock.acquire(blocking=not self._built_at):
+            return
+        try:
+            now = time.monotonic()
+            if force or not self._built_at or now - self._built_at > REBUILD_INTERVAL:
+                self._dirty = False
+                self.build(load_loans())
+            elif self._dirty or now - self._synced_at > SYNC_INTERVAL:
+                self.sync_new()
+        finally:
+            self._refresh_lock.release()
+
+    def sync_new(self):
+        """Intègre les locations dont l'identifiant dépasse le plus grand déjà vu"""
+        self._dirty = False
+        with self._lock:
+            max_id = self._max_id
+        self.add_loans(load_loans(after_id=max_id))
+        self._synced_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {'books': len(self._books), 'students': len(self._user_books),
+                    'pairs': 0 if self._co is None else self._co.nnz // 2, 'max_id': self._max_id}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Index des co-emprunts partagé par le processus, tenu à jour"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CoBorrowingIndex()
+    _index.refresh()
+    return _index
+
+
+def main(argv):
+    """Point d'entrée : `python recommend.py livre ID|etudiant ID`"""
+    parser = argparse.ArgumentParser(description="Recommandations par co-emprunts")
+    parser.add_argument('target', choices=['livre', 'etudiant'])
+    parser.add_argument('id', type=int)
+    parser.add_argument('-k', type=int, default=TOP_K, help="Nombre de recommandations")
+    args = parser.parse_args(argv[1:])
+
+    started = time.perf_counter()
+    index = get_index()
+    built = time.perf_counter()
+    if args.target == 'livre':
+        recommendations = index.similar_books(args.id, args.k)
+    else:
+        recommendations = index.for_student(args.id, args.k)
+    done = time.perf_counter()
+
+    print(f"Index : {index.stats()} construit en {built - started:.2f} s ; recherche en {(done - built) * 1000:.2f} ms")
+    for book_id, score, support in recommendations:
+        print(f"  {book_id}\t{score:.3f}\t{support} emprunteur(s) commun(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
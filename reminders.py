@@ -0,0 +1,443 @@
+import argparse
+import os
+import queue
+import smtplib
+import socketserver
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+from itertools import groupby
+
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Serveur SMTP ; par défaut le serveur de test local (`python reminders.py smtp-debug`)
+SMTP_HOST = os.environ.get('BIBLIO_SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('BIBLIO_SMTP_PORT', 1025))
+SMTP_USER = os.environ.get('BIBLIO_SMTP_USER', '')
+SMTP_PASSWORD = os.environ.get('BIBLIO_SMTP_PASSWORD', '')
+SMTP_STARTTLS = os.environ.get('BIBLIO_SMTP_STARTTLS', '0') == '1'
+MAIL_FROM = os.environ.get('BIBLIO_MAIL_FROM', 'bibliotheque@localhost')
+# Connexions SMTP ouvertes en parallèle et débit maximal (messages par seconde, 0 : illimité)
+SMTP_CONNECTIONS = int(os.environ.get('BIBLIO_SMTP_CONNECTIONS', 4))
+SMTP_RATE = float(os.environ.get('BIBLIO_SMTP_RATE', 100))
+# Messages envoyés par connexion avant de la renouveler (limite courante des serveurs)
+MESSAGES_PER_CONNECTION = 500
+SMTP_TIMEOUT = 30
+
+# Les locations dont le retour est prévu dans ce nombre de jours font l'objet d'un rappel anticipé
+DAYS_AHEAD = int(os.environ.get('BIBLIO_REMINDER_DAYS_AHEAD', 2))
+# Nombre minimal de jours entre deux rappels à un même utilisateur
+REMINDER_INTERVAL = int(os.environ.get('BIBLIO_REMINDER_INTERVAL', 1))
+
+# Le journal des envois est écrit par lots, au plus toutes les LOG_FLUSH_INTERVAL secondes
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_INTERVAL = 2.0
+
+# Une seule requête, servie par idx_locations_statut_retour ; les utilisateurs relancés depuis le début
+# de l'intervalle (jour courant compris) sont exclus, ce qui rend un envoi interrompu reprenable
+REMINDER_QUERY = """
+    SELECT loc.ID_location, loc.ID_etudiant, u.nom, u.prenom, u.mail, l.Titre, l.Auteur, loc.Date_retour_prevue
+    FROM locations loc
+    JOIN utilisateurs u ON loc.ID_etudiant = u.ID_utilisateur
+    JOIN livres l ON loc.ID_livre = l.ID_livre
+    WHERE loc.Statut NOT IN ('Retourné', 'Annulé')
+    AND loc.Date_retour_prevue <= %s
+    AND NOT EXISTS (
+        SELECT 1 FROM rappels r WHERE r.ID_utilisateur = loc.ID_etudiant AND r.Date_rappel >= %s
+    )
+    ORDER BY loc.ID_etudiant, loc.Date_retour_prevue
+"""
+
+LOG_INSERT = """
+    INSERT INTO rappels (ID_utilisateur, Date_rappel, Nb_retards, Nb_echeances, Date_envoi)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE Nb_retards = VALUES(Nb_retards), Nb_echeances = VALUES(Nb_echeances),
+                            Date_envoi = VALUES(Date_envoi)
+"""
+
+
+# ================================= SÉLECTION ET RENDU ==========================================
+
+def _as_date(value):
+    return date.fromisoformat(value[:10]) if isinstance(value, str) else value
+
+
+def select_reminders(today=None, days_ahead=DAYS_AHEAD, interval=REMINDER_INTERVAL):
+    """Rappels à envoyer : un par utilisateur, avec ses locations en retard ou bientôt dues"""
+    if interval < 1:
+        # Le journal ne garde qu'un rappel par utilisateur et par jour
+        raise ValueError("L'intervalle entre deux rappels est d'au moins 1 jour")
+    today = today or date.today()
+    stream = database.stream_query(REMINDER_QUERY, (today + timedelta(days=days_ahead),
+                                                    today - timedelta(days=interval - 1)))
+    columns = [column[0] for column in next(stream)]
+    rows = (dict(zip(columns, row)) for chunk in stream for row in chunk)
+
+    reminders = []
+    for user_id, loans in groupby(rows, key=lambda row: row['ID_etudiant']):
+        loans = list(loans)
+        for loan in loans:
+            loan['Date_retour_prevue'] = _as_date(loan['Date_retour_prevue'])
+            loan['jours_retard'] = (today - loan['Date_retour_prevue']).days
+        first = loans[0]
+        reminders.append({'ID_utilisateur': user_id, 'nom': first['nom'], 'prenom': first['prenom'],
+                          'mail': first['mail'], 'loans': loans})
+    return reminders
+
+
+def _loan_line(loan):
+    due = loan['Date_retour_prevue'].strftime('%d/%m/%Y')
+    days = loan['jours_retard']
+    if days > 0:
+        delay = f"en retard de {days} jour(s)"
+    elif days == 0:
+        delay = "à rendre aujourd'hui"
+    else:
+        delay = f"à rendre dans {-days} jour(s)"
+    return f"  - « {loan['Titre']} » ({loan['Auteur']}) : retour prévu le {due}, {delay}"
+
+
+def render_message(reminder, sender=MAIL_FROM):
+    """Message de rappel regroupant toutes les locations de l'utilisateur"""
+    overdue = sum(1 for loan in reminder['loans'] if loan['jours_retard'] > 0)
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = reminder['mail']
+    message['Date'] = formatdate(localtime=True)
+    message['Message-ID'] = make_msgid(domain=sender.rpartition('@')[2] or None)
+    if overdue:
+        message['Subject'] = f"Rappel : {overdue} livre(s) en retard à rendre à la bibliothèque"
+    else:
+        message['Subject'] = "Rappel : livre(s) à rendre prochainement à la bibliothèque"
+
+    name = f"{reminder['prenom'] or ''} {reminder['nom'] or ''}".strip()
+    lines = [f"Bonjour {name}," if name else "Bonjour,", "",
+             "Les livres suivants empruntés à la bibliothèque sont à rapporter :", ""]
+    lines += [_loan_line(loan) for loan in reminder['loans']]
+    lines += ["", "Merci de les rapporter dès que possible ou de contacter la bibliothèque.", "",
+              "La bibliothèque"]
+    message.set_content("\n".join(lines))
+    return message
+
+
+def render_messages(reminders, sender=MAIL_FROM):
+    """Rendu en lot ; les utilisateurs sans adresse sont écartés. Retourne (messages, ignorés)"""
+    messages, skipped = [], []
+    for reminder in reminders:
+        if reminder['mail']:
+            messages.append((reminder, render_message(reminder, sender)))
+        else:
+            skipped.append(reminder)
+    return messages, skipped
+
+
+# ================================= ENVOI ==========================================
+
+class RateLimiter:
+    """Débit partagé par les connexions : au plus `rate` envois par seconde, régulièrement espacés"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SmtpConnection:
+    """Connexion SMTP réutilisée d'un message à l'autre, rouverte si le serveur la ferme"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self._smtp = None
+        self._sent = 0
+
+    def _open(self):
+        self.close()
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        if self.starttls:
+            smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password)
+        self._smtp, self._sent = smtp, 0
+
+    def send(self, message):
+        for attempt in range(2):
+            if self._smtp is None or self._sent >= MESSAGES_PER_CONNECTION:
+                self._open()
+            try:
+                self._smtp.send_message(message)
+                self._sent += 1
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # Connexion fermée par le serveur (inactivité, limite) : un nouvel essai sur une nouvelle
+                self._smtp = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+def log_sent(entries, today):
+    """Enregistre les rappels envoyés dans le journal (une transaction par lot)"""
+    if not entries:
+        return
+    now = datetime.now().replace(microsecond=0)
+    params = [(reminder['ID_utilisateur'], today,
+               sum(1 for loan in reminder['loans'] if loan['jours_retard'] > 0),
+               sum(1 for loan in reminder['loans'] if loan['jours_retard'] <= 0), now)
+              for reminder in entries]
+    with database.transaction() as cursor:
+        cursor.executemany(LOG_INSERT, params)
+
+
+def send_reminders(today=None, days_ahead=DAYS_AHEAD, interval=REMINDER_INTERVAL, connections=SMTP_CONNECTIONS,
+                   rate=SMTP_RATE, dry_run=False, limit=None, on_progress=None, connection_factory=SmtpConnection):
+    """Sélectionne, rend et envoie les rappels ; retourne le bilan de l'envoi
+
+    Les messages partent sur `connections` connexions SMTP réutilisées, au débit `rate`. Chaque
+    envoi réussi est inscrit au journal `rappels` (par lots) : relancer la commande après une
+    interruption n'envoie que les rappels manquants. `on_progress(envoyés, échecs, total)` est
+    appelé par le thread appelant au fil de l'envoi.
+    """
+    today = today or date.today()
+    started = time.monotonic()
+    reminders = select_reminders(today, days_ahead, interval)
+    if limit is not None:
+        reminders = reminders[:limit]
+    messages, skipped = render_messages(reminders)
+    summary = {'selected': len(reminders), 'loans': sum(len(reminder['loans']) for reminder in reminders),
+               'skipped': len(skipped), 'sent': 0, 'failed': 0, 'errors': []}
+    if dry_run or not messages:
+        summary['seconds'] = time.monotonic() - started
+        return summary
+
+    pending = queue.Queue()
+    for item in messages:
+        pending.put(item)
+    results = queue.Queue()
+    stop = threading.Event()
+    limiter = RateLimiter(rate)
+
+    def worker():
+        connection = connection_factory()
+        try:
+            while not stop.is_set():
+                try:
+                    reminder, message = pending.get_nowait()
+                except queue.Empty:
+                    return
+                limiter.wait()
+                try:
+                    connection.send(message)
+                    results.put((reminder, None))
+                except (smtplib.SMTPException, OSError) as e:
+                    results.put((reminder, e))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, name=f'biblio-smtp-{index}', daemon=True)
+               for index in range(max(1, min(connections, len(messages))))]
+    for thread in threads:
+        thread.start()
+
+    unlogged = []
+    flushed_at = time.monotonic()
+    done = 0
+    try:
+        while done < len(messages):
+            try:
+                reminder, error = results.get(timeout=LOG_FLUSH_INTERVAL)
+            except queue.Empty:
+                if not any(thread.is_alive() for thread in threads):
+                    break
+            else:
+                done += 1
+                if error is None:
+                    summary['sent'] += 1
+                    unlogged.append(reminder)
+                else:
+                    summary['failed'] += 1
+                    if len(summary['errors']) < 10:
+                        summary['errors'].append(f"{reminder['mail']}: {error}")
+                if on_progress:
+                    on_progress(summary['sent'], summary['failed'], len(messages))
+            if len(unlogged) >= LOG_BATCH_SIZE or time.monotonic() - flushed_at >= LOG_FLUSH_INTERVAL:
+                log_sent(unlogged, today)
+                unlogged, flushed_at = [], time.monotonic()
+    finally:
+        # Interruption comprise : les envois déjà faits sont journalisés avant de rendre la main
+        stop.set()
+        for thread in threads:
+            thread.join()
+        while not results.empty():
+            reminder, error = results.get_nowait()
+            if error is None:
+                summary['sent'] += 1
+                unlogged.append(reminder)
+            else:
+                summary['failed'] += 1
+        log_sent(unlogged, today)
+
+    summary['seconds'] = time.monotonic() - started
+    return summary
+
+
+# ================================= SERVEUR SMTP DE TEST ==========================================
+
+class _DebugSmtpHandler(socketserver.StreamRequestHandler):
+    """Sous-ensemble de SMTP suffisant pour smtplib : les messages reçus sont comptés et éventuellement écrits"""
+
+    def _reply(self, line):
+        # Réponses SMTP en ASCII, formulées comme celles des serveurs usuels
+        self.wfile.write(line.encode('ascii') + b"\r\n")
+
+    def handle(self):
+        self._reply("220 biblio-debug ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self._reply("250-biblio-debug")
+                self._reply("250 8BITMIME")
+            elif verb == 'HELO':
+                self._reply("250 biblio-debug")
+            elif verb == 'MAIL':
+                recipients = []
+                self._reply("250 OK")
+            elif verb == 'RCPT':
+                recipients.append(command.partition(':')[2].strip(' <>'))
+                self._reply("250 OK")
+            elif verb == 'DATA':
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data in iter(self.rfile.readline, b''):
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                self.server.received(recipients, b"".join(lines))
+                self._reply("250 OK")
+            elif verb == 'RSET':
+                recipients = []
+                self._reply("250 OK")
+            elif verb == 'NOOP':
+                self._reply("250 OK")
+            elif verb == 'QUIT':
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class DebugSmtpServer(socketserver.ThreadingTCPServer):
+    """Serveur SMTP local de test : accepte tout, n'envoie rien"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, output_dir=None, verbose=True):
+        super().__init__(address, _DebugSmtpHandler)
+        self.output_dir = output_dir
+        self.verbose = verbose
+        self.count = 0
+        self._lock = threading.Lock()
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def received(self, recipients, data):
+        with self._lock:
+            self.count += 1
+            count = self.count
+        if self.output_dir:
+            with open(os.path.join(self.output_dir, f"{count:06d}.eml"), 'wb') as f:
+                f.write(data)
+        if self.verbose:
+            print(f"[{count}] {', '.join(recipients)} ({len(data)} octets)", flush=True)
+
+
+def main(argv):
+    """Point d'entrée : `python reminders.py preview|send|smtp-debug`"""
+    parser = argparse.ArgumentParser(description="Rappels de retour par mail")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('preview', "Compte les rappels à envoyer et affiche le premier"),
+                            ('send', "Envoie les rappels")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--days-ahead', type=int, default=DAYS_AHEAD,
+                               help="Rappel anticipé des retours prévus dans ce nombre de jours")
+        subparser.add_argument('--interval', type=int, default=REMINDER_INTERVAL,
+                               help="Jours minimum entre deux rappels à un même utilisateur")
+        subparser.add_argument('--limit', type=int, help="Nombre maximal de rappels")
+    send_parser = subparsers.choices['send']
+    send_parser.add_argument('--connections', type=int, default=SMTP_CONNECTIONS, help="Connexions SMTP parallèles")
+    send_parser.add_argument('--rate', type=float, default=SMTP_RATE, help="Messages par seconde (0 : illimité)")
+
+    debug_parser = subparsers.add_parser('smtp-debug', help="Serveur SMTP local de test")
+    debug_parser.add_argument('--port', type=int, default=SMTP_PORT)
+    debug_parser.add_argument('--output', help="Dossier où écrire les messages reçus (.eml)")
+    debug_parser.add_argument('--quiet', action='store_true', help="N'affiche pas chaque message")
+
+    args = parser.parse_args(argv[1:])
+    if args.command != 'smtp-debug' and args.interval < 1:
+        parser.error("--interval : au moins 1 jour")
+    if args.command == 'smtp-debug':
+        with DebugSmtpServer(('localhost', args.port), args.output, verbose=not args.quiet) as server:
+            print(f"Serveur SMTP de test sur localhost:{args.port} (Ctrl+C pour arrêter)")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                print(f"{server.count} message(s) reçu(s)")
+        return 0
+
+    if args.command == 'preview':
+        reminders = select_reminders(days_ahead=args.days_ahead, interval=args.interval)[:args.limit]
+        messages, skipped = render_messages(reminders)
+        print(f"{len(messages)} rappel(s) à envoyer ({sum(len(r['loans']) for r in reminders)} location(s)), "
+              f"{len(skipped)} utilisateur(s) sans adresse")
+        if messages:
+            print()
+            print(messages[0][1].as_string())
+        return 0
+
+    def progress(sent, failed, total):
+        if (sent + failed) % 500 == 0 or sent + failed == total:
+            print(f"{sent + failed}/{total} traité(s), {failed} échec(s)", flush=True)
+
+    summary = send_reminders(days_ahead=args.days_ahead, interval=args.interval, connections=args.connections,
+                             rate=args.rate, limit=args.limit, on_progress=progress)
+    print(f"{summary['sent']} rappel(s) envoyé(s), {summary['failed']} échec(s), {summary['skipped']} sans adresse "
+          f"en {summary['seconds']:.1f} s")
+    for error in summary['errors']:
+        print(f"  {error}")
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,179 @@
+import argparse
+import sys
+from datetime import date, timedelta
+
+import database
+
+
+# ================================= MISE À JOUR INCRÉMENTALE ==========================================
+# Ces fonctions reçoivent le curseur de la transaction d'écriture (database.transaction) afin que
+# l'agrégat soit validé ou annulé en même temps que la location.
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def record_loan(cursor, book_id, loan_date):
+    """Compte un emprunt du livre `book_id` le jour `loan_date`"""
+    record_loans(cursor, {book_id: 1}, loan_date)
+
+
+def record_loans(cursor, book_counts, loan_date):
+    """Compte en une fois les emprunts {ID_livre: nombre} du jour `loan_date`"""
+    if not book_counts:
+        return
+    book_ids = list(book_counts)
+    cursor.execute("""
+        INSERT INTO stats_locations_jour (jour, nb_emprunts) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE nb_emprunts = nb_emprunts + VALUES(nb_emprunts)
+    """, (loan_date, sum(book_counts.values())))
+    cases = ' '.join(['WHEN %s THEN %s'] * len(book_ids))
+    cursor.execute(f"""
+        INSERT INTO stats_locations_jour_genre_auteur (jour, Genre, Auteur, nb_emprunts)
+        SELECT %s, COALESCE(Genre, ''), COALESCE(Auteur, ''), SUM(CASE ID_livre {cases} END)
+        FROM livres WHERE ID_livre IN ({_placeholders(book_ids)})
+        GROUP BY COALESCE(Genre, ''), COALESCE(Auteur, '')
+        ON DUPLICATE KEY UPDATE nb_emprunts = nb_emprunts + VALUES(nb_emprunts)
+    """, [loan_date] + [value for item in book_counts.items() for value in item] + book_ids)
+
+
+def record_return(cursor, location_id, return_date):
+    """Compte le retour de la location `location_id` le jour `return_date` (et le retard éventuel)"""
+    record_returns(cursor, [location_id], return_date)
+
+
+def record_returns(cursor, location_ids, return_date):
+    """Compte en une fois les retours des locations `location_ids` le jour `return_date`"""
+    if not location_ids:
+        return
+    params = [return_date, return_date] + list(location_ids)
+    cursor.execute(f"""
+        INSERT INTO stats_locations_jour (jour, nb_retours, nb_retards)
+        SELECT %s, COUNT(*), COALESCE(SUM(Date_retour_prevue < %s), 0)
+        FROM locations WHERE ID_location IN ({_placeholders(location_ids)})
+        ON DUPLICATE KEY UPDATE nb_retours = nb_retours + VALUES(nb_retours),
+                                nb_retards = nb_retards + VALUES(nb_retards)
+    """, params)
+    cursor.execute(f"""
+        INSERT INTO stats_locations_jour_genre_auteur (jour, Genre, Auteur, nb_retours, nb_retards)
+        SELECT %s, COALESCE(l.Genre, ''), COALESCE(l.Auteur, ''), COUNT(*),
+               COALESCE(SUM(loc.Date_retour_prevue < %s), 0)
+        FROM locations loc
+        JOIN livres l ON loc.ID_livre = l.ID_livre
+        WHERE loc.ID_location IN ({_placeholders(location_ids)})
+        GROUP BY COALESCE(l.Genre, ''), COALESCE(l.Auteur, '')
+        ON DUPLICATE KEY UPDATE nb_retours = nb_retours + VALUES(nb_retours),
+                                nb_retards = nb_retards + VALUES(nb_retards)
+    """, params)
+
+
+# ================================= RECONSTRUCTION ==========================================
+
+def _rebuild_range(cursor, start, end):
+    """Recalcule les agrégats des jours [start, end] à partir de la table locations"""
+    for table in ('stats_locations_jour', 'stats_locations_jour_genre_auteur'):
+        cursor.execute(f"DELETE FROM {table} WHERE jour BETWEEN %s AND %s", (start, end))
+
+    cursor.execute("""
+        INSERT INTO stats_locations_jour (jour, nb_emprunts)
+        SELECT Date_location, COUNT(*) FROM locations
+        WHERE Date_location BETWEEN %s AND %s
+        GROUP BY Date_location
+    """, (start, end))
+    cursor.execute("""
+        INSERT INTO stats_locations_jour (jour, nb_retours, nb_retards)
+        SELECT Date_retour_effective, COUNT(*), COALESCE(SUM(Date_retour_effective > Date_retour_prevue), 0)
+        FROM locations
+        WHERE Date_retour_effective BETWEEN %s AND %s
+        GROUP BY Date_retour_effective
+        ON DUPLICATE KEY UPDATE nb_retours = VALUES(nb_retours), nb_retards = VALUES(nb_retards)
+    """, (start, end))
+
+    cursor.execute("""
+        INSERT INTO stats_locations_jour_genre_auteur (jour, Genre, Auteur, nb_emprunts)
+        SELECT loc.Date_location, COALESCE(l.Genre, ''), COALESCE(l.Auteur, ''), COUNT(*)
+        FROM locations loc
+        JOIN livres l ON loc.ID_livre = l.ID_livre
+        WHERE loc.Date_location BETWEEN %s AND %s
+        GROUP BY loc.Date_location, COALESCE(l.Genre, ''), COALESCE(l.Auteur, '')
+    """, (start, end))
+    cursor.execute("""
+        INSERT INTO stats_locations_jour_genre_auteur (jour, Genre, Auteur, nb_retours, nb_retards)
+        SELECT loc.Date_retour_effective, COALESCE(l.Genre, ''), COALESCE(l.Auteur, ''), COUNT(*),
+               COALESCE(SUM(loc.Date_retour_effective > loc.Date_retour_prevue), 0)
+        FROM locations loc
+        JOIN livres l ON loc.ID_livre = l.ID_livre
+        WHERE loc.Date_retour_effective BETWEEN %s AND %s
+        GROUP BY loc.Date_retour_effective, COALESCE(l.Genre, ''), COALESCE(l.Auteur, '')
+        ON DUPLICATE KEY UPDATE nb_retours = VALUES(nb_retours), nb_retards = VALUES(nb_retards)
+    """, (start, end))
+
+
+def rebuild(start=None, end=None):
+    """Reconstruit les agrégats sur une période (tout l'historique par défaut)"""
+    if start is None or end is None:
+        bounds = database.run_query("""
+            SELECT MIN(LEAST(Date_location, COALESCE(Date_retour_effective, Date_location))) as first_day,
+                   MAX(GREATEST(Date_location, COALESCE(Date_retour_effective, Date_location))) as last_day
+            FROM locations
+        """, cache=False)[0]
+        start = start or bounds['first_day'] or date.today()
+        end = end or bounds['last_day'] or date.today()
+
+    with database.transaction() as cursor:
+        _rebuild_range(cursor, start, end)
+    return start, end
+
+
+def reconcile(days=30):
+    """Compare les agrégats des `days` derniers jours à la table locations et corrige les jours divergents"""
+    start = date.today() - timedelta(days=days)
+    expected = database.run_query("""
+        SELECT jour, SUM(nb_emprunts) as nb_emprunts, SUM(nb_retours) as nb_retours FROM (
+            SELECT Date_location as jour, COUNT(*) as nb_emprunts, 0 as nb_retours
+            FROM locations WHERE Date_location >= %s GROUP BY Date_location
+            UNION ALL
+            SELECT Date_retour_effective, 0, COUNT(*)
+            FROM locations WHERE Date_retour_effective >= %s GROUP BY Date_retour_effective
+        ) jours
+        GROUP BY jour
+    """, (start, start), cache=False)
+    actual = database.run_query("""
+        SELECT jour, nb_emprunts, nb_retours FROM stats_locations_jour WHERE jour >= %s
+    """, (start,), cache=False)
+
+    expected = {row['jour']: (int(row['nb_emprunts']), int(row['nb_retours'])) for row in expected}
+    actual = {row['jour']: (int(row['nb_emprunts']), int(row['nb_retours'])) for row in actual}
+    divergent = sorted(day for day in expected.keys() | actual.keys()
+                       if expected.get(day, (0, 0)) != actual.get(day, (0, 0)))
+
+    for day in divergent:
+        with database.transaction() as cursor:
+            _rebuild_range(cursor, day, day)
+    return divergent
+
+
+def main(argv):
+    """Point d'entrée : `python rollups.py rebuild|reconcile`"""
+    parser = argparse.ArgumentParser(description="Maintenance des agrégats quotidiens des locations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser('rebuild', help="Reconstruit les agrégats")
+    rebuild_parser.add_argument('--since', type=date.fromisoformat, help="Premier jour (AAAA-MM-JJ)")
+    rebuild_parser.add_argument('--until', type=date.fromisoformat, help="Dernier jour (AAAA-MM-JJ)")
+
+    reconcile_parser = subparsers.add_parser('reconcile', help="Vérifie et corrige les derniers jours")
+    reconcile_parser.add_argument('--days', type=int, default=30, help="Nombre de jours à vérifier")
+
+    args = parser.parse_args(argv[1:])
+    if args.command == 'rebuild':
+        start, end = rebuild(args.since, args.until)
+        print(f"Agrégats reconstruits du {start} au {end}")
+    else:
+        divergent = reconcile(args.days)
+        print(f"{len(divergent)} jour(s) corrigé(s)" + (": " + ", ".join(map(str, divergent)) if divergent else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,236 @@
+import bisect
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+# Nombre maximal de résultats renvoyés par une recherche
+RESULT_LIMIT = int(os.environ.get('BIBLIO_SEARCH_RESULT_LIMIT', 200))
+# Intervalle (secondes) de prise en compte des livres ajoutés par d'autres processus
+SYNC_INTERVAL = float(os.environ.get('BIBLIO_SEARCH_SYNC_INTERVAL', 30))
+# Intervalle (secondes) de reconstruction complète (modifications faites ailleurs)
+REBUILD_INTERVAL = float(os.environ.get('BIBLIO_SEARCH_REBUILD_INTERVAL', 900))
+
+# Poids de chaque champ dans le score
+FIELD_WEIGHTS = {
+    'Titre': 3.0,
+    'Auteur': 2.0,
+    'Genre': 1.0,
+    'Autres_informations': 0.5
+}
+# Un terme trouvé par préfixe compte moins qu'un terme exact
+PREFIX_FACTOR = 0.6
+# Au-delà, un préfixe trop court n'est pas étendu : seul le terme exact compte, et s'il n'existe pas
+# le terme est ignoré (il ne filtre pas les résultats) plutôt que d'étendre des milliers de termes
+MAX_PREFIX_EXPANSIONS = 500
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize_text(text):
+    """Minuscules sans accents : « Éducation » et « education » sont équivalents"""
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text):
+    """Découpe un texte normalisé en termes"""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+# ================================= INDEX INVERSÉ ==========================================
+
+class CatalogSearchIndex:
+    """Index inversé en mémoire sur Titre, Auteur, Genre et Autres_informations"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._postings = {}  # terme -> {ID_livre: poids}
+        self._documents = {}  # ID_livre -> {terme: poids}
+        self._genres = {}  # ID_livre -> Genre (filtre appliqué dans l'index)
+        self._vocabulary = []  # termes triés, pour la recherche par préfixe
+        self._max_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+
+    def __len__(self):
+        return len(self._documents)
+
+    # --------------------------------- Alimentation ---------------------------------
+
+    def build(self, books):
+        """Reconstruit l'index à partir d'une liste complète de livres"""
+        # Construction hors verrou : les recherches continuent sur l'ancien index pendant ce temps
+        fresh = CatalogSearchIndex()
+        for book in books:
+            fresh._add(book)
+        with self._lock:
+            self._postings = fresh._postings
+            self._documents = fresh._documents
+            self._genres = fresh._genres
+            self._max_id = fresh._max_id
+            self._vocabulary = sorted(fresh._postings)
+            self._built_at = self._synced_at = time.monotonic()
+
+    def upsert(self, book):
+        """Ajoute ou met à jour un livre (dictionnaire contenant ID_livre)"""
+        with self._lock:
+            book_id = int(book['ID_livre'])
+            if book_id in self._documents:
+                self._remove(book_id)
+            for term in self._add(book):
+                if len(self._postings[term]) == 1:
+                    index = bisect.bisect_left(self._vocabulary, term)
+                    if index == len(self._vocabulary) or self._vocabulary[index] != term:
+                        self._vocabulary.insert(index, term)
+
+    def remove(self, book_id):
+        """Retire un livre de l'index"""
+        with self._lock:
+            if book_id in self._documents:
+                self._remove(book_id)
+
+    def _add(self, book):
+        book_id = int(book['ID_livre'])
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in set(tokenize(book.get(field))):
+                weights[term] = weights.get(term, 0.0) + weight
+        self._documents[book_id] = weights
+        self._genres[book_id] = book.get('Genre')
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[book_id] = weight
+        self._max_id = max(self._max_id, book_id)
+        return weights
+
+    def _remove(self, book_id):
+        for term in self._documents.pop(book_id):
+            postings = self._postings[term]
+            del postings[book_id]
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._vocabulary, term)
+                if index < len(self._vocabulary) and self._vocabulary[index] == term:
+                    del self._vocabulary[index]
+        self._genres.pop(book_id, None)
+
+    # --------------------------------- Recherche ---------------------------------
+
+    def _expand(self, token):
+        """Termes du vocabulaire commençant par `token`
+
+        Au-delà de MAX_PREFIX_EXPANSIONS termes, seulement `token` lui-même s'il est au vocabulaire,
+        sinon None (terme ignoré).
+        """
+        start = bisect.bisect_left(self._vocabulary, token)
+        terms = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+            if not term.startswith(token):
+                break
+            terms.append(term)
+        if len(terms) <= MAX_PREFIX_EXPANSIONS:
+            return terms
+        return [token] if token in self._postings else None
+
+    def search(self, text, limit=RESULT_LIMIT, genre=None):
+        """Retourne [(ID_livre, score)] triés par pertinence
+
+        Chaque terme de la recherche doit correspondre (exactement ou par préfixe) à un terme
+        d'au moins un champ du livre ; le score pondère les champs et la rareté des termes.
+        Un préfixe trop court (plus de MAX_PREFIX_EXPANSIONS termes) ne correspond qu'au terme
+        exact, ou est ignoré s'il n'en est pas un ; si tous le sont, la recherche ne retourne rien.
+        """
+        tokens = list(dict.fromkeys(tokenize(text)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            total = max(len(self._documents), 1)
+            scores = None
+            for token in tokens:
+                terms = self._expand(token)
+                if terms is None:
+                    continue
+                token_scores = {}
+                for term in terms:
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    factor = idf if term == token else idf * PREFIX_FACTOR
+                    for book_id, weight in postings.items():
+                        score = weight * factor
+                        if score > token_scores.get(book_id, 0.0):
+                            token_scores[book_id] = score
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {book_id: score + token_scores[book_id]
+                              for book_id, score in scores.items() if book_id in token_scores}
+                if not scores:
+                    return []
+            if scores is None:
+                return []
+
+            if genre is not None:
+                scores = {book_id: score for book_id, score in scores.items() if self._genres.get(book_id) == genre}
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+    # --------------------------------- Synchronisation ---------------------------------
+
+    def refresh(self, force=False):
+        """Reconstruit l'index périodiquement et intègre les nouveaux livres"""
+        # Un seul rafraîchissement à la fois ; les autres threads cherchent dans l'index courant
+        if not self._refresh_lock.acquire(blocking=not self._built_at):
+            return
+        try:
+            now = time.monotonic()
+            if force or not self._built_at or now - self._built_at > REBUILD_INTERVAL:
+                self.build(load_books())
+            elif now - self._synced_at > SYNC_INTERVAL:
+                self.sync_new()
+        finally:
+            self._refresh_lock.release()
+
+    def sync_new(self):
+        """Indexe les livres dont l'identifiant dépasse le plus grand déjà indexé"""
+        with self._lock:
+            max_id = self._max_id
+        for book in load_books(after_id=max_id):
+            self.upsert(book)
+        self._synced_at = time.monotonic()
+
+
+def load_books(after_id=None):
+    """Charge les champs indexés depuis la base (sans passer par le cache)"""
+    query = "SELECT ID_livre, Titre, Auteur, Genre, Autres_informations FROM livres"
+    params = ()
+    if after_id is not None:
+        query += " WHERE ID_livre > %s"
+        params = (after_id,)
+    return database.run_query(query, params, cache=False)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_catalog_index():
+    """Index du catalogue partagé par le processus, tenu à jour"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CatalogSearchIndex()
+    _index.refresh()
+    return _index
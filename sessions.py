@@ -0,0 +1,218 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database
+
+
+# ================================= CONFIGURATION ==========================================
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Clé de signature des jetons ; à défaut, générée une fois dans SECRET_FILE (partagée par les processus)
+SECRET = os.environ.get('BIBLIO_SESSION_SECRET', '')
+SECRET_FILE = os.path.join(APP_DIR, '.session_secret')
+# Durée de validité d'une session (secondes)
+SESSION_TTL = float(os.environ.get('BIBLIO_SESSION_TTL', 43200))
+# Intervalle (secondes) de relevé des révocations faites par les autres processus et de rafraîchissement des profils
+CHECK_INTERVAL = float(os.environ.get('BIBLIO_SESSION_CHECK_INTERVAL', 30))
+
+# Paramètre d'URL portant le jeton (conservé par le navigateur au rechargement de la page)
+TOKEN_PARAM = 'session'
+
+
+def _load_secret():
+    if SECRET:
+        return SECRET.encode('utf-8')
+    try:
+        with open(SECRET_FILE, 'rb') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        secret = secrets.token_hex(32).encode('ascii')
+        try:
+            # Création exclusive : si un autre processus a gagné la course, sa clé est relue
+            fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(SECRET_FILE, 'rb') as f:
+                return f.read().strip()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(secret)
+        return secret
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+# ================================= JETONS ==========================================
+
+class SessionStore:
+    """Sessions de connexion : jetons signés (HMAC-SHA256) et expirants, révocables côté serveur
+
+    Un jeton valide est accepté sans requête : seule la liste des sessions révoquées, relevée
+    dans la table `sessions` toutes les CHECK_INTERVAL secondes, est consultée. Une révocation
+    faite par ce processus s'applique immédiatement, celle d'un autre processus au relevé suivant.
+    """
+
+    def __init__(self, secret=None, ttl=SESSION_TTL, check_interval=CHECK_INTERVAL):
+        self._secret = secret or _load_secret()
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._revoked = {}  # ID_session -> expiration (timestamp)
+        self._revocations_checked_at = None  # datetime du dernier relevé
+        self._checked_at = 0.0
+        self._profiles = {}  # ID_utilisateur -> (instant de lecture, profil)
+        database.add_write_listener(self._on_write)
+
+    # --------------------------------- Signature ---------------------------------
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def _decode(self, token):
+        """Contenu d'un jeton dont la signature est valide et la date d'expiration future, sinon None"""
+        try:
+            payload, signature = token.split('.')
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, AttributeError, TypeError):
+            return None
+        if claims.get('exp', 0) < time.time():
+            return None
+        return claims
+
+    # --------------------------------- Cycle de vie ---------------------------------
+
+    def create(self, user_id):
+        """Ouvre une session pour l'utilisateur et retourne son jeton"""
+        session_id = secrets.token_urlsafe(32)
+        created = datetime.now().replace(microsecond=0)
+        expires = created + timedelta(seconds=self.ttl)
+        database.run_query("""
+            INSERT INTO sessions (ID_session, ID_utilisateur, Date_creation, Date_expiration)
+            VALUES (%s, %s, %s, %s)
+        """, (session_id, user_id, created, expires), fetch=False)
+
+        payload = _b64encode(json.dumps({'sid': session_id, 'uid': user_id, 'exp': int(expires.timestamp())},
+                                        separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+
+    def validate(self, token):
+        """Identifiant de l'utilisateur d'un jeton valide et non révoqué, sinon None"""
+        claims = self._decode(token)
+        if claims is None:
+            return None
+        self._check_revocations()
+        with self._lock:
+            if claims['sid'] in self._revoked:
+                return None
+        return claims['uid']
+
+    def revoke(self, token):
+        """Ferme la session d'un jeton (déconnexion)"""
+        claims = self._decode(token)
+        if claims is None:
+            return
+        database.run_query("UPDATE sessions SET Date_revocation = %s WHERE ID_session = %s",
+                           (datetime.now().replace(microsecond=0), claims['sid']), fetch=False)
+        with self._lock:
+            self._revoked[claims['sid']] = claims['exp']
+
+    def revoke_user(self, user_id):
+        """Ferme toutes les sessions ouvertes d'un utilisateur ; retourne leur nombre"""
+        now = datetime.now().replace(microsecond=0)
+        rows = database.run_query("""
+            SELECT ID_session, Date_expiration FROM sessions
+            WHERE ID_utilisateur = %s AND Date_revocation IS NULL AND Date_expiration > %s
+        """, (user_id, now), cache=False)
+        if rows:
+            database.run_query("""
+                UPDATE sessions SET Date_revocation = %s
+                WHERE ID_utilisateur = %s AND Date_revocation IS NULL
+            """, (now, user_id), fetch=False)
+            with self._lock:
+                for row in rows:
+                    self._revoked[row['ID_session']] = row['Date_expiration'].timestamp()
+        return len(rows)
+
+    def purge_expired(self):
+        """Supprime les sessions expirées de la table"""
+        database.run_query("DELETE FROM sessions WHERE Date_expiration < %s", (datetime.now(),), fetch=False)
+
+    def _check_revocations(self):
+        """Relève les révocations faites par les autres processus (au plus une requête par intervalle)"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            since = self._revocations_checked_at
+        checked_at = datetime.now().replace(microsecond=0)
+
+        if since is None:
+            # Premier relevé du processus : ménage des sessions expirées, puis révocations encore valides
+            self.purge_expired()
+            rows = database.run_query("""
+                SELECT ID_session, Date_expiration FROM sessions
+                WHERE Date_revocation IS NOT NULL AND Date_expiration > %s
+            """, (checked_at,), cache=False)
+        else:
+            # Chevauchement d'un intervalle : une révocation datée juste avant le relevé précédent
+            rows = database.run_query("""
+                SELECT ID_session, Date_expiration FROM sessions WHERE Date_revocation >= %s
+            """, (since - timedelta(seconds=self.check_interval),), cache=False)
+
+        with self._lock:
+            for row in rows:
+                self._revoked[row['ID_session']] = row['Date_expiration'].timestamp()
+            expired = [session_id for session_id, expires in self._revoked.items() if expires < time.time()]
+            for session_id in expired:
+                del self._revoked[session_id]
+            self._revocations_checked_at = checked_at
+
+    # --------------------------------- Profils ---------------------------------
+
+    def get_profile(self, user_id):
+        """Nom, prénom, rôle et mail de l'utilisateur (en mémoire, relu au plus toutes les CHECK_INTERVAL s)"""
+        with self._lock:
+            cached = self._profiles.get(user_id)
+        if cached is not None and time.monotonic() - cached[0] < self.check_interval:
+            return cached[1]
+
+        rows = database.run_query(
+            "SELECT ID_utilisateur, nom, prenom, role, mail FROM utilisateurs WHERE ID_utilisateur = %s",
+            (user_id,), cache=False)
+        profile = rows[0] if rows else None
+        with self._lock:
+            self._profiles[user_id] = (time.monotonic(), profile)
+        return profile
+
+    def _on_write(self, tables):
+        # Fiche modifiée par ce processus : relue à la prochaine restauration de session
+        if tables is None or 'utilisateurs' in tables:
+            with self._lock:
+                self._profiles.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Sessions partagées par le processus"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore()
+    return _store